@@ -0,0 +1,86 @@
+"""
+Admission control for long-running commands, based on file locks.
+
+A limit of n concurrent commands sharing a key is a set of n slot files in a
+state directory, and a running command holds one of them locked. Locks are
+flock(2) locks: they are inherited by the program the process executes and
+released by the kernel as soon as it exits, however it exits, so slots never
+leak.
+
+A command finding all slots of one of its keys taken waits for a slot to free
+up, for a limited time, but only if it can take one of the slots of the wait
+queue. Otherwise it is turned away at once, so that a storm of commands does
+not pile up waiting processes.
+
+File names are hashes of the keys, which may contain IP addresses.
+"""
+
+import fcntl
+import hashlib
+import os
+import random
+import time
+
+_QUEUE_KEY = 'queue'
+
+
+def _try_lock(path):
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _take_slot(state_dir, key, slots):
+    name = hashlib.sha1(key.encode()).hexdigest()
+    # Start at a random slot, so that commands do not all contend for the
+    # first ones.
+    start = random.randrange(slots)
+    for i in range(slots):
+        slot = (start + i) % slots
+        fd = _try_lock(os.path.join(state_dir, '{}.{}'.format(name, slot)))
+        if fd is not None:
+            return fd
+    return None
+
+
+def _take_slots(state_dir, limits):
+    fds = []
+    for key, slots in limits:
+        fd = _take_slot(state_dir, key, slots) if slots > 0 else None
+        if fd is None:
+            release(fds)
+            return None
+        fds.append(fd)
+    return fds
+
+
+def acquire(state_dir, limits, queue_size, timeout, interval=0.1):
+    """
+    Take a slot for each of the (key, slots) pairs in limits. Return the file
+    descriptors holding them, which are released by closing them, or None if
+    the queue is full or no slots became free within timeout seconds.
+    """
+    fds = _take_slots(state_dir, limits)
+    if fds is not None or queue_size <= 0 or timeout <= 0:
+        return fds
+
+    queue_fd = _take_slot(state_dir, _QUEUE_KEY, queue_size)
+    if queue_fd is None:
+        return None
+    try:
+        deadline = time.monotonic() + timeout
+        while fds is None and time.monotonic() < deadline:
+            time.sleep(random.uniform(interval / 2, interval))
+            fds = _take_slots(state_dir, limits)
+        return fds
+    finally:
+        os.close(queue_fd)
+
+
+def release(fds):
+    for fd in fds:
+        os.close(fd)
@@ -0,0 +1,372 @@
+"""
+An asyncio counterpart to aurweb.db for long-running services.
+
+Statements use the same ? placeholders as aurweb.db. MySQL is accessed through
+aiomysql, which has to be installed separately. SQLite has no asynchronous
+driver; each SQLite connection is an aurweb.db.Connection owned by a thread of
+its own, so that a slow statement does not block the event loop.
+
+    pool = aurweb.asyncdb.ConnectionPool()
+    async with pool.connection() as conn:
+        cur = await conn.execute("SELECT ID FROM Users WHERE Username = ?",
+                                 [user])
+        row = cur.fetchone()
+
+Results are fetched completely before execute() returns.
+"""
+
+import abc
+import asyncio
+import concurrent.futures
+import functools
+import random
+import time
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+import aurweb.config
+import aurweb.db
+import aurweb.querylog
+
+
+@functools.lru_cache(maxsize=256)
+def _format(query):
+    return query.replace('%', '%%').replace('?', '%s')
+
+
+class Result:
+    """The rows and counters of an executed statement."""
+
+    def __init__(self, rows, rowcount, lastrowid):
+        self._rows = rows or []
+        self._pos = 0
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        self._pos += 1
+        return self._rows[self._pos - 1]
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class Connection(abc.ABC):
+    """
+    An asynchronous database connection; use connect() to open one.
+
+    Like aurweb.db.Connection, a connection is not meant to be used by several
+    tasks at once. Use a ConnectionPool to share connections between tasks.
+    """
+
+    _depth = 0
+
+    @abc.abstractmethod
+    async def execute(self, query, params=()):
+        pass
+
+    @abc.abstractmethod
+    async def executemany(self, query, params_seq):
+        pass
+
+    @abc.abstractmethod
+    async def commit(self):
+        pass
+
+    @abc.abstractmethod
+    async def rollback(self):
+        pass
+
+    @abc.abstractmethod
+    async def ping(self):
+        pass
+
+    @abc.abstractmethod
+    async def close(self):
+        pass
+
+    @abc.abstractmethod
+    def is_retryable(self, exc):
+        pass
+
+
+class _SQLiteConnection(Connection):
+    def __init__(self, section, readonly):
+        self._section = section
+        self._readonly = readonly
+        # sqlite3 connections may only be used by the thread creating them.
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._conn = None
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _open(self):
+        self._conn = await self._call(aurweb.db.Connection, self._section,
+                                      self._readonly)
+
+    def _execute(self, method, query, params):
+        cur = getattr(self._conn, method)(query, params)
+        if cur is None:
+            return Result(None, 0, None)
+        rows = cur.fetchall() if cur.description else None
+        return Result(rows, cur.rowcount, cur.lastrowid)
+
+    async def execute(self, query, params=()):
+        return await self._call(self._execute, 'execute', query, params)
+
+    async def executemany(self, query, params_seq):
+        return await self._call(self._execute, 'executemany', query,
+                                list(params_seq))
+
+    async def commit(self):
+        await self._call(self._conn.commit)
+
+    async def rollback(self):
+        await self._call(self._conn.rollback)
+
+    async def ping(self):
+        await self._call(self._conn.ping)
+
+    async def close(self):
+        await self._call(self._conn.close)
+        self._executor.shutdown()
+
+    def is_retryable(self, exc):
+        return self._conn.is_retryable(exc)
+
+
+class _MySQLConnection(Connection):
+    def __init__(self, section, readonly):
+        self._section = section
+        self._readonly = readonly
+        self._conn = None
+
+    def _option(self, option):
+        value = aurweb.config.get_with_fallback(self._section, option, None)
+        if value is None:
+            value = aurweb.config.get('database', option)
+        return value
+
+    async def _open(self):
+        if aiomysql is None:
+            raise RuntimeError('the MySQL backend requires aiomysql')
+        self._conn = await aiomysql.connect(
+            host=self._option('host'),
+            user=self._option('user'),
+            password=self._option('password'),
+            db=self._option('name'),
+            unix_socket=self._option('socket'),
+            autocommit=False)
+        if self._readonly:
+            async with self._conn.cursor() as cur:
+                await cur.execute('SET SESSION TRANSACTION READ ONLY')
+
+    async def _execute(self, method, query, params):
+        start = time.perf_counter()
+        async with self._conn.cursor() as cur:
+            await getattr(cur, method)(_format(query), params)
+            rows = await cur.fetchall() if cur.description else None
+            result = Result(rows, cur.rowcount, cur.lastrowid)
+        if aurweb.querylog.enabled():
+            aurweb.querylog.record(query, time.perf_counter() - start,
+                                   result.rowcount)
+        return result
+
+    async def execute(self, query, params=()):
+        return await self._execute('execute', query, params)
+
+    async def executemany(self, query, params_seq):
+        return await self._execute('executemany', query, list(params_seq))
+
+    async def commit(self):
+        await self._conn.commit()
+
+    async def rollback(self):
+        await self._conn.rollback()
+
+    async def ping(self):
+        await self._conn.ping(reconnect=True)
+
+    async def close(self):
+        self._conn.close()
+
+    def is_retryable(self, exc):
+        return (isinstance(exc, aiomysql.OperationalError) and
+                exc.args[0] in aurweb.db._MYSQL_RETRY_ERRNOS)
+
+
+async def connect(section='database', readonly=False):
+    """Open a connection to the database configured in the given section."""
+    backend = aurweb.config.get('database', 'backend')
+    if backend == 'mysql':
+        conn = _MySQLConnection(section, readonly)
+    elif backend == 'sqlite':
+        conn = _SQLiteConnection(section, readonly)
+    else:
+        raise ValueError('unsupported database backend')
+    await conn._open()
+    return conn
+
+
+class Transaction:
+    """One attempt at running a unit of work; see transaction()."""
+
+    def __init__(self, conn, retries, backoff):
+        self._conn = conn
+        self._retries = retries
+        self._backoff = backoff
+        self._nested = False
+        self.attempt = 0
+        self.done = False
+
+    async def __aenter__(self):
+        self.attempt += 1
+        self._nested = self._conn._depth > 0
+        self._conn._depth += 1
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        conn = self._conn
+        conn._depth -= 1
+
+        if self._nested:
+            self.done = True
+            return False
+
+        if exc is None:
+            try:
+                await conn.commit()
+                self.done = True
+                return False
+            except Exception as e:
+                await conn.rollback()
+                if not await self._retry(e):
+                    raise
+                return True
+
+        await conn.rollback()
+        return await self._retry(exc)
+
+    async def _retry(self, exc):
+        if self.attempt > self._retries or not self._conn.is_retryable(exc):
+            self.done = True
+            return False
+
+        aurweb.querylog.record_retry(exc)
+        delay = self._backoff * 2 ** (self.attempt - 1)
+        await asyncio.sleep(random.uniform(delay / 2, delay))
+        return True
+
+
+async def transaction(conn, retries=None, backoff=None):
+    """
+    The asynchronous counterpart to aurweb.db.transaction():
+
+        async for attempt in aurweb.asyncdb.transaction(conn):
+            async with attempt as conn:
+                await conn.execute(...)
+    """
+    if retries is None:
+        retries = aurweb.config.getint_with_fallback('database',
+                                                     'transaction-retries', 3)
+    if backoff is None:
+        backoff = float(aurweb.config.get_with_fallback(
+            'database', 'transaction-backoff', '0.05'))
+
+    attempt = Transaction(conn, retries, backoff)
+    while not attempt.done:
+        count = attempt.attempt
+        yield attempt
+        if attempt.attempt == count:
+            # The loop body did not enter the transaction.
+            break
+
+
+class ConnectionPool:
+    """
+    A bounded pool of asynchronous database connections.
+
+    Unlike aurweb.db.ConnectionPool, checkouts are not reentrant: a task
+    holding a connection should pass it on rather than check out another one.
+    """
+
+    def __init__(self, size=None, timeout=None, section='database',
+                 readonly=False):
+        if size is None:
+            size = aurweb.config.getint_with_fallback('database',
+                                                      'pool-size', 4)
+        if timeout is None:
+            timeout = aurweb.config.getint_with_fallback('database',
+                                                         'pool-timeout', 30)
+        self._size = size
+        self._timeout = timeout
+        self._section = section
+        self._readonly = readonly
+        # Created on first use, so that it belongs to the loop running the
+        # pool rather than to whichever loop is current when it is created.
+        self._slots = None
+        self._idle = []
+
+    async def acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.BoundedSemaphore(self._size)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self._timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError('no database connection available')
+
+        conn = self._idle.pop() if self._idle else None
+        try:
+            if conn:
+                await conn.ping()
+            else:
+                conn = await connect(self._section, self._readonly)
+        except Exception:
+            self._slots.release()
+            raise
+        return conn
+
+    async def release(self, conn):
+        try:
+            # Never hand out a connection with pending changes.
+            await conn.rollback()
+        except Exception:
+            conn = None
+        if conn:
+            self._idle.append(conn)
+        self._slots.release()
+
+    def connection(self):
+        """Check out a connection for the duration of an async with block."""
+        return _Checkout(self)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+
+
+class _Checkout:
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = None
+
+    async def __aenter__(self):
+        self._conn = await self._pool.acquire()
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._pool.release(self._conn)
+        return False
@@ -0,0 +1,143 @@
+"""
+Matching of IP addresses against the Bans table.
+
+A row bans the network IPAddress/PrefixLength, or the single address IPAddress
+if PrefixLength is NULL. Single addresses are matched by a lookup of the
+primary key, whose result is cached per address. Networks are loaded into a
+BanList, which keeps one set of network prefixes per prefix length and address
+family, so that checking an address takes one set lookup per prefix length in
+use, regardless of the number of bans.
+
+The results and the network rows are kept in aurweb.cache for
+cache_lookup_ttl seconds. Bans are added through the web interface, which
+does not invalidate the cache, so a new ban may take that long to apply to the
+SSH interface.
+"""
+
+import ipaddress
+
+import aurweb.cache
+import aurweb.db
+
+_CACHE_KEY = 'ban-ranges'
+_ADDRESS_CACHE_KEY = 'ban-address:'
+
+_banlist = None
+
+
+def _parse_address(addr):
+    ip = ipaddress.ip_address(addr)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip
+
+
+class BanList:
+    def __init__(self, rows):
+        """Build the ban list from (IPAddress, PrefixLength) rows."""
+        prefixes = {4: {}, 6: {}}
+        for addr, prefixlen in rows:
+            try:
+                ip = _parse_address(addr)
+            except ValueError:
+                continue
+            if prefixlen is None or prefixlen > ip.max_prefixlen:
+                prefixlen = ip.max_prefixlen
+            shift = ip.max_prefixlen - prefixlen
+            prefixes[ip.version].setdefault(prefixlen, set()).add(
+                int(ip) >> shift)
+
+        # Shorter prefixes first: they are the likeliest to match.
+        self._prefixes = {}
+        for version, by_length in prefixes.items():
+            self._prefixes[version] = sorted(by_length.items())
+
+    def match(self, addr):
+        """Check whether an address falls into one of the banned networks."""
+        try:
+            ip = _parse_address(addr)
+        except ValueError:
+            return False
+        value = int(ip)
+        for prefixlen, networks in self._prefixes[ip.version]:
+            if value >> (ip.max_prefixlen - prefixlen) in networks:
+                return True
+        return False
+
+
+def _addresses(addr):
+    """Return the spellings under which a single address may be banned."""
+    addrs = [addr]
+    try:
+        ip = str(_parse_address(addr))
+    except ValueError:
+        return addrs
+    if ip != addr:
+        addrs.append(ip)
+    return addrs
+
+
+def _query_bans(addrs, exact, ranges):
+    """
+    Look up the bans of the given addresses through the primary key if exact
+    is set, and the network bans if ranges is set, with one query. Return
+    whether one of the addresses is banned, and the (IPAddress, PrefixLength)
+    rows of the network bans.
+    """
+    queries = []
+    params = []
+    if exact:
+        queries.append("SELECT 1, IPAddress, PrefixLength FROM Bans " +
+                       "WHERE IPAddress IN (" +
+                       ", ".join(["?"] * len(addrs)) + ")")
+        params += addrs
+    if ranges:
+        # SQLite does not use the BansPrefixLength index for IS NOT NULL.
+        queries.append("SELECT 0, IPAddress, PrefixLength FROM Bans " +
+                       "WHERE PrefixLength >= 0")
+    conn = aurweb.db.get_connection(readonly=True, tables=('Bans',))
+    cur = conn.execute(" UNION ALL ".join(queries), params)
+
+    banned = False
+    rows = []
+    for is_exact, addr, prefixlen in cur.fetchall():
+        if is_exact:
+            banned = True
+        else:
+            rows.append([addr, prefixlen])
+    return banned, rows
+
+
+def _get_banlist(rows):
+    global _banlist
+
+    # Resident processes only rebuild the list when the cached rows change.
+    if _banlist is None or _banlist[0] is not rows:
+        _banlist = (rows, BanList(rows))
+    return _banlist[1]
+
+
+def is_banned(addr):
+    """
+    Check whether an address is banned. Both the result for the address and
+    the network bans are cached, so a warm check makes no query. Otherwise,
+    whatever is missing is looked up with a single query.
+    """
+    if not addr:
+        return False
+
+    addrs = _addresses(addr)
+    address_key = _ADDRESS_CACHE_KEY + addrs[-1]
+    # Cached as 0 or 1, since None is never cached.
+    banned = aurweb.cache.get(address_key)
+    rows = aurweb.cache.get(_CACHE_KEY)
+    if banned is None or rows is None:
+        new_banned, new_rows = _query_bans(addrs, banned is None,
+                                           rows is None)
+        if banned is None:
+            banned = int(new_banned)
+            aurweb.cache.set(address_key, banned)
+        if rows is None:
+            rows = new_rows
+            aurweb.cache.set(_CACHE_KEY, rows)
+    return bool(banned) or _get_banlist(rows).match(addr)
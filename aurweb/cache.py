@@ -0,0 +1,228 @@
+"""
+A lookup cache for the Python entry points.
+
+Values are kept in a process-local LRU cache. If the cache option is set to
+memcache, they are shared between processes through the servers listed in
+memcache_servers as well. Values must be serializable as JSON; None is never
+cached, so that a missing row is looked up again on the next call.
+
+Code writing to the database is responsible for deleting the entries it makes
+stale, preferably once its transaction is committed:
+
+    conn.on_commit(lambda: aurweb.cache.delete(key))
+
+Entries expire after cache_lookup_ttl seconds in any case, which bounds the
+staleness caused by writers that do not know about this cache.
+
+git-update caches the package blacklist and the official providers, which
+aurblup invalidates, and aurweb.bans caches the banned networks. git-serve
+does not use this cache: it looks up the user and the package bases once per
+command, together with the columns its access checks need, and these must
+not be stale.
+"""
+
+import collections
+import hashlib
+import json
+import socket
+import time
+import zlib
+
+import aurweb.config
+
+_PREFIX = 'aurweb:'
+
+_local = collections.OrderedDict()
+_servers = None
+
+
+class _MemcacheServer:
+    """A client for the memcached text protocol talking to one server."""
+
+    def __init__(self, host, port, timeout=0.5):
+        self._address = (host, port)
+        self._timeout = timeout
+        self._sock = None
+        self._buf = b''
+        self.dead_until = 0
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.create_connection(self._address,
+                                                  self._timeout)
+            self._buf = b''
+        return self._sock
+
+    def _readline(self):
+        while b'\r\n' not in self._buf:
+            data = self._sock.recv(4096)
+            if not data:
+                raise ConnectionError('connection closed by memcached')
+            self._buf += data
+        line, self._buf = self._buf.split(b'\r\n', 1)
+        return line
+
+    def _read(self, size):
+        while len(self._buf) < size + 2:
+            data = self._sock.recv(4096)
+            if not data:
+                raise ConnectionError('connection closed by memcached')
+            self._buf += data
+        data, self._buf = self._buf[:size], self._buf[size + 2:]
+        return data
+
+    def _call(self, func, *args):
+        """
+        Run a request, giving up on the server for a while if it fails. The
+        cache is an optimization and must never make a request fail.
+        """
+        if self.dead_until > time.monotonic():
+            return None
+        try:
+            self._connect()
+            return func(*args)
+        except (OSError, ValueError):
+            self.close()
+            self.dead_until = time.monotonic() + 30
+            return None
+
+    def _get(self, key):
+        self._sock.sendall(b'get ' + key + b'\r\n')
+        value = None
+        while True:
+            line = self._readline()
+            if line == b'END':
+                return value
+            fields = line.split()
+            if fields[0] != b'VALUE' or len(fields) < 4:
+                raise ValueError('unexpected memcached reply')
+            value = self._read(int(fields[3]))
+
+    def _set(self, key, value, ttl):
+        self._sock.sendall(b'set %s 0 %d %d\r\n%s\r\n' %
+                           (key, ttl, len(value), value))
+        return self._readline() == b'STORED'
+
+    def _delete(self, key):
+        self._sock.sendall(b'delete ' + key + b'\r\n')
+        return self._readline() == b'DELETED'
+
+    def get(self, key):
+        return self._call(self._get, key)
+
+    def set(self, key, value, ttl):
+        return self._call(self._set, key, value, ttl)
+
+    def delete(self, key):
+        return self._call(self._delete, key)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def _memcache_servers():
+    global _servers
+
+    if _servers is None:
+        _servers = []
+        backend = aurweb.config.get_with_fallback('options', 'cache', 'none')
+        if backend == 'memcache':
+            spec = aurweb.config.get('options', 'memcache_servers')
+            for elem in spec.split(','):
+                host, _, port = elem.strip().rpartition(':')
+                _servers.append(_MemcacheServer(host, int(port)))
+    return _servers
+
+
+def _server_key(key):
+    """
+    Return the memcached key for a cache key and the server it lives on.
+    """
+    key = (_PREFIX + key).encode()
+    if len(key) > 250 or any(c <= 32 or c == 127 for c in key):
+        key = (_PREFIX + hashlib.sha1(key).hexdigest()).encode()
+    servers = _memcache_servers()
+    if not servers:
+        return key, None
+    return key, servers[zlib.crc32(key) % len(servers)]
+
+
+def _ttl(ttl):
+    if ttl is None:
+        ttl = aurweb.config.getint_with_fallback('options',
+                                                 'cache_lookup_ttl', 300)
+    return ttl
+
+
+def _local_set(key, value, ttl):
+    _local[key] = (time.monotonic() + ttl, value)
+    _local.move_to_end(key)
+    size = aurweb.config.getint_with_fallback('options', 'cache_local_size',
+                                              1024)
+    while len(_local) > size:
+        _local.popitem(last=False)
+
+
+def get(key):
+    """Return the cached value for key, or None if there is none."""
+    entry = _local.get(key)
+    if entry is not None:
+        if entry[0] > time.monotonic():
+            _local.move_to_end(key)
+            return entry[1]
+        del _local[key]
+
+    server_key, server = _server_key(key)
+    if server is None:
+        return None
+    data = server.get(server_key)
+    if data is None:
+        return None
+    try:
+        value = json.loads(data.decode())
+    except ValueError:
+        return None
+    _local_set(key, value, _ttl(None))
+    return value
+
+
+def set(key, value, ttl=None):
+    if value is None:
+        return
+    ttl = _ttl(ttl)
+    _local_set(key, value, ttl)
+    server_key, server = _server_key(key)
+    if server is not None:
+        server.set(server_key, json.dumps(value).encode(), ttl)
+
+
+def delete(*keys):
+    for key in keys:
+        _local.pop(key, None)
+        server_key, server = _server_key(key)
+        if server is not None:
+            server.delete(server_key)
+
+
+def lookup(key, func, ttl=None):
+    """
+    Return the cached value for key. On a miss, call func() and cache its
+    result unless it is None.
+    """
+    value = get(key)
+    if value is None:
+        value = func()
+        set(key, value, ttl)
+    return value
+
+
+def clear():
+    """Forget the process-local entries and the memcached connections."""
+    global _servers
+
+    _local.clear()
+    for server in _servers or []:
+        server.close()
+    _servers = None
@@ -30,3 +30,19 @@ def getboolean(section, option):
 
 def getint(section, option):
     return _get_parser().getint(section, option)
+
+
+def get_with_fallback(section, option, fallback):
+    return _get_parser().get(section, option, fallback=fallback)
+
+
+def getboolean_with_fallback(section, option, fallback):
+    return _get_parser().getboolean(section, option, fallback=fallback)
+
+
+def getint_with_fallback(section, option, fallback):
+    return _get_parser().getint(section, option, fallback=fallback)
+
+
+def has_section(section):
+    return _get_parser().has_section(section)
@@ -1,14 +1,15 @@
-try:
-    import mysql.connector
-except ImportError:
-    pass
-
-try:
-    import sqlite3
-except ImportError:
-    pass
+import atexit
+import collections
+import contextlib
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
 
 import aurweb.config
+import aurweb.querylog
 
 
 def get_sqlalchemy_url():
@@ -38,19 +39,84 @@ def get_sqlalchemy_url():
         raise ValueError('unsupported database backend')
 
 
+# MySQL client errors signalling that the server connection was lost:
+# CR_SERVER_GONE_ERROR, CR_SERVER_LOST and CR_SERVER_LOST_EXTENDED.
+_MYSQL_DISCONNECT_ERRNOS = (2006, 2013, 2055)
+
+_SQLITE_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL',
+                         'OFF')
+_SQLITE_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def _sqlite_power(base, exponent):
+    if base is None or exponent is None:
+        return None
+    return float(base) ** float(exponent)
+
+
+# Statements which modify a table, with the table name as the only group.
+_re_write = re.compile(r'\s*(?:(?:INSERT|REPLACE)(?:\s+IGNORE|\s+OR\s+\w+)?'
+                       r'\s+INTO|UPDATE|DELETE\s+FROM)\s+`?(\w+)', re.I)
+
+# MySQL server errors after which a transaction can simply be retried:
+# ER_LOCK_WAIT_TIMEOUT and ER_LOCK_DEADLOCK.
+_MYSQL_RETRY_ERRNOS = (1205, 1213)
+
+# Upper bounds used to split bulk statements: MySQL's placeholder limit, and
+# SQLite's compile-time defaults for statement length and host parameters.
+_MYSQL_MAX_VARIABLES = 65535
+# The default max_allowed_packet of MySQL 5.6 and 5.7. Statements smaller than
+# that are sent without looking up the actual limit.
+_MYSQL_DEFAULT_MAX_PACKET = 4 << 20
+_SQLITE_MAX_STATEMENT_SIZE = 1000000
+_SQLITE_MAX_VARIABLES = 999
+
+
 class Connection:
     _conn = None
     _paramstyle = None
+    _backend = None
+    _dirty = False
+    _max_packet = None
+    _depth = 0
 
-    def __init__(self):
-        aur_db_backend = aurweb.config.get('database', 'backend')
+    def __init__(self, section='database', readonly=False):
+        self._section = section
+        self._readonly = readonly
+        self._backend = self._option('backend')
+        self._statements = collections.OrderedDict()
+        self._statement_cache_size = aurweb.config.getint_with_fallback(
+            'database', 'statement-cache-size', 128)
+        self._use_prepared = (self._backend == 'mysql' and
+                              aurweb.config.getboolean_with_fallback(
+                                  'database', 'prepared-statements', True))
+        self._prepared = {}
+        self._cache_stats = {'hits': 0, 'misses': 0, 'prepares': 0,
+                             'prepared_executions': 0}
+        self._on_commit = []
+        self._written = set()
+        self._connect()
 
-        if aur_db_backend == 'mysql':
-            aur_db_host = aurweb.config.get('database', 'host')
-            aur_db_name = aurweb.config.get('database', 'name')
-            aur_db_user = aurweb.config.get('database', 'user')
-            aur_db_pass = aurweb.config.get('database', 'password')
-            aur_db_socket = aurweb.config.get('database', 'socket')
+    def _option(self, option):
+        """
+        Read a connection option. Sections other than [database] only need to
+        list the options that differ from the primary database.
+        """
+        value = aurweb.config.get_with_fallback(self._section, option, None)
+        if value is None:
+            value = aurweb.config.get('database', option)
+        return value
+
+    def _connect(self):
+        # The drivers are imported here rather than at the top of the module:
+        # mysql.connector alone doubles the startup time of the scripts.
+        if self._backend == 'mysql':
+            import mysql.connector
+            aur_db_host = self._option('host')
+            aur_db_name = self._option('name')
+            aur_db_user = self._option('user')
+            aur_db_pass = self._option('password')
+            aur_db_socket = self._option('socket')
             self._conn = mysql.connector.connect(host=aur_db_host,
                                                  user=aur_db_user,
                                                  passwd=aur_db_pass,
@@ -58,28 +124,650 @@ class Connection:
                                                  unix_socket=aur_db_socket,
                                                  buffered=True)
             self._paramstyle = mysql.connector.paramstyle
-        elif aur_db_backend == 'sqlite':
-            aur_db_name = aurweb.config.get('database', 'name')
-            self._conn = sqlite3.connect(aur_db_name)
+            if self._readonly:
+                self._conn.cursor().execute(
+                    'SET SESSION TRANSACTION READ ONLY')
+        elif self._backend == 'sqlite':
+            import sqlite3
+            aur_db_name = self._option('name')
+            busy_timeout = aurweb.config.getint_with_fallback(
+                'database', 'sqlite-busy-timeout', 5000)
+            if self._readonly:
+                uri = 'file:{}?mode=ro'.format(
+                    urllib.parse.quote(os.path.abspath(aur_db_name)))
+                self._conn = sqlite3.connect(uri, uri=True,
+                                             timeout=busy_timeout / 1000)
+            else:
+                self._conn = sqlite3.connect(aur_db_name,
+                                             timeout=busy_timeout / 1000)
             self._paramstyle = sqlite3.paramstyle
+            self._setup_sqlite()
         else:
             raise ValueError('unsupported database backend')
+        self._dirty = False
+        # Prepared statements do not survive the connection.
+        self._prepared = {}
 
-    def execute(self, query, params=()):
+    def _setup_sqlite(self):
+        """
+        Apply the SQLite tuning options and register the SQL functions which
+        MySQL provides natively.
+        """
+        journal_mode = aurweb.config.get_with_fallback(
+            'database', 'sqlite-journal-mode', 'WAL').upper()
+        if journal_mode not in _SQLITE_JOURNAL_MODES:
+            raise ValueError('invalid sqlite-journal-mode: ' + journal_mode)
+        synchronous = aurweb.config.get_with_fallback(
+            'database', 'sqlite-synchronous', 'NORMAL').upper()
+        if synchronous not in _SQLITE_SYNCHRONOUS:
+            raise ValueError('invalid sqlite-synchronous: ' + synchronous)
+        mmap_size = aurweb.config.getint_with_fallback(
+            'database', 'sqlite-mmap-size', 268435456)
+        cache_size = aurweb.config.getint_with_fallback(
+            'database', 'sqlite-cache-size', -16384)
+
+        cur = self._conn.cursor()
+        # The journal mode is stored in the database file, so read-only
+        # connections simply use whatever the writers have set.
+        if not self._readonly:
+            cur.execute('PRAGMA journal_mode = ' + journal_mode)
+        cur.execute('PRAGMA synchronous = ' + synchronous)
+        cur.execute('PRAGMA mmap_size = {:d}'.format(mmap_size))
+        cur.execute('PRAGMA cache_size = {:d}'.format(cache_size))
+        cur.execute('PRAGMA foreign_keys = ON')
+
+        self._conn.create_function('POWER', 2, _sqlite_power)
+
+    def replication_lag(self):
+        """
+        Return the number of seconds this connection's server lags behind its
+        replication source, or None if it is not replicating or the lag is
+        unknown.
+        """
+        if self._backend != 'mysql':
+            return None
+        cur = self._conn.cursor(dictionary=True)
+        cur.execute('SHOW SLAVE STATUS')
+        row = cur.fetchone()
+        return row['Seconds_Behind_Master'] if row else None
+
+    def _is_disconnect(self, exc):
+        if self._backend != 'mysql':
+            return False
+        return getattr(exc, 'errno', None) in _MYSQL_DISCONNECT_ERRNOS
+
+    def is_retryable(self, exc):
+        """
+        Check whether an error was caused by lock contention, i.e. whether the
+        transaction it aborted may succeed when it is run again.
+        """
+        if self._backend == 'mysql':
+            return getattr(exc, 'errno', None) in _MYSQL_RETRY_ERRNOS
+        import sqlite3
+        return (isinstance(exc, sqlite3.OperationalError) and
+                'locked' in str(exc))
+
+    def reconnect(self):
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._connect()
+
+    def ping(self):
+        """
+        Check that the connection is still usable and reconnect if it is not.
+
+        Returns False if a new connection had to be established.
+        """
+        try:
+            self._conn.cursor().execute('SELECT 1')
+            return True
+        except Exception as e:
+            if self._backend == 'mysql' and not self._is_disconnect(e):
+                raise
+            self.reconnect()
+            return False
+
+    def _translate(self, query):
+        """
+        Return the cache entry of a statement, which holds the statement
+        translated to the driver's parameter style and its execution count.
+        """
+        entry = self._statements.get(query)
+        if entry is not None:
+            self._statements.move_to_end(query)
+            self._cache_stats['hits'] += 1
+            return entry
+
+        self._cache_stats['misses'] += 1
         if self._paramstyle in ('format', 'pyformat'):
-            query = query.replace('%', '%%').replace('?', '%s')
+            translated = query.replace('%', '%%').replace('?', '%s')
         elif self._paramstyle == 'qmark':
-            pass
+            translated = query
         else:
             raise ValueError('unsupported paramstyle')
 
-        cur = self._conn.cursor()
-        cur.execute(query, params)
+        entry = [translated, 0]
+        self._statements[query] = entry
+        if len(self._statements) > self._statement_cache_size:
+            evicted, _ = self._statements.popitem(last=False)
+            cur = self._prepared.pop(evicted, None)
+            if cur:
+                cur.close()
+        return entry
+
+    def _cursor(self, method, query):
+        """
+        Return a cursor and the statement text to execute on it.
+
+        Write statements that are executed repeatedly are run through a
+        server-side prepared statement on MySQL, so that the server parses
+        them only once per connection. Result sets of SELECT statements are
+        handed out to callers, so they always get a cursor of their own.
+        """
+        entry = self._translate(query)
+        entry[1] += 1
+
+        if (not self._use_prepared or method != 'execute' or entry[1] < 2 or
+                query.lstrip()[:6].upper() == 'SELECT'):
+            return self._conn.cursor(), entry[0]
+
+        cur = self._prepared.get(query)
+        if cur is None:
+            # The connection is buffered, which mysql.connector does not
+            # support for prepared cursors. Writes have no result set to
+            # buffer anyway.
+            cur = self._conn.cursor(prepared=True, buffered=False)
+            self._prepared[query] = cur
+            self._cache_stats['prepares'] += 1
+        self._cache_stats['prepared_executions'] += 1
+        # Prepared cursors use question mark placeholders natively.
+        return cur, query
+
+    def cache_info(self):
+        """
+        Return statement cache counters: translation cache hits and misses,
+        the number of statements prepared on the server and the number of
+        executions that reused a prepared statement.
+        """
+        info = dict(self._cache_stats)
+        info['size'] = len(self._statements)
+        info['maxsize'] = self._statement_cache_size
+        return info
+
+    def _run(self, method, query, params):
+        try:
+            cur, statement = self._cursor(method, query)
+            getattr(cur, method)(statement, params)
+        except Exception as e:
+            # A lost connection can only be recovered transparently if no
+            # uncommitted changes were lost along with it.
+            if self._dirty or not self._is_disconnect(e):
+                raise
+            self.reconnect()
+            cur, statement = self._cursor(method, query)
+            getattr(cur, method)(statement, params)
+
+        if not query.lstrip()[:6].upper() == 'SELECT':
+            self._dirty = True
+            match = _re_write.match(query)
+            if match:
+                self._written.add(match.group(1))
 
         return cur
 
-    def commit(self):
+    def _instrumented(self, method, query, params):
+        if not aurweb.querylog.enabled():
+            return self._run(method, query, params)
+
+        start = time.perf_counter()
+        cur = self._run(method, query, params)
+        aurweb.querylog.record(query, time.perf_counter() - start,
+                               cur.rowcount)
+        return cur
+
+    def execute(self, query, params=()):
+        return self._instrumented('execute', query, params)
+
+    def execute_locking(self, query, params=()):
+        """
+        Run a SELECT statement as a locking read. Unlike a plain read within a
+        MySQL transaction, it sees rows committed since the transaction
+        started. SQLite serializes writers, so reads need no locking there.
+        """
+        if self._backend == 'mysql':
+            query += ' LOCK IN SHARE MODE'
+        return self.execute(query, params)
+
+    def execute_ignore(self, query, params=()):
+        """
+        Run an INSERT statement which skips rows conflicting with a unique key
+        instead of failing.
+        """
+        if self._backend == 'mysql':
+            verb = 'INSERT IGNORE'
+        else:
+            verb = 'INSERT OR IGNORE'
+        return self.execute(re.sub(r'^INSERT\b', verb, query), params)
+
+    def executemany(self, query, params_seq):
+        """
+        Execute a statement once for every parameter tuple in params_seq.
+
+        The statement is translated to the driver's parameter style only once.
+        Drivers may rewrite batches of INSERT statements into multi-row
+        statements; use insert_many() to get that on all backends.
+        """
+        params_seq = list(params_seq)
+        if not params_seq:
+            return None
+        return self._instrumented('executemany', query, params_seq)
+
+    def stream(self, query, params=(), batch_size=1000):
+        """
+        Iterate over the rows returned by a query, holding at most batch_size
+        of them in memory at a time.
+
+        On MySQL, rows are read from an unbuffered cursor as the server sends
+        them, so no other statement may be executed on this connection until
+        the iteration is finished or the generator is closed. Statements
+        issued while streaming need a separate connection.
+        """
+        translated = self._translate(query)[0]
+        if self._backend == 'mysql':
+            cur = self._conn.cursor(buffered=False)
+        else:
+            cur = self._conn.cursor()
+
+        start = time.perf_counter()
+        rows = 0
+        exhausted = False
+        try:
+            cur.execute(translated, params)
+            while True:
+                batch = cur.fetchmany(batch_size)
+                if not batch:
+                    exhausted = True
+                    break
+                rows += len(batch)
+                yield from batch
+        finally:
+            if self._backend == 'mysql' and not exhausted:
+                self._conn.consume_results()
+            cur.close()
+            if aurweb.querylog.enabled():
+                aurweb.querylog.record(query, time.perf_counter() - start,
+                                       rows)
+
+    def _max_statement_size(self):
+        if self._backend != 'mysql':
+            return _SQLITE_MAX_STATEMENT_SIZE
+
+        if self._max_packet is None:
+            cur = self._run('execute', 'SELECT @@max_allowed_packet', ())
+            self._max_packet = int(cur.fetchone()[0])
+        return self._max_packet
+
+    def _max_variables(self):
+        if self._backend != 'mysql':
+            return _SQLITE_MAX_VARIABLES
+        return _MYSQL_MAX_VARIABLES
+
+    def _chunks(self, rows, overhead):
+        """
+        Split rows into batches which fit into a single statement, taking both
+        the statement size limit and the placeholder limit into account.
+        """
+        # Strings may have to be escaped, which can double their length.
+        sizes = [sum(2 * len(v) + 4 if isinstance(v, (str, bytes)) else 24
+                     for v in row) + 4 for row in rows]
+
+        size_limit = _MYSQL_DEFAULT_MAX_PACKET * 3 // 4 - overhead
+        if (self._backend != 'mysql' or self._max_packet is not None or
+                sum(sizes) > size_limit):
+            size_limit = self._max_statement_size() * 3 // 4 - overhead
+        row_limit = max(1, self._max_variables() // len(rows[0]))
+
+        chunk = []
+        size = 0
+        for row, row_size in zip(rows, sizes):
+            if chunk and (size + row_size > size_limit or
+                          len(chunk) >= row_limit):
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(row)
+            size += row_size
+        if chunk:
+            yield chunk
+
+    def insert_many(self, table, columns, rows, ignore=False):
+        """
+        Insert rows into a table using as few multi-row INSERT statements as
+        the server allows, and return the number of rows inserted.
+
+        If ignore is set, rows conflicting with a unique key are skipped.
+        """
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return 0
+
+        execute = self.execute_ignore if ignore else self.execute
+        prefix = 'INSERT INTO {} ({}) VALUES '.format(table,
+                                                      ', '.join(columns))
+        values = '(' + ', '.join(['?'] * len(columns)) + ')'
+
+        # Leave room for the IGNORE keyword.
+        overhead = len(prefix) + 10
+        count = 0
+        for chunk in self._chunks(rows, overhead):
+            query = prefix + ', '.join([values] * len(chunk))
+            params = [value for row in chunk for value in row]
+            count += execute(query, params).rowcount
+        return count
+
+    def on_commit(self, callback):
+        """
+        Call callback once the pending changes have been committed. Callbacks
+        are discarded if the changes are rolled back instead.
+        """
+        self._on_commit.append(callback)
+
+    def _commit(self):
         self._conn.commit()
+        self._dirty = False
+        _committed_tables.update(self._written)
+        self._written = set()
+
+    def _run_on_commit(self):
+        callbacks, self._on_commit = self._on_commit, []
+        for callback in callbacks:
+            callback()
+
+    def commit(self):
+        self._commit()
+        self._run_on_commit()
+
+    def rollback(self):
+        self._on_commit = []
+        self._conn.rollback()
+        self._dirty = False
+        self._written = set()
 
     def close(self):
         self._conn.close()
+
+
+class Transaction:
+    """
+    One attempt at running a unit of work; see transaction().
+
+    Transactions nest: a unit of work started while another one is in
+    progress on the same connection becomes part of the outer one, which
+    commits or retries everything as a whole.
+    """
+
+    def __init__(self, conn, retries, backoff):
+        self._conn = conn
+        self._retries = retries
+        self._backoff = backoff
+        self._nested = False
+        self.attempt = 0
+        self.done = False
+
+    def __enter__(self):
+        self.attempt += 1
+        self._nested = self._conn._depth > 0
+        self._conn._depth += 1
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self._conn
+        conn._depth -= 1
+
+        if self._nested:
+            self.done = True
+            return False
+
+        if exc is None:
+            try:
+                conn._commit()
+            except Exception as e:
+                conn.rollback()
+                if not self._retry(e):
+                    raise
+                return True
+            # Errors of the callbacks are not commit failures: the changes
+            # are committed and the body must not run again.
+            self.done = True
+            conn._run_on_commit()
+            return False
+
+        conn.rollback()
+        return self._retry(exc)
+
+    def _retry(self, exc):
+        if self.attempt > self._retries or not self._conn.is_retryable(exc):
+            self.done = True
+            return False
+
+        aurweb.querylog.record_retry(exc)
+        delay = self._backoff * 2 ** (self.attempt - 1)
+        time.sleep(random.uniform(delay / 2, delay))
+        return True
+
+
+def transaction(conn=None, retries=None, backoff=None):
+    """
+    Run a unit of work in a database transaction, retrying it with jittered
+    exponential backoff when it fails because of a deadlock or a lock wait
+    timeout. The body must be safe to run more than once:
+
+        for attempt in aurweb.db.transaction():
+            with attempt as conn:
+                conn.execute(...)
+
+    The transaction is committed when the with block completes and rolled
+    back when it raises. Errors other than lock contention, and contention
+    that persists after the configured number of retries, are re-raised.
+    Work which must only happen once the transaction is committed, such as
+    sending notifications, should be registered with Connection.on_commit().
+    """
+    if conn is None:
+        conn = get_connection()
+    if retries is None:
+        retries = aurweb.config.getint_with_fallback('database',
+                                                     'transaction-retries', 3)
+    if backoff is None:
+        backoff = float(aurweb.config.get_with_fallback(
+            'database', 'transaction-backoff', '0.05'))
+
+    attempt = Transaction(conn, retries, backoff)
+    while not attempt.done:
+        count = attempt.attempt
+        yield attempt
+        if attempt.attempt == count:
+            # The loop body did not enter the transaction.
+            break
+
+
+class ConnectionPool:
+    """
+    A bounded pool of database connections.
+
+    Connections are checked out per thread: nested checkouts from the same
+    thread share one connection, which goes back to the pool once the
+    outermost checkout is released. Idle connections are health-checked before
+    they are handed out again.
+    """
+
+    def __init__(self, size=None, timeout=None):
+        if size is None:
+            size = aurweb.config.getint_with_fallback('database',
+                                                      'pool-size', 4)
+        if timeout is None:
+            timeout = aurweb.config.getint_with_fallback('database',
+                                                         'pool-timeout', 30)
+        self._timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def acquire(self):
+        local = self._local
+        if getattr(local, 'conn', None):
+            local.depth += 1
+            return local.conn
+
+        if not self._slots.acquire(timeout=self._timeout):
+            raise TimeoutError('no database connection available')
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        try:
+            if conn:
+                conn.ping()
+            else:
+                conn = Connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+        local.conn = conn
+        local.depth = 1
+        return conn
+
+    def release(self, conn):
+        local = self._local
+        if getattr(local, 'conn', None) is not conn:
+            raise ValueError('connection not checked out by this thread')
+
+        local.depth -= 1
+        if local.depth > 0:
+            return
+
+        local.conn = None
+        try:
+            # Never hand out a connection with pending changes.
+            conn.rollback()
+        except Exception:
+            conn = None
+        if conn:
+            with self._lock:
+                self._idle.append(conn)
+        self._slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_shared = {}
+_shared_pid = None
+_committed_tables = set()
+_replica_usable = None
+
+
+def _replica_ok(tables):
+    """
+    Decide whether reads from the given tables (any table if None) may be
+    served by the replica.
+    """
+    global _replica_usable
+
+    if not aurweb.config.has_section('database-replica'):
+        return False
+
+    # Read-your-writes: once this process has committed changes to a table,
+    # reads depending on it go to the primary.
+    if tables is None and _committed_tables:
+        return False
+    if tables is not None and _committed_tables.intersection(tables):
+        return False
+
+    if _replica_usable is None:
+        max_lag = aurweb.config.getint_with_fallback('database-replica',
+                                                     'max-lag', 0)
+        try:
+            conn = _shared_connection('database-replica', True)
+            lag = conn.replication_lag() if max_lag > 0 else 0
+            _replica_usable = lag is not None and lag <= max_lag
+        except Exception:
+            _replica_usable = False
+    return _replica_usable
+
+
+def _shared_connection(section, readonly):
+    global _shared, _shared_pid
+
+    if _shared_pid != os.getpid():
+        if _shared_pid is None:
+            atexit.register(close_connection)
+        _shared = {}
+        _shared_pid = os.getpid()
+
+    if section not in _shared:
+        _shared[section] = Connection(section, readonly)
+    return _shared[section]
+
+
+def get_connection(readonly=False, tables=None):
+    """
+    Return a database connection shared by the whole process.
+
+    The connection is opened on first use and closed when the interpreter
+    exits. A process forked after the connection was opened gets a connection
+    of its own. The shared connection is not meant to be used by several
+    threads at once; use a ConnectionPool for that.
+
+    Read-only work may pass readonly=True to be routed to the server from the
+    [database-replica] section, if there is one. The primary is used instead
+    if the replica lags behind by more than its max-lag setting, or if this
+    process has committed changes to any of the tables the caller is going to
+    read (to any table at all if tables is None).
+    """
+    if readonly and _replica_ok(tables):
+        return _shared_connection('database-replica', True)
+    return _shared_connection('database', False)
+
+
+def close_connection():
+    global _shared, _replica_usable
+
+    if _shared_pid == os.getpid():
+        for conn in _shared.values():
+            conn.close()
+    _shared = {}
+    _replica_usable = None
+
+
+def reset_connection():
+    """
+    Prepare the shared connections for the next request of a process serving
+    several of them: roll back whatever the last request left pending and
+    forget which tables it wrote to. Connections which fail to roll back are
+    reopened on their next use.
+    """
+    global _replica_usable
+
+    if _shared_pid != os.getpid():
+        return
+    for section, conn in list(_shared.items()):
+        try:
+            conn.rollback()
+        except Exception:
+            del _shared[section]
+    _committed_tables.clear()
+    _replica_usable = None
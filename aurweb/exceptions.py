@@ -70,6 +70,33 @@ class NotVotedException(AurwebException):
         super(NotVotedException, self).__init__(msg)
 
 
+class RateLimitedException(AurwebException):
+    def __init__(self, wait):
+        msg = 'rate limit exceeded'
+        if wait != float('inf'):
+            msg += ', try again in {:d} seconds'.format(int(wait) + 1)
+        super(RateLimitedException, self).__init__(msg)
+
+
+class ServerBusyException(AurwebException):
+    def __init__(self):
+        msg = 'server busy, please retry in a few minutes'
+        super(ServerBusyException, self).__init__(msg)
+
+
 class InvalidArgumentsException(AurwebException):
     def __init__(self, msg):
         super(InvalidArgumentsException, self).__init__(msg)
+
+
+class ExecCommand(Exception):
+    """
+    Raised by resident workers instead of replacing the process with argv, so
+    that the client can run the command itself. Any file descriptors in fds
+    are passed on to the client, to be inherited by the command.
+    """
+    def __init__(self, argv, env, fds=()):
+        self.argv = argv
+        self.env = env
+        self.fds = fds
+        super(ExecCommand, self).__init__(argv[0])
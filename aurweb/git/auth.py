@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+import base64
+import binascii
+import hashlib
 import os
 import shlex
 import re
@@ -24,6 +27,19 @@ def format_command(env_vars, command, ssh_opts, ssh_key):
     return msg
 
 
+def key_fingerprint(keytext):
+    """
+    Return the SHA256 fingerprint of a public key the way it is stored in
+    SSHPubKeys, i.e. as printed by ssh-keygen -l without the SHA256: prefix.
+    """
+    try:
+        blob = base64.b64decode(keytext, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    digest = hashlib.sha256(blob).digest()
+    return base64.b64encode(digest).decode().rstrip('=')
+
+
 def main():
     valid_keytypes = aurweb.config.get('auth', 'valid-keytypes').split()
     username_regex = aurweb.config.get('auth', 'username-regex')
@@ -35,13 +51,20 @@ def main():
     if keytype not in valid_keytypes:
         exit(1)
 
+    fingerprint = key_fingerprint(keytext)
+    if not fingerprint:
+        exit(1)
+
     conn = aurweb.db.Connection()
 
+    # Look the key up by its fingerprint, which is the primary key of
+    # SSHPubKeys, and compare the full key to rule out collisions.
     cur = conn.execute("SELECT Users.Username, Users.AccountTypeID FROM Users "
                        "INNER JOIN SSHPubKeys ON SSHPubKeys.UserID = Users.ID "
-                       "WHERE SSHPubKeys.PubKey = ? AND Users.Suspended = 0 "
+                       "WHERE SSHPubKeys.Fingerprint = ? "
+                       "AND SSHPubKeys.PubKey = ? AND Users.Suspended = 0 "
                        "AND NOT Users.Passwd = ''",
-                       (keytype + " " + keytext,))
+                       (fingerprint, keytype + " " + keytext))
 
     row = cur.fetchone()
     if not row or cur.fetchone():
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Client for the resident git-serve and git-update workers of aurweb.git.daemon.
+
+The aurweb-git-serve and aurweb-git-update console scripts point here. If the
+socket option of the [daemon] section names a running daemon, the command is
+run by one of its workers, which receives the arguments, environment, working
+directory and standard streams of this process. Otherwise the command runs in
+this process, exactly as without the daemon.
+
+This module is loaded on every SSH connection and push, so it must not import
+anything expensive.
+"""
+
+import array
+import json
+import os
+import socket
+import sys
+
+import aurweb.config
+
+MAX_MESSAGE = 1 << 20
+MAX_FDS = 16
+
+
+def send_fds(sock, data, fds):
+    """Send a message along with file descriptors over a Unix socket."""
+    ancdata = []
+    if fds:
+        ancdata.append((socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                        array.array('i', fds)))
+    sock.sendmsg([data], ancdata)
+
+
+def recv_fds(sock, bufsize, maxfds):
+    """
+    Receive a message and up to maxfds file descriptors over a Unix socket.
+    Return the message and the list of file descriptors.
+    """
+    fds = array.array('i')
+    data, ancdata, _, _ = sock.recvmsg(
+        bufsize, socket.CMSG_SPACE(maxfds * fds.itemsize))
+    for level, cmsg_type, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and cmsg_type == socket.SCM_RIGHTS:
+            # Drop a truncated trailing descriptor, if any.
+            end = len(cmsg_data) - len(cmsg_data) % fds.itemsize
+            fds.frombytes(cmsg_data[:end])
+    return data, list(fds)
+
+
+def _run_locally(program):
+    if program == 'serve':
+        import aurweb.git.serve
+        aurweb.git.serve.main()
+    else:
+        import aurweb.git.update
+        aurweb.git.update.main()
+
+
+def _connect():
+    path = aurweb.config.get_with_fallback('daemon', 'socket', '')
+    if not path:
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def run(program):
+    sock = _connect()
+    if not sock:
+        _run_locally(program)
+        return
+
+    request = {
+        'program': program,
+        'argv': sys.argv,
+        'env': dict(os.environ),
+        'cwd': os.getcwd(),
+    }
+    with sock:
+        send_fds(sock, json.dumps(request).encode(), [0, 1, 2])
+        data, fds = recv_fds(sock, MAX_MESSAGE, MAX_FDS)
+    if not data:
+        sys.stderr.write('error: the worker exited unexpectedly\n')
+        exit(1)
+
+    reply = json.loads(data.decode())
+    if 'exec' in reply:
+        argv = reply['exec']
+        for fd in fds:
+            os.set_inheritable(fd, True)
+        os.execve(argv[0], argv, reply['env'])
+    exit(reply['status'])
+
+
+def serve():
+    run('serve')
+
+
+def update():
+    run('update')
+
+
+if __name__ == '__main__':
+    run(sys.argv.pop(1))
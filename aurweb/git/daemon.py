@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Resident daemon running git-serve and git-update requests.
+
+The daemon listens on the Unix socket named by the socket option of the
+[daemon] section and pre-forks a number of workers. Workers import
+aurweb.git.serve and aurweb.git.update only once and keep their database
+connection and repository handle open between requests, which come from the
+client shim in aurweb.git.client.
+
+A worker runs a request with the client's arguments, environment, working
+directory and standard streams, and sends back the exit status. Commands which
+would replace the process, such as git-shell, are handed back to the client to
+be executed there, along with the admission slots they hold. Workers are
+recycled after max-requests requests.
+
+Only clients running as the same user as the daemon are served.
+"""
+
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+import traceback
+
+import aurweb.config
+import aurweb.db
+import aurweb.exceptions
+import aurweb.git.client
+import aurweb.git.serve
+import aurweb.git.update
+
+MAX_MESSAGE = 1 << 20
+
+PROGRAMS = {
+    'serve': aurweb.git.serve.main,
+    'update': aurweb.git.update.main,
+}
+
+
+def peer_uid(sock):
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                            struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+def run_program(program):
+    """Run a program's main function and return its exit status."""
+    try:
+        PROGRAMS[program]()
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        sys.stderr.write('{}\n'.format(e.code))
+        return 1
+    except aurweb.exceptions.ExecCommand:
+        raise
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def handle(sock):
+    msg, fds = aurweb.git.client.recv_fds(sock, MAX_MESSAGE, 3)
+    try:
+        request = json.loads(msg.decode())
+        if len(fds) != 3 or request['program'] not in PROGRAMS:
+            raise ValueError('invalid request')
+    except (ValueError, KeyError):
+        for fd in fds:
+            os.close(fd)
+        raise
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = [os.dup(fd) for fd in range(3)]
+    saved_stdin = sys.stdin
+    saved_argv = sys.argv
+    saved_env = dict(os.environ)
+    saved_cwd = os.getcwd()
+    try:
+        for fd, client_fd in enumerate(fds):
+            os.dup2(client_fd, fd)
+            os.close(client_fd)
+        sys.stdin = open(0, closefd=False)
+        sys.argv = request['argv']
+        os.environ.clear()
+        os.environ.update(request['env'])
+        os.chdir(request['cwd'])
+
+        exec_fds = []
+        try:
+            reply = {'status': run_program(request['program'])}
+        except aurweb.exceptions.ExecCommand as e:
+            reply = {'exec': list(e.argv), 'env': e.env}
+            exec_fds = list(e.fds)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved_fd in enumerate(saved_fds):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        sys.stdin = saved_stdin
+        sys.argv = saved_argv
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+        aurweb.db.reset_connection()
+
+    try:
+        aurweb.git.client.send_fds(sock, json.dumps(reply).encode(),
+                                   exec_fds)
+    finally:
+        for fd in exec_fds:
+            os.close(fd)
+
+
+def worker(listener, max_requests):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    aurweb.git.serve.resident = True
+
+    # Warm up before the first request.
+    aurweb.db.get_connection()
+    try:
+        aurweb.git.update.open_repo()
+    except Exception:
+        pass
+
+    for _ in range(max_requests):
+        sock, _ = listener.accept()
+        with sock:
+            if peer_uid(sock) != os.getuid():
+                continue
+            try:
+                handle(sock)
+            except Exception:
+                traceback.print_exc()
+
+    aurweb.db.close_connection()
+
+
+def main():
+    path = aurweb.config.get('daemon', 'socket')
+    workers = aurweb.config.getint_with_fallback('daemon', 'workers', 4)
+    max_requests = aurweb.config.getint_with_fallback('daemon',
+                                                      'max-requests', 1000)
+
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    umask = os.umask(0o077)
+    listener.bind(path)
+    os.umask(umask)
+    listener.listen(128)
+
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                worker(listener, max_requests)
+                status = 0
+            finally:
+                os._exit(status)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+    while children:
+        pid, _ = os.wait()
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+        # Do not spin if workers die right away, e.g. without a database.
+        if time.monotonic() - started < 1:
+            time.sleep(1)
+        spawn()
+
+    listener.close()
+    os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
 
+import contextlib
+import heapq
+import io
+import json
 import os
 import re
 import shlex
@@ -7,432 +11,761 @@ import subprocess
 import sys
 import time
 
+import aurweb.admission
+import aurweb.bans
 import aurweb.config
 import aurweb.db
 import aurweb.exceptions
+import aurweb.keywords
+import aurweb.ratelimit
+
+# Set by aurweb.git.daemon in resident workers.
+resident = False
+
+# Commands which replace the process or exit cannot be part of a batch.
+unbatchable_commands = ('batch', 'git', 'git-receive-pack', 'git-upload-pack',
+                        'help', 'restore')
+
+
+class ServeContext:
+    """
+    The state shared by the helpers serving one command: the database
+    connection, the user running the command and the package bases looked up
+    so far. Everything is loaded on first use.
+    """
+
+    def __init__(self, user, privileged=False, remote_addr=None):
+        self.username = user
+        self.privileged = privileged
+        self.remote_addr = remote_addr
+        self._conn = None
+        self._account = None
+        self._pkgbases = {}
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = aurweb.db.get_connection()
+        return self._conn
+
+    @property
+    def account(self):
+        """
+        The ID, account type, suspension flag, last SSH login and its IP
+        address of the user, or None if there is no such user.
+        """
+        if self._account is None:
+            cur = self.conn.execute("SELECT ID, AccountTypeID, Suspended, " +
+                                    "LastSSHLogin, LastSSHLoginIPAddress " +
+                                    "FROM Users WHERE Username = ?",
+                                    [self.username])
+            self._account = cur.fetchone() or ()
+        return self._account or None
+
+    @property
+    def user(self):
+        """The account of the user, who must exist and not be suspended."""
+        row = self.account
+        if not row:
+            raise aurweb.exceptions.InvalidUserException(self.username)
+        if row[2]:
+            raise aurweb.exceptions.PermissionDeniedException(self.username)
+        return row
+
+    @property
+    def userid(self):
+        return self.user[0]
+
+    def pkgbase(self, name):
+        """
+        Return the ID and the maintainer's user ID of a package base, or None
+        if it does not exist.
+        """
+        if name not in self._pkgbases:
+            cur = self.conn.execute("SELECT ID, MaintainerUID " +
+                                    "FROM PackageBases WHERE Name = ?",
+                                    [name])
+            self._pkgbases[name] = cur.fetchone()
+        return self._pkgbases[name]
+
+    def pkgbase_id(self, name):
+        row = self.pkgbase(name)
+        if not row:
+            raise aurweb.exceptions.InvalidPackageBaseException(name)
+        return row[0]
+
+    def forget_pkgbase(self, name):
+        """Drop a package base which is being modified from the cache."""
+        self._pkgbases.pop(name, None)
+
+    def forget_pkgbases(self):
+        """Drop all package bases, e.g. after rolling back a transaction."""
+        self._pkgbases.clear()
+
+
+def notify(conn, *args, wait=False, prepare=False):
+    """
+    Run the notification script once the pending changes are committed.
+
+    The script looks up what the notification describes by ID. If that is
+    about to be deleted in the same transaction, pass prepare=True: the
+    notification is then built right away, from the uncommitted state, and
+    sent in this process once the changes are committed.
+    """
+    if prepare:
+        from aurweb.scripts import notify as notify_script
+        notification = notify_script.build(conn, *args)
+        conn.on_commit(notification.send)
+        return
+
+    notify_cmd = aurweb.config.get('notifications', 'notify-cmd')
+
+    def send():
+        proc = subprocess.Popen((notify_cmd,) + tuple(map(str, args)))
+        if wait:
+            proc.wait()
+    conn.on_commit(send)
+
+
+def pkgbase_exists(ctx, pkgbase):
+    return ctx.pkgbase(pkgbase) is not None
+
+
+_list_sort_keys = {
+    'name': ('Name',),
+    'modified': ('ModifiedTS', 'Name'),
+}
+
+
+def parse_list_options(cmdargv):
+    """
+    Parse the --name=value options of list-repos into a dict of keyword
+    arguments to list_repos().
+    """
+    options = {}
+    for arg in cmdargv[1:]:
+        name, sep, value = arg.partition('=')
+        if name == '--comaintained' and not sep:
+            options['comaintained'] = True
+        elif name == '--sort' and value in _list_sort_keys:
+            options['sort'] = value
+        elif name == '--format' and value in ('text', 'json'):
+            options['fmt'] = value
+        elif name == '--after' and sep:
+            options['after'] = value
+        elif name == '--limit' and value.isdigit() and int(value) > 0:
+            options['limit'] = int(value)
+        else:
+            msg = 'invalid option: {:s}'.format(arg)
+            raise aurweb.exceptions.InvalidArgumentsException(msg)
+    return options
+
+
+def _list_cursor(sort, row):
+    if sort == 'modified':
+        return '{:d}:{:s}'.format(row[2], row[0])
+    return row[0]
+
+
+def _list_query(conn, source, sort, after, limit, userid):
+    """
+    Return the package bases of one source, maintained or co-maintained, in
+    the order of the sort key. Both are read from an index on the user ID, and
+    the maintained ones from an index which is ordered by the sort key.
+    """
+    if source == 'maintained':
+        query = "SELECT Name, PackagerUID, ModifiedTS FROM PackageBases " + \
+                "WHERE MaintainerUID = ?"
+    else:
+        query = "SELECT PackageBases.Name, PackageBases.PackagerUID, " + \
+                "PackageBases.ModifiedTS FROM PackageComaintainers " + \
+                "INNER JOIN PackageBases " + \
+                "ON PackageBases.ID = PackageComaintainers.PackageBaseID " + \
+                "WHERE PackageComaintainers.UsersID = ?"
+    params = [userid]
+
+    if after is None:
+        pass
+    elif sort == 'modified':
+        ts, sep, name = after.partition(':')
+        if not ts.isdigit() or not sep:
+            msg = 'invalid cursor: {:s}'.format(after)
+            raise aurweb.exceptions.InvalidArgumentsException(msg)
+        query += " AND ModifiedTS >= ? AND (ModifiedTS > ? OR Name > ?)"
+        params += [int(ts), int(ts), name]
+    else:
+        query += " AND Name > ?"
+        params += [after]
+
+    query += " ORDER BY " + ", ".join(_list_sort_keys[sort])
+    if limit is not None:
+        query += " LIMIT ?"
+        params += [limit]
+    return conn.execute(query, params)
+
+
+def list_repos(ctx, comaintained=False, sort='name', after=None, limit=None,
+               fmt='text'):
+    """
+    List the package bases maintained by the user, and optionally those they
+    co-maintain, ordered by name or by modification time.
+
+    Pages are selected by keyset: after is the cursor of the last package base
+    of the previous page, i.e. its name, or its modification time and name
+    separated by a colon when sorting by modification time. With the JSON
+    format, the cursor of the next page is included in the output.
+    """
+    userid = ctx.userid
+    conn = aurweb.db.get_connection(readonly=True,
+                                    tables=('PackageBases',
+                                            'PackageComaintainers'))
+
+    sources = ['maintained']
+    if comaintained:
+        sources.append('comaintained')
+
+    def sort_key(row):
+        return (row[2], row[0]) if sort == 'modified' else row[0]
+
+    rows = heapq.merge(*[_list_query(conn, source, sort, after, limit, userid)
+                         for source in sources], key=sort_key)
+
+    repos = []
+    last = None
+    for row in rows:
+        if last is not None and row[0] == last[0]:
+            continue
+        if limit is not None and len(repos) >= limit:
+            break
+        last = row
+        if fmt == 'json':
+            repos.append({
+                'name': row[0],
+                'packaged': row[1] is not None,
+                'modified': row[2],
+            })
+        else:
+            repos.append(row)
+            print((' ' if row[1] else '*') + row[0])
 
-notify_cmd = aurweb.config.get('notifications', 'notify-cmd')
-
-repo_path = aurweb.config.get('serve', 'repo-path')
-repo_regex = aurweb.config.get('serve', 'repo-regex')
-git_shell_cmd = aurweb.config.get('serve', 'git-shell-cmd')
-git_update_cmd = aurweb.config.get('serve', 'git-update-cmd')
-ssh_cmdline = aurweb.config.get('serve', 'ssh-cmdline')
-
-enable_maintenance = aurweb.config.getboolean('options', 'enable-maintenance')
-maintenance_exc = aurweb.config.get('options', 'maintenance-exceptions').split()
-
-
-def pkgbase_from_name(pkgbase):
-    conn = aurweb.db.Connection()
-    cur = conn.execute("SELECT ID FROM PackageBases WHERE Name = ?", [pkgbase])
-
-    row = cur.fetchone()
-    return row[0] if row else None
-
-
-def pkgbase_exists(pkgbase):
-    return pkgbase_from_name(pkgbase) is not None
-
-
-def list_repos(user):
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT ID FROM Users WHERE Username = ?", [user])
-    userid = cur.fetchone()[0]
-    if userid == 0:
-        raise aurweb.exceptions.InvalidUserException(user)
-
-    cur = conn.execute("SELECT Name, PackagerUID FROM PackageBases " +
-                       "WHERE MaintainerUID = ?", [userid])
-    for row in cur:
-        print((' ' if row[1] else '*') + row[0])
-    conn.close()
+    if fmt == 'json':
+        cursor = None
+        if limit is not None and len(repos) == limit:
+            cursor = _list_cursor(sort, last)
+        json.dump({'repos': repos, 'next': cursor}, sys.stdout)
+        print()
 
 
-def create_pkgbase(pkgbase, user):
+def create_pkgbase(ctx, pkgbase):
+    repo_regex = aurweb.config.get('serve', 'repo-regex')
     if not re.match(repo_regex, pkgbase):
         raise aurweb.exceptions.InvalidRepositoryNameException(pkgbase)
-    if pkgbase_exists(pkgbase):
-        raise aurweb.exceptions.PackageBaseExistsException(pkgbase)
-
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT ID FROM Users WHERE Username = ?", [user])
-    userid = cur.fetchone()[0]
-    if userid == 0:
-        raise aurweb.exceptions.InvalidUserException(user)
-
-    now = int(time.time())
-    cur = conn.execute("INSERT INTO PackageBases (Name, SubmittedTS, " +
-                       "ModifiedTS, SubmitterUID, MaintainerUID, " +
-                       "FlaggerComment) VALUES (?, ?, ?, ?, ?, '')",
-                       [pkgbase, now, now, userid, userid])
-    pkgbase_id = cur.lastrowid
-
-    cur = conn.execute("INSERT INTO PackageNotifications " +
-                       "(PackageBaseID, UserID) VALUES (?, ?)",
-                       [pkgbase_id, userid])
-
-    conn.commit()
-    conn.close()
-
-
-def pkgbase_adopt(pkgbase, user, privileged):
-    pkgbase_id = pkgbase_from_name(pkgbase)
-    if not pkgbase_id:
-        raise aurweb.exceptions.InvalidPackageBaseException(pkgbase)
-
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT ID FROM PackageBases WHERE ID = ? AND " +
-                       "MaintainerUID IS NULL", [pkgbase_id])
-    if not privileged and not cur.fetchone():
-        raise aurweb.exceptions.PermissionDeniedException(user)
 
-    cur = conn.execute("SELECT ID FROM Users WHERE Username = ?", [user])
-    userid = cur.fetchone()[0]
-    if userid == 0:
-        raise aurweb.exceptions.InvalidUserException(user)
-
-    cur = conn.execute("UPDATE PackageBases SET MaintainerUID = ? " +
-                       "WHERE ID = ?", [userid, pkgbase_id])
-
-    cur = conn.execute("SELECT COUNT(*) FROM PackageNotifications WHERE " +
-                       "PackageBaseID = ? AND UserID = ?",
-                       [pkgbase_id, userid])
-    if cur.fetchone()[0] == 0:
-        cur = conn.execute("INSERT INTO PackageNotifications " +
-                           "(PackageBaseID, UserID) VALUES (?, ?)",
-                           [pkgbase_id, userid])
-    conn.commit()
-
-    subprocess.Popen((notify_cmd, 'adopt', str(userid), str(pkgbase_id)))
-
-    conn.close()
-
-
-def pkgbase_get_comaintainers(pkgbase):
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT UserName FROM PackageComaintainers " +
-                       "INNER JOIN Users " +
-                       "ON Users.ID = PackageComaintainers.UsersID " +
-                       "INNER JOIN PackageBases " +
-                       "ON PackageBases.ID = PackageComaintainers.PackageBaseID " +
-                       "WHERE PackageBases.Name = ? " +
-                       "ORDER BY Priority ASC", [pkgbase])
-
-    return [row[0] for row in cur.fetchall()]
-
-
-def pkgbase_set_comaintainers(pkgbase, userlist, user, privileged):
-    pkgbase_id = pkgbase_from_name(pkgbase)
-    if not pkgbase_id:
-        raise aurweb.exceptions.InvalidPackageBaseException(pkgbase)
-
-    if not privileged and not pkgbase_has_full_access(pkgbase, user):
-        raise aurweb.exceptions.PermissionDeniedException(user)
-
-    conn = aurweb.db.Connection()
-
-    userlist_old = set(pkgbase_get_comaintainers(pkgbase))
-
-    uids_old = set()
-    for olduser in userlist_old:
-        cur = conn.execute("SELECT ID FROM Users WHERE Username = ?",
-                           [olduser])
-        userid = cur.fetchone()[0]
-        if userid == 0:
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            ctx.forget_pkgbase(pkgbase)
+            if pkgbase_exists(ctx, pkgbase):
+                raise aurweb.exceptions.PackageBaseExistsException(pkgbase)
+
+            userid = ctx.userid
+            now = int(time.time())
+            cur = conn.execute("INSERT INTO PackageBases (Name, " +
+                               "SubmittedTS, ModifiedTS, SubmitterUID, " +
+                               "MaintainerUID, FlaggerComment) " +
+                               "VALUES (?, ?, ?, ?, ?, '')",
+                               [pkgbase, now, now, userid, userid])
+            pkgbase_id = cur.lastrowid
+
+            conn.execute("INSERT INTO PackageNotifications " +
+                         "(PackageBaseID, UserID) VALUES (?, ?)",
+                         [pkgbase_id, userid])
+            ctx.forget_pkgbase(pkgbase)
+
+
+def pkgbase_adopt(ctx, pkgbase):
+    pkgbase_id = ctx.pkgbase_id(pkgbase)
+
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            if ctx.privileged:
+                conn.execute("UPDATE PackageBases SET MaintainerUID = ? " +
+                             "WHERE ID = ?", [ctx.userid, pkgbase_id])
+            else:
+                cur = conn.execute("UPDATE PackageBases " +
+                                   "SET MaintainerUID = ? WHERE ID = ? " +
+                                   "AND MaintainerUID IS NULL",
+                                   [ctx.userid, pkgbase_id])
+                if cur.rowcount != 1:
+                    raise aurweb.exceptions.PermissionDeniedException(
+                        ctx.username)
+            ctx.forget_pkgbase(pkgbase)
+
+            cur = conn.execute("SELECT COUNT(*) FROM PackageNotifications " +
+                               "WHERE PackageBaseID = ? AND UserID = ?",
+                               [pkgbase_id, ctx.userid])
+            if cur.fetchone()[0] == 0:
+                conn.execute("INSERT INTO PackageNotifications " +
+                             "(PackageBaseID, UserID) VALUES (?, ?)",
+                             [pkgbase_id, ctx.userid])
+
+            notify(conn, 'adopt', ctx.userid, pkgbase_id)
+
+
+def _comaintainers(ctx, pkgbase_id):
+    cur = ctx.conn.execute("SELECT Users.ID, Users.UserName, " +
+                           "PackageComaintainers.Priority " +
+                           "FROM PackageComaintainers INNER JOIN Users " +
+                           "ON Users.ID = PackageComaintainers.UsersID " +
+                           "WHERE PackageComaintainers.PackageBaseID = ? " +
+                           "ORDER BY Priority ASC", [pkgbase_id])
+    return cur.fetchall()
+
+
+def userids_from_names(ctx, users):
+    """
+    Resolve user names to IDs with a single query. Raise InvalidUserException
+    for the first name which does not exist.
+    """
+    if not users:
+        return []
+    cur = ctx.conn.execute("SELECT ID, UserName FROM Users " +
+                           "WHERE UserName IN (" +
+                           ", ".join(["?"] * len(users)) + ")", users)
+    ids = {row[1].lower(): row[0] for row in cur.fetchall()}
+
+    userids = []
+    for user in users:
+        if user.lower() not in ids:
             raise aurweb.exceptions.InvalidUserException(user)
-        uids_old.add(userid)
-
-    uids_new = set()
-    for newuser in userlist:
-        cur = conn.execute("SELECT ID FROM Users WHERE Username = ?",
-                           [newuser])
-        userid = cur.fetchone()[0]
-        if userid == 0:
-            raise aurweb.exceptions.InvalidUserException(user)
-        uids_new.add(userid)
-
-    uids_add = uids_new - uids_old
-    uids_rem = uids_old - uids_new
-
-    i = 1
-    for userid in uids_new:
-        if userid in uids_add:
-            cur = conn.execute("INSERT INTO PackageComaintainers " +
-                               "(PackageBaseID, UsersID, Priority) " +
-                               "VALUES (?, ?, ?)", [pkgbase_id, userid, i])
-            subprocess.Popen((notify_cmd, 'comaintainer-add', str(userid),
-                              str(pkgbase_id)))
-        else:
-            cur = conn.execute("UPDATE PackageComaintainers " +
-                               "SET Priority = ? " +
-                               "WHERE PackageBaseID = ? AND UsersID = ?",
-                               [i, pkgbase_id, userid])
-        i += 1
-
-    for userid in uids_rem:
-            cur = conn.execute("DELETE FROM PackageComaintainers " +
-                               "WHERE PackageBaseID = ? AND UsersID = ?",
-                               [pkgbase_id, userid])
-            subprocess.Popen((notify_cmd, 'comaintainer-remove',
-                              str(userid), str(pkgbase_id)))
-
-    conn.commit()
-    conn.close()
-
-
-def pkgreq_by_pkgbase(pkgbase_id, reqtype):
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT PackageRequests.ID FROM PackageRequests " +
-                       "INNER JOIN RequestTypes ON " +
-                       "RequestTypes.ID = PackageRequests.ReqTypeID " +
-                       "WHERE PackageRequests.Status = 0 " +
-                       "AND PackageRequests.PackageBaseID = ? " +
-                       "AND RequestTypes.Name = ?", [pkgbase_id, reqtype])
+        userids.append(ids[user.lower()])
+    return userids
+
+
+def pkgbase_get_comaintainers(ctx, pkgbase):
+    return [row[1] for row in _comaintainers(ctx, ctx.pkgbase_id(pkgbase))]
+
+
+def _add_comaintainers(conn, pkgbase_id, uids_priorities):
+    """
+    Add co-maintainers given as (user ID, priority) pairs. A package base has
+    few of them, so they are inserted with one plain statement.
+    """
+    if not uids_priorities:
+        return
+    conn.execute("INSERT INTO PackageComaintainers " +
+                 "(PackageBaseID, UsersID, Priority) VALUES " +
+                 ", ".join(["(?, ?, ?)"] * len(uids_priorities)),
+                 [value for uid, priority in uids_priorities
+                  for value in (pkgbase_id, uid, priority)])
+
+
+def pkgbase_set_comaintainers(ctx, pkgbase, userlist):
+    pkgbase_id = ctx.pkgbase_id(pkgbase)
+
+    if not ctx.privileged and not pkgbase_has_full_access(ctx, pkgbase):
+        raise aurweb.exceptions.PermissionDeniedException(ctx.username)
+
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            priorities_old = {row[0]: row[2]
+                              for row in _comaintainers(ctx, pkgbase_id)}
+
+            # Priorities follow the order of the list, without duplicates.
+            priorities_new = {}
+            for userid in userids_from_names(ctx, userlist):
+                priorities_new.setdefault(userid, len(priorities_new) + 1)
+
+            uids_add = [uid for uid in priorities_new
+                        if uid not in priorities_old]
+            uids_rem = [uid for uid in priorities_old
+                        if uid not in priorities_new]
+            uids_moved = [uid for uid in priorities_new
+                          if uid in priorities_old and
+                          priorities_old[uid] != priorities_new[uid]]
+
+            if uids_rem:
+                conn.execute("DELETE FROM PackageComaintainers " +
+                             "WHERE PackageBaseID = ? AND UsersID IN (" +
+                             ", ".join(["?"] * len(uids_rem)) + ")",
+                             [pkgbase_id] + uids_rem)
+            if uids_moved:
+                conn.execute("UPDATE PackageComaintainers " +
+                             "SET Priority = CASE UsersID " +
+                             "WHEN ? THEN ? " * len(uids_moved) + "END " +
+                             "WHERE PackageBaseID = ? AND UsersID IN (" +
+                             ", ".join(["?"] * len(uids_moved)) + ")",
+                             [value for uid in uids_moved
+                              for value in (uid, priorities_new[uid])] +
+                             [pkgbase_id] + uids_moved)
+            _add_comaintainers(conn, pkgbase_id,
+                               [(uid, priorities_new[uid])
+                                for uid in uids_add])
+
+            if uids_add:
+                notify(conn, 'comaintainer-add',
+                       ','.join(map(str, uids_add)), pkgbase_id)
+            if uids_rem:
+                notify(conn, 'comaintainer-remove',
+                       ','.join(map(str, uids_rem)), pkgbase_id)
+
+
+def pkgreq_by_pkgbase(ctx, pkgbase_id, reqtype):
+    cur = ctx.conn.execute("SELECT PackageRequests.ID " +
+                           "FROM PackageRequests INNER JOIN RequestTypes " +
+                           "ON RequestTypes.ID = PackageRequests.ReqTypeID " +
+                           "WHERE PackageRequests.Status = 0 " +
+                           "AND PackageRequests.PackageBaseID = ? " +
+                           "AND RequestTypes.Name = ?", [pkgbase_id, reqtype])
 
     return [row[0] for row in cur.fetchall()]
 
 
-def pkgreq_close(reqid, user, reason, comments, autoclose=False):
+def pkgreq_close(ctx, reqid, reason, comments, autoclose=False,
+                 prepare=False):
     statusmap = {'accepted': 2, 'rejected': 3}
     if reason not in statusmap:
         raise aurweb.exceptions.InvalidReasonException(reason)
     status = statusmap[reason]
 
-    conn = aurweb.db.Connection()
-
-    if autoclose:
-        userid = None
-    else:
-        cur = conn.execute("SELECT ID FROM Users WHERE Username = ?", [user])
-        userid = cur.fetchone()[0]
-        if userid == 0:
-            raise aurweb.exceptions.InvalidUserException(user)
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            userid = None if autoclose else ctx.userid
 
-    now = int(time.time())
-    conn.execute("UPDATE PackageRequests SET Status = ?, ClosedTS = ?, " +
-                 "ClosedUID = ?, ClosureComment = ? " +
-                 "WHERE ID = ?", [status, now, userid, comments, reqid])
-    conn.commit()
-    conn.close()
+            now = int(time.time())
+            conn.execute("UPDATE PackageRequests SET Status = ?, " +
+                         "ClosedTS = ?, ClosedUID = ?, ClosureComment = ? " +
+                         "WHERE ID = ?",
+                         [status, now, userid, comments, reqid])
 
-    if not userid:
-        userid = 0
-    subprocess.Popen((notify_cmd, 'request-close', str(userid), str(reqid),
-                      reason)).wait()
+            notify(conn, 'request-close', userid or 0, reqid, reason,
+                   wait=True, prepare=prepare)
 
 
-def pkgbase_disown(pkgbase, user, privileged):
-    pkgbase_id = pkgbase_from_name(pkgbase)
-    if not pkgbase_id:
-        raise aurweb.exceptions.InvalidPackageBaseException(pkgbase)
+def pkgbase_disown(ctx, pkgbase):
+    pkgbase_id = ctx.pkgbase_id(pkgbase)
 
-    initialized_by_owner = pkgbase_has_full_access(pkgbase, user)
-    if not privileged and not initialized_by_owner:
-        raise aurweb.exceptions.PermissionDeniedException(user)
+    initialized_by_owner = pkgbase_has_full_access(ctx, pkgbase)
+    if not ctx.privileged and not initialized_by_owner:
+        raise aurweb.exceptions.PermissionDeniedException(ctx.username)
 
     # TODO: Support disowning package bases via package request.
 
-    # Scan through pending orphan requests and close them.
-    comment = 'The user {:s} disowned the package.'.format(user)
-    for reqid in pkgreq_by_pkgbase(pkgbase_id, 'orphan'):
-        pkgreq_close(reqid, user, 'accepted', comment, True)
-
-    comaintainers = []
-    new_maintainer_userid = None
-
-    conn = aurweb.db.Connection()
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            # Scan through pending orphan requests and close them.
+            comment = 'The user {:s} disowned the package.'.format(
+                ctx.username)
+            for reqid in pkgreq_by_pkgbase(ctx, pkgbase_id, 'orphan'):
+                pkgreq_close(ctx, reqid, 'accepted', comment, True)
 
-    # Make the first co-maintainer the new maintainer, unless the action was
-    # enforced by a Trusted User.
-    if initialized_by_owner:
-        comaintainers = pkgbase_get_comaintainers(pkgbase)
-        if len(comaintainers) > 0:
-            new_maintainer = comaintainers[0]
-            cur = conn.execute("SELECT ID FROM Users WHERE Username = ?",
-                               [new_maintainer])
-            new_maintainer_userid = cur.fetchone()[0]
-            comaintainers.remove(new_maintainer)
+            comaintainers = []
+            new_maintainer_userid = None
 
-    pkgbase_set_comaintainers(pkgbase, comaintainers, user, privileged)
-    cur = conn.execute("UPDATE PackageBases SET MaintainerUID = ? " +
-                       "WHERE ID = ?", [new_maintainer_userid, pkgbase_id])
-
-    conn.commit()
-
-    cur = conn.execute("SELECT ID FROM Users WHERE Username = ?", [user])
-    userid = cur.fetchone()[0]
-    if userid == 0:
-            raise aurweb.exceptions.InvalidUserException(user)
+            # Make the first co-maintainer the new maintainer, unless the
+            # action was enforced by a Trusted User.
+            if initialized_by_owner:
+                comaintainers = _comaintainers(ctx, pkgbase_id)
+                if len(comaintainers) > 0:
+                    new_maintainer_userid = comaintainers.pop(0)[0]
 
-    subprocess.Popen((notify_cmd, 'disown', str(userid), str(pkgbase_id)))
+            pkgbase_set_comaintainers(ctx, pkgbase,
+                                      [row[1] for row in comaintainers])
+            conn.execute("UPDATE PackageBases SET MaintainerUID = ? " +
+                         "WHERE ID = ?", [new_maintainer_userid, pkgbase_id])
+            ctx.forget_pkgbase(pkgbase)
 
-    conn.close()
+            notify(conn, 'disown', ctx.userid, pkgbase_id)
 
 
-def pkgbase_flag(pkgbase, user, comment):
-    pkgbase_id = pkgbase_from_name(pkgbase)
-    if not pkgbase_id:
-        raise aurweb.exceptions.InvalidPackageBaseException(pkgbase)
+def pkgbase_flag(ctx, pkgbase, comment):
+    pkgbase_id = ctx.pkgbase_id(pkgbase)
     if len(comment) < 3:
         raise aurweb.exceptions.InvalidCommentException(comment)
 
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT ID FROM Users WHERE Username = ?", [user])
-    userid = cur.fetchone()[0]
-    if userid == 0:
-        raise aurweb.exceptions.InvalidUserException(user)
-
-    now = int(time.time())
-    conn.execute("UPDATE PackageBases SET " +
-                 "OutOfDateTS = ?, FlaggerUID = ?, FlaggerComment = ? " +
-                 "WHERE ID = ? AND OutOfDateTS IS NULL",
-                 [now, userid, comment, pkgbase_id])
-
-    conn.commit()
-
-    subprocess.Popen((notify_cmd, 'flag', str(userid), str(pkgbase_id)))
-
-
-def pkgbase_unflag(pkgbase, user):
-    pkgbase_id = pkgbase_from_name(pkgbase)
-    if not pkgbase_id:
-        raise aurweb.exceptions.InvalidPackageBaseException(pkgbase)
-
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT ID FROM Users WHERE Username = ?", [user])
-    userid = cur.fetchone()[0]
-    if userid == 0:
-        raise aurweb.exceptions.InvalidUserException(user)
-
-    if user in pkgbase_get_comaintainers(pkgbase):
-        conn.execute("UPDATE PackageBases SET OutOfDateTS = NULL " +
-                     "WHERE ID = ?", [pkgbase_id])
-    else:
-        conn.execute("UPDATE PackageBases SET OutOfDateTS = NULL " +
-                     "WHERE ID = ? AND (MaintainerUID = ? OR FlaggerUID = ?)",
-                     [pkgbase_id, userid, userid])
-
-    conn.commit()
-
-
-def pkgbase_vote(pkgbase, user):
-    pkgbase_id = pkgbase_from_name(pkgbase)
-    if not pkgbase_id:
-        raise aurweb.exceptions.InvalidPackageBaseException(pkgbase)
-
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT ID FROM Users WHERE Username = ?", [user])
-    userid = cur.fetchone()[0]
-    if userid == 0:
-        raise aurweb.exceptions.InvalidUserException(user)
-
-    cur = conn.execute("SELECT COUNT(*) FROM PackageVotes " +
-                       "WHERE UsersID = ? AND PackageBaseID = ?",
-                       [userid, pkgbase_id])
-    if cur.fetchone()[0] > 0:
-        raise aurweb.exceptions.AlreadyVotedException(pkgbase)
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            now = int(time.time())
+            conn.execute("UPDATE PackageBases SET " +
+                         "OutOfDateTS = ?, FlaggerUID = ?, " +
+                         "FlaggerComment = ? " +
+                         "WHERE ID = ? AND OutOfDateTS IS NULL",
+                         [now, ctx.userid, comment, pkgbase_id])
+
+            notify(conn, 'flag', ctx.userid, pkgbase_id)
+
+
+def pkgbase_unflag(ctx, pkgbase):
+    pkgbase_id = ctx.pkgbase_id(pkgbase)
+
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            userid = ctx.userid
+            conn.execute("UPDATE PackageBases SET OutOfDateTS = NULL " +
+                         "WHERE ID = ? AND " +
+                         "(MaintainerUID = ? OR FlaggerUID = ? OR EXISTS (" +
+                         "SELECT * FROM PackageComaintainers " +
+                         "WHERE PackageBaseID = ? AND UsersID = ?))",
+                         [pkgbase_id, userid, userid, pkgbase_id, userid])
+
+
+def pkgbase_vote(ctx, pkgbase):
+    pkgbase_id = ctx.pkgbase_id(pkgbase)
+
+    # The unique VoteUsersIDPackageID index decides whether the vote is new,
+    # so concurrent votes of the same user cannot both count. NumVotes is
+    # only updated for a new vote, as the last statement of the transaction,
+    # to hold the lock on the package base as briefly as possible.
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            now = int(time.time())
+            cur = conn.execute_ignore("INSERT INTO PackageVotes " +
+                                      "(UsersID, PackageBaseID, VoteTS) " +
+                                      "VALUES (?, ?, ?)",
+                                      [ctx.userid, pkgbase_id, now])
+            if cur.rowcount == 0:
+                raise aurweb.exceptions.AlreadyVotedException(pkgbase)
+            conn.execute("UPDATE PackageBases SET NumVotes = NumVotes + 1 " +
+                         "WHERE ID = ?", [pkgbase_id])
+
+
+def pkgbase_unvote(ctx, pkgbase):
+    pkgbase_id = ctx.pkgbase_id(pkgbase)
+
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            cur = conn.execute("DELETE FROM PackageVotes WHERE UsersID = ? " +
+                               "AND PackageBaseID = ?",
+                               [ctx.userid, pkgbase_id])
+            if cur.rowcount == 0:
+                raise aurweb.exceptions.NotVotedException(pkgbase)
+            conn.execute("UPDATE PackageBases SET NumVotes = NumVotes - 1 " +
+                         "WHERE ID = ? AND NumVotes > 0", [pkgbase_id])
+
+
+def _merge_comaintainers(conn, from_id, into_id):
+    """
+    Add the co-maintainers of one package base to another, after the ones it
+    already has, and return their user IDs. The maintainer and co-maintainers
+    of the target are skipped.
+    """
+    cur = conn.execute("SELECT UsersID FROM PackageComaintainers " +
+                       "WHERE PackageBaseID = ? AND UsersID NOT IN (" +
+                       "SELECT UsersID FROM PackageComaintainers " +
+                       "WHERE PackageBaseID = ?) AND UsersID NOT IN (" +
+                       "SELECT MaintainerUID FROM PackageBases " +
+                       "WHERE ID = ? AND MaintainerUID IS NOT NULL) " +
+                       "ORDER BY Priority", [from_id, into_id, into_id])
+    uids = [row[0] for row in cur.fetchall()]
+    if not uids:
+        return []
+
+    cur = conn.execute("SELECT COALESCE(MAX(Priority), 0) " +
+                       "FROM PackageComaintainers WHERE PackageBaseID = ?",
+                       [into_id])
+    offset = cur.fetchone()[0]
+    _add_comaintainers(conn, into_id, [(uid, offset + i + 1)
+                                       for i, uid in enumerate(uids)])
+    return uids
+
+
+def pkgbase_merge(ctx, pkgbase, target):
+    """
+    Merge a package base into another one and delete it. Votes, comments,
+    notifications and co-maintainers are moved with one statement each, and
+    pending deletion requests, as well as merge requests into the target, are
+    accepted. All of this, including the deletion, is one transaction.
+
+    The notifications describe the merged package base, so they are built
+    before it is deleted, and sent once the transaction is committed.
+    """
+    if not ctx.privileged:
+        raise aurweb.exceptions.PermissionDeniedException(ctx.username)
+    if pkgbase == target:
+        msg = 'cannot merge a package base into itself'
+        raise aurweb.exceptions.InvalidArgumentsException(msg)
 
-    now = int(time.time())
-    conn.execute("INSERT INTO PackageVotes (UsersID, PackageBaseID, VoteTS) " +
-                 "VALUES (?, ?, ?)", [userid, pkgbase_id, now])
-    conn.execute("UPDATE PackageBases SET NumVotes = NumVotes + 1 " +
-                 "WHERE ID = ?", [pkgbase_id])
-    conn.commit()
-
-
-def pkgbase_unvote(pkgbase, user):
-    pkgbase_id = pkgbase_from_name(pkgbase)
-    if not pkgbase_id:
-        raise aurweb.exceptions.InvalidPackageBaseException(pkgbase)
-
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT ID FROM Users WHERE Username = ?", [user])
-    userid = cur.fetchone()[0]
-    if userid == 0:
-        raise aurweb.exceptions.InvalidUserException(user)
-
-    cur = conn.execute("SELECT COUNT(*) FROM PackageVotes " +
-                       "WHERE UsersID = ? AND PackageBaseID = ?",
-                       [userid, pkgbase_id])
-    if cur.fetchone()[0] == 0:
-        raise aurweb.exceptions.NotVotedException(pkgbase)
-
-    conn.execute("DELETE FROM PackageVotes WHERE UsersID = ? AND " +
-                 "PackageBaseID = ?", [userid, pkgbase_id])
-    conn.execute("UPDATE PackageBases SET NumVotes = NumVotes - 1 " +
-                 "WHERE ID = ?", [pkgbase_id])
-    conn.commit()
-
-
-def pkgbase_set_keywords(pkgbase, keywords):
-    pkgbase_id = pkgbase_from_name(pkgbase)
-    if not pkgbase_id:
-        raise aurweb.exceptions.InvalidPackageBaseException(pkgbase)
-
-    conn = aurweb.db.Connection()
-
-    conn.execute("DELETE FROM PackageKeywords WHERE PackageBaseID = ?",
-                 [pkgbase_id])
-    for keyword in keywords:
-        conn.execute("INSERT INTO PackageKeywords (PackageBaseID, Keyword) " +
-                     "VALUES (?, ?)", [pkgbase_id, keyword])
-
-    conn.commit()
-    conn.close()
-
-
-def pkgbase_has_write_access(pkgbase, user):
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT COUNT(*) FROM PackageBases " +
-                       "LEFT JOIN PackageComaintainers " +
-                       "ON PackageComaintainers.PackageBaseID = PackageBases.ID " +
-                       "INNER JOIN Users " +
-                       "ON Users.ID = PackageBases.MaintainerUID " +
-                       "OR PackageBases.MaintainerUID IS NULL " +
-                       "OR Users.ID = PackageComaintainers.UsersID " +
-                       "WHERE Name = ? AND Username = ?", [pkgbase, user])
+    from_id = ctx.pkgbase_id(pkgbase)
+    into_id = ctx.pkgbase_id(target)
+
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            cur = conn.execute("SELECT PackageRequests.ID " +
+                               "FROM PackageRequests " +
+                               "INNER JOIN RequestTypes ON " +
+                               "RequestTypes.ID = PackageRequests.ReqTypeID " +
+                               "WHERE PackageRequests.Status = 0 " +
+                               "AND PackageRequests.PackageBaseID = ? " +
+                               "AND (RequestTypes.Name = 'deletion' OR " +
+                               "(RequestTypes.Name = 'merge' AND " +
+                               "PackageRequests.MergeBaseName = ?))",
+                               [from_id, target])
+            comment = 'The user {:s} merged the package into {:s}.'.format(
+                ctx.username, target)
+            for reqid in [row[0] for row in cur.fetchall()]:
+                pkgreq_close(ctx, reqid, 'accepted', comment, prepare=True)
+
+            # Votes of users who also voted for the target are dropped with
+            # the merged package base.
+            conn.execute("UPDATE PackageVotes SET PackageBaseID = ? " +
+                         "WHERE PackageBaseID = ? AND UsersID NOT IN (" +
+                         "SELECT UsersID FROM (SELECT UsersID " +
+                         "FROM PackageVotes WHERE PackageBaseID = ?) AS t)",
+                         [into_id, from_id, into_id])
+            conn.execute("UPDATE PackageBases SET NumVotes = (" +
+                         "SELECT COUNT(*) FROM PackageVotes " +
+                         "WHERE PackageBaseID = ?) WHERE ID = ?",
+                         [into_id, into_id])
+
+            # Notifications are copied rather than moved, so that the deletion
+            # notification reaches the users watching the merged package base.
+            conn.execute("INSERT INTO PackageNotifications " +
+                         "(UserID, PackageBaseID) SELECT UserID, ? " +
+                         "FROM PackageNotifications AS n " +
+                         "WHERE n.PackageBaseID = ? AND NOT EXISTS (" +
+                         "SELECT * FROM PackageNotifications AS n2 " +
+                         "WHERE n2.PackageBaseID = ? " +
+                         "AND n2.UserID = n.UserID)",
+                         [into_id, from_id, into_id])
+
+            conn.execute("UPDATE PackageComments SET PackageBaseID = ? " +
+                         "WHERE PackageBaseID = ?", [into_id, from_id])
+
+            uids_add = _merge_comaintainers(conn, from_id, into_id)
+
+            if uids_add:
+                notify(conn, 'comaintainer-add', ','.join(map(str, uids_add)),
+                       into_id, prepare=True)
+            notify(conn, 'delete', ctx.userid, from_id, into_id, prepare=True)
+
+            conn.execute("DELETE FROM Packages WHERE PackageBaseID = ?",
+                         [from_id])
+            conn.execute("DELETE FROM PackageBases WHERE ID = ?", [from_id])
+            ctx.forget_pkgbase(pkgbase)
+
+
+def pkgbase_set_keywords(ctx, pkgbase, keywords):
+    pkgbase_id = ctx.pkgbase_id(pkgbase)
+
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            aurweb.keywords.set_keywords(conn, pkgbase_id, keywords)
+
+
+def pkgbase_has_write_access(ctx, pkgbase):
+    row = ctx.pkgbase(pkgbase)
+    if not row:
+        return False
+    if row[1] is None or row[1] == ctx.userid:
+        return True
+
+    cur = ctx.conn.execute("SELECT COUNT(*) FROM PackageComaintainers " +
+                           "WHERE PackageBaseID = ? AND UsersID = ?",
+                           [row[0], ctx.userid])
     return cur.fetchone()[0] > 0
 
 
-def pkgbase_has_full_access(pkgbase, user):
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT COUNT(*) FROM PackageBases " +
-                       "INNER JOIN Users " +
-                       "ON Users.ID = PackageBases.MaintainerUID " +
-                       "WHERE Name = ? AND Username = ?", [pkgbase, user])
-    return cur.fetchone()[0] > 0
+def pkgbase_has_full_access(ctx, pkgbase):
+    row = ctx.pkgbase(pkgbase)
+    return bool(row) and row[1] == ctx.userid
 
 
-def log_ssh_login(user, remote_addr):
-    conn = aurweb.db.Connection()
+def log_ssh_login(ctx):
+    """
+    Record the time and address of the login. Users log in for every clone
+    and fetch, so the row is only written if the address changed or the
+    stored time is older than ssh-login-interval seconds.
+    """
+    row = ctx.account
+    if not row:
+        return
 
+    interval = aurweb.config.getint_with_fallback('serve',
+                                                  'ssh-login-interval', 300)
     now = int(time.time())
-    conn.execute("UPDATE Users SET LastSSHLogin = ?, " +
-                 "LastSSHLoginIPAddress = ? WHERE Username = ?",
-                 [now, remote_addr, user])
-
-    conn.commit()
-    conn.close()
-
-
-def bans_match(remote_addr):
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT COUNT(*) FROM Bans WHERE IPAddress = ?",
-                       [remote_addr])
-    return cur.fetchone()[0] > 0
+    if row[4] == ctx.remote_addr and now - (row[3] or 0) < interval:
+        return
+
+    for attempt in aurweb.db.transaction(ctx.conn):
+        with attempt as conn:
+            conn.execute("UPDATE Users SET LastSSHLogin = ?, " +
+                         "LastSSHLoginIPAddress = ? WHERE ID = ?",
+                         [now, ctx.remote_addr, row[0]])
+
+
+def bans_match(ctx):
+    return aurweb.bans.is_banned(ctx.remote_addr)
+
+
+def check_ratelimit(ctx, actions):
+    """Take the tokens of the given commands from the user's buckets."""
+    state_dir = aurweb.config.get_with_fallback('serve-ratelimit',
+                                                'state-dir', '')
+    if not state_dir or ctx.privileged:
+        return
+
+    default_cost = aurweb.config.getint('serve-ratelimit', 'default-cost')
+    costs = {}
+    for elem in aurweb.config.get('serve-ratelimit', 'command-costs').split():
+        action, _, cost = elem.partition(':')
+        costs[action] = int(cost)
+    cost = sum(costs.get(action, default_cost) for action in actions)
+    if cost <= 0:
+        return
+
+    keys = []
+    if ctx.username:
+        keys.append('user:' + ctx.username)
+    if ctx.remote_addr:
+        keys.append('addr:' + ctx.remote_addr)
+    capacity = aurweb.config.getint('serve-ratelimit', 'capacity')
+    rate = float(aurweb.config.get('serve-ratelimit', 'refill-rate'))
+    wait = aurweb.ratelimit.take(state_dir, keys, cost, capacity, rate)
+    if wait:
+        raise aurweb.exceptions.RateLimitedException(wait)
+
+
+def check_admission(ctx, action, pkgbase):
+    """
+    Take the admission slots of a Git command and return the file descriptors
+    holding them. They must stay open for as long as the command runs.
+    """
+    state_dir = aurweb.config.get_with_fallback('serve-admission',
+                                                'state-dir', '')
+    if not state_dir:
+        return []
+
+    def slots(option):
+        return aurweb.config.getint('serve-admission', option)
+
+    limits = []
+    if action == 'git-receive-pack':
+        limits.append(('receive-pack', slots('receive-pack-slots')))
+        limits.append(('receive-pack:' + pkgbase,
+                       slots('receive-pack-pkgbase-slots')))
+    elif ctx.remote_addr:
+        limits.append(('upload-pack:' + ctx.remote_addr,
+                       slots('upload-pack-addr-slots')))
+
+    queue_size = aurweb.config.getint('serve-admission', 'queue-size')
+    timeout = float(aurweb.config.get('serve-admission', 'queue-timeout'))
+    fds = aurweb.admission.acquire(state_dir, limits, queue_size, timeout)
+    if fds is None:
+        raise aurweb.exceptions.ServerBusyException()
+    return fds
+
+
+def exec_command(cmd, *args, fds=()):
+    """
+    Replace the process with cmd, which inherits the file descriptors in fds.
+    Resident workers raise ExecCommand instead, handing the command and the
+    file descriptors back to their client.
+    """
+    if resident:
+        raise aurweb.exceptions.ExecCommand((cmd,) + args, dict(os.environ),
+                                            fds)
+    for fd in fds:
+        os.set_inheritable(fd, True)
+    os.execl(cmd, cmd, *args)
 
 
 def die(msg):
@@ -441,6 +774,7 @@ def die(msg):
 
 
 def die_with_help(msg):
+    ssh_cmdline = aurweb.config.get('serve', 'ssh-cmdline')
     die(msg + "\nTry `{:s} help` for a list of commands.".format(ssh_cmdline))
 
 
@@ -472,13 +806,127 @@ def checkarg(cmdargv, *argdesc):
     checkarg_atmost(cmdargv, *argdesc)
 
 
+def error_message(action, exc):
+    """Return the message reporting an error raised by a command."""
+    if isinstance(exc, aurweb.exceptions.MaintenanceException):
+        return "The AUR is down due to maintenance. We will be back soon."
+    if isinstance(exc, aurweb.exceptions.BannedException):
+        return "The SSH interface is disabled for your IP address."
+    return '{:s}: {}'.format(action, exc)
+
+
+def read_batch(cmdargv, infile):
+    """
+    Parse the options of a batch and read its commands, one per line and
+    quoted like SSH_ORIGINAL_COMMAND. Return whether the commands are run in
+    separate transactions and the commands.
+    """
+    checkarg_atmost(cmdargv, 'option')
+    per_command = cmdargv[1:] == ['--per-command']
+    if len(cmdargv) > 1 and not per_command:
+        msg = 'unknown option: {:s}'.format(cmdargv[1])
+        raise aurweb.exceptions.InvalidArgumentsException(msg)
+
+    limit = aurweb.config.getint_with_fallback('serve', 'batch-max-commands',
+                                               1000)
+    commands = []
+    for line in infile:
+        try:
+            cmdargv = shlex.split(line)
+        except ValueError as e:
+            raise aurweb.exceptions.InvalidArgumentsException(str(e))
+        if not cmdargv:
+            continue
+        if cmdargv[0] in unbatchable_commands:
+            msg = '{:s} cannot be batched'.format(cmdargv[0])
+            raise aurweb.exceptions.InvalidArgumentsException(msg)
+        if len(commands) >= limit:
+            msg = 'too many commands (at most {:d})'.format(limit)
+            raise aurweb.exceptions.InvalidArgumentsException(msg)
+        commands.append(cmdargv)
+    return per_command, commands
+
+
+def serve_batch(ctx, commands, per_command):
+    """
+    Run the commands read from stdin and print one result line per command:
+    "ok", or "error: " followed by the message the command would have died
+    with on its own.
+
+    By default, the whole batch is one transaction. Results are printed once
+    it is committed; if a command fails, nothing is changed and only its error
+    is printed. With --per-command, each command is committed on its own and
+    its result printed right away; the batch goes on after errors.
+    """
+    failed = False
+
+    if per_command:
+        for cmdargv in commands:
+            try:
+                run_command(ctx, cmdargv[0], cmdargv)
+                print('ok')
+            except aurweb.exceptions.AurwebException as e:
+                print('error: ' + error_message(cmdargv[0], e))
+                failed = True
+            sys.stdout.flush()
+    else:
+        failure = None
+        try:
+            for attempt in aurweb.db.transaction(ctx.conn):
+                with attempt:
+                    ctx.forget_pkgbases()
+                    output = io.StringIO()
+                    with contextlib.redirect_stdout(output):
+                        for cmdargv in commands:
+                            try:
+                                run_command(ctx, cmdargv[0], cmdargv)
+                            except aurweb.exceptions.AurwebException as e:
+                                failure = error_message(cmdargv[0], e)
+                                raise
+                            print('ok')
+        except aurweb.exceptions.AurwebException:
+            print('error: ' + failure)
+            failed = True
+        else:
+            sys.stdout.write(output.getvalue())
+
+    if failed:
+        exit(1)
+
+
 def serve(action, cmdargv, user, privileged, remote_addr):
+    enable_maintenance = aurweb.config.getboolean('options',
+                                                  'enable-maintenance')
+    maintenance_exc = aurweb.config.get('options',
+                                        'maintenance-exceptions').split()
+
     if enable_maintenance:
         if remote_addr not in maintenance_exc:
             raise aurweb.exceptions.MaintenanceException
-    if bans_match(remote_addr):
+    ctx = ServeContext(user, privileged, remote_addr)
+    if bans_match(ctx):
         raise aurweb.exceptions.BannedException
-    log_ssh_login(user, remote_addr)
+
+    if action == 'batch':
+        per_command, commands = read_batch(cmdargv, sys.stdin)
+        check_ratelimit(ctx, [cmdargv[0] for cmdargv in commands])
+    else:
+        check_ratelimit(ctx, [action])
+    log_ssh_login(ctx)
+
+    if action == 'batch':
+        serve_batch(ctx, commands, per_command)
+    else:
+        run_command(ctx, action, cmdargv)
+
+
+def run_command(ctx, action, cmdargv):
+    repo_path = aurweb.config.get('serve', 'repo-path')
+    repo_regex = aurweb.config.get('serve', 'repo-regex')
+    git_shell_cmd = aurweb.config.get('serve', 'git-shell-cmd')
+    git_update_cmd = aurweb.config.get('serve', 'git-update-cmd')
+    user = ctx.username
+    privileged = ctx.privileged
 
     if action == 'git' and cmdargv[1] in ('upload-pack', 'receive-pack'):
         action = action + '-' + cmdargv[1]
@@ -496,8 +944,8 @@ def serve(action, cmdargv, user, privileged, remote_addr):
         if not re.match(repo_regex, pkgbase):
             raise aurweb.exceptions.InvalidRepositoryNameException(pkgbase)
 
-        if action == 'git-receive-pack' and pkgbase_exists(pkgbase):
-            if not privileged and not pkgbase_has_write_access(pkgbase, user):
+        if action == 'git-receive-pack' and pkgbase_exists(ctx, pkgbase):
+            if not privileged and not pkgbase_has_write_access(ctx, pkgbase):
                 raise aurweb.exceptions.PermissionDeniedException(user)
 
         if not os.access(git_update_cmd, os.R_OK | os.X_OK):
@@ -507,71 +955,79 @@ def serve(action, cmdargv, user, privileged, remote_addr):
         os.environ["AUR_PKGBASE"] = pkgbase
         os.environ["GIT_NAMESPACE"] = pkgbase
         cmd = action + " '" + repo_path + "'"
-        os.execl(git_shell_cmd, git_shell_cmd, '-c', cmd)
+        fds = check_admission(ctx, action, pkgbase)
+        exec_command(git_shell_cmd, '-c', cmd, fds=fds)
     elif action == 'set-keywords':
         checkarg_atleast(cmdargv, 'repository name')
-        pkgbase_set_keywords(cmdargv[1], cmdargv[2:])
+        pkgbase_set_keywords(ctx, cmdargv[1], cmdargv[2:])
     elif action == 'list-repos':
-        checkarg(cmdargv)
-        list_repos(user)
+        list_repos(ctx, **parse_list_options(cmdargv))
     elif action == 'setup-repo':
         checkarg(cmdargv, 'repository name')
         warn('{:s} is deprecated. '
              'Use `git push` to create new repositories.'.format(action))
-        create_pkgbase(cmdargv[1], user)
+        create_pkgbase(ctx, cmdargv[1])
     elif action == 'restore':
         checkarg(cmdargv, 'repository name')
 
         pkgbase = cmdargv[1]
-        create_pkgbase(pkgbase, user)
+        create_pkgbase(ctx, pkgbase)
 
         os.environ["AUR_USER"] = user
         os.environ["AUR_PKGBASE"] = pkgbase
-        os.execl(git_update_cmd, git_update_cmd, 'restore')
+        exec_command(git_update_cmd, 'restore')
     elif action == 'adopt':
         checkarg(cmdargv, 'repository name')
 
         pkgbase = cmdargv[1]
-        pkgbase_adopt(pkgbase, user, privileged)
+        pkgbase_adopt(ctx, pkgbase)
     elif action == 'disown':
         checkarg(cmdargv, 'repository name')
 
         pkgbase = cmdargv[1]
-        pkgbase_disown(pkgbase, user, privileged)
+        pkgbase_disown(ctx, pkgbase)
     elif action == 'flag':
         checkarg(cmdargv, 'repository name', 'comment')
 
         pkgbase = cmdargv[1]
         comment = cmdargv[2]
-        pkgbase_flag(pkgbase, user, comment)
+        pkgbase_flag(ctx, pkgbase, comment)
     elif action == 'unflag':
         checkarg(cmdargv, 'repository name')
 
         pkgbase = cmdargv[1]
-        pkgbase_unflag(pkgbase, user)
+        pkgbase_unflag(ctx, pkgbase)
     elif action == 'vote':
         checkarg(cmdargv, 'repository name')
 
         pkgbase = cmdargv[1]
-        pkgbase_vote(pkgbase, user)
+        pkgbase_vote(ctx, pkgbase)
     elif action == 'unvote':
         checkarg(cmdargv, 'repository name')
 
         pkgbase = cmdargv[1]
-        pkgbase_unvote(pkgbase, user)
+        pkgbase_unvote(ctx, pkgbase)
+    elif action == 'merge':
+        checkarg(cmdargv, 'repository name', 'target repository name')
+
+        pkgbase = cmdargv[1]
+        target = cmdargv[2]
+        pkgbase_merge(ctx, pkgbase, target)
     elif action == 'set-comaintainers':
         checkarg_atleast(cmdargv, 'repository name')
 
         pkgbase = cmdargv[1]
         userlist = cmdargv[2:]
-        pkgbase_set_comaintainers(pkgbase, userlist, user, privileged)
+        pkgbase_set_comaintainers(ctx, pkgbase, userlist)
     elif action == 'help':
         cmds = {
             "adopt <name>": "Adopt a package base.",
+            "batch [--per-command]": "Run the commands read from stdin.",
             "disown <name>": "Disown a package base.",
             "flag <name> <comment>": "Flag a package base out-of-date.",
             "help": "Show this help message and exit.",
-            "list-repos": "List all your repositories.",
+            "list-repos [<option>...]": "List all your repositories.",
+            "merge <name> <target>": "Merge a package base into another.",
             "restore <name>": "Restore a deleted package base.",
             "set-comaintainers <name> [...]": "Set package base co-maintainers.",
             "set-keywords <name> [...]": "Change package base keywords.",
@@ -602,14 +1058,10 @@ def main():
 
     try:
         serve(action, cmdargv, user, privileged, remote_addr)
-    except aurweb.exceptions.MaintenanceException:
-        die("The AUR is down due to maintenance. We will be back soon.")
-    except aurweb.exceptions.BannedException:
-        die("The SSH interface is disabled for your IP address.")
     except aurweb.exceptions.InvalidArgumentsException as e:
-        die_with_help('{:s}: {}'.format(action, e))
+        die_with_help(error_message(action, e))
     except aurweb.exceptions.AurwebException as e:
-        die('{:s}: {}'.format(action, e))
+        die(error_message(action, e))
 
 
 if __name__ == '__main__':
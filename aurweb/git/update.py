@@ -10,15 +10,12 @@ import time
 import srcinfo.parse
 import srcinfo.utils
 
+import aurweb.cache
 import aurweb.config
 import aurweb.db
 
-notify_cmd = aurweb.config.get('notifications', 'notify-cmd')
-
-repo_path = aurweb.config.get('serve', 'repo-path')
-repo_regex = aurweb.config.get('serve', 'repo-regex')
-
-max_blob_size = aurweb.config.getint('update', 'max-blob-size')
+_repos = {}
+_type_ids = {}
 
 
 def size_humanize(num):
@@ -70,11 +67,50 @@ def create_pkgbase(conn, pkgbase, user):
                        "(PackageBaseID, UserID) VALUES (?, ?)",
                        [pkgbase_id, userid])
 
-    conn.commit()
-
     return pkgbase_id
 
 
+def get_type_ids(conn, table):
+    """
+    Return the IDs of the dependency or relation types by name. The types
+    never change, so they are only read once per process.
+    """
+    if table not in _type_ids:
+        cur = conn.execute("SELECT Name, ID FROM " + table)
+        _type_ids[table] = dict(cur.fetchall())
+    return _type_ids[table]
+
+
+def get_name_ids(conn, table, names):
+    """
+    Return the IDs of the licenses or groups with the given names by name,
+    creating the missing ones. Concurrent pushes may create the same names;
+    conflicting inserts are ignored and the IDs are read back.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+
+    def lookup(execute, names):
+        cur = execute("SELECT Name, ID FROM `" + table + "` WHERE Name IN (" +
+                      ", ".join(["?"] * len(names)) + ")", names)
+        rows = cur.fetchall()
+        # MySQL compares names case-insensitively.
+        ids = {name.lower(): name_id for name, name_id in rows}
+        ids.update(rows)
+        return {name: ids.get(name, ids.get(name.lower())) for name in names}
+
+    ids = lookup(conn.execute, names)
+    missing = [name for name in names if ids[name] is None]
+    if missing:
+        conn.insert_many("`" + table + "`", ("Name",),
+                         [(name,) for name in missing], ignore=True)
+        # Names inserted by a concurrent push are only visible to a locking
+        # read.
+        ids.update(lookup(conn.execute_locking, missing))
+    return ids
+
+
 def save_metadata(metadata, conn, user):
     # Obtain package base ID and previous maintainer.
     pkgbase = metadata['pkgbase']
@@ -103,6 +139,7 @@ def save_metadata(metadata, conn, user):
                      [pkgbase_id])
     conn.execute("DELETE FROM Packages WHERE PackageBaseID = ?", [pkgbase_id])
 
+    pkginfos = []
     for pkgname in srcinfo.utils.get_package_names(metadata):
         pkginfo = srcinfo.utils.get_merged_package(pkgname, metadata)
 
@@ -112,98 +149,88 @@ def save_metadata(metadata, conn, user):
                                           pkginfo['pkgrel'])
         else:
             ver = '{:s}-{:s}'.format(pkginfo['pkgver'], pkginfo['pkgrel'])
+        pkginfo['version'] = ver
 
         for field in ('pkgdesc', 'url'):
             if field not in pkginfo:
                 pkginfo[field] = None
-
-        # Create a new package.
-        cur = conn.execute("INSERT INTO Packages (PackageBaseID, Name, " +
-                           "Version, Description, URL) " +
-                           "VALUES (?, ?, ?, ?, ?)",
-                           [pkgbase_id, pkginfo['pkgname'], ver,
-                            pkginfo['pkgdesc'], pkginfo['url']])
-        conn.commit()
-        pkgid = cur.lastrowid
+        pkginfos.append(pkginfo)
+
+    # Create the new packages and read back their IDs.
+    conn.insert_many("Packages",
+                     ("PackageBaseID", "Name", "Version", "Description",
+                      "URL"),
+                     [(pkgbase_id, pkginfo['pkgname'], pkginfo['version'],
+                       pkginfo['pkgdesc'], pkginfo['url'])
+                      for pkginfo in pkginfos])
+    cur = conn.execute("SELECT Name, ID FROM Packages " +
+                       "WHERE PackageBaseID = ?", [pkgbase_id])
+    pkgids = dict(cur.fetchall())
+
+    deptypeids = get_type_ids(conn, 'DependencyTypes')
+    reltypeids = get_type_ids(conn, 'RelationTypes')
+    licenseids = get_name_ids(conn, 'Licenses',
+                              [license for pkginfo in pkginfos
+                               for license in pkginfo.get('license', [])])
+    groupids = get_name_ids(conn, 'Groups',
+                            [group for pkginfo in pkginfos
+                             for group in pkginfo.get('groups', [])])
+
+    sources = []
+    depends = []
+    relations = []
+    licenses = []
+    groups = []
+    for pkginfo in pkginfos:
+        pkgid = pkgids[pkginfo['pkgname']]
 
         # Add package sources.
         for source_info in extract_arch_fields(pkginfo, 'source'):
-            conn.execute("INSERT INTO PackageSources (PackageID, Source, " +
-                         "SourceArch) VALUES (?, ?, ?)",
-                         [pkgid, source_info['value'], source_info['arch']])
+            sources.append((pkgid, source_info['value'],
+                            source_info['arch']))
 
         # Add package dependencies.
         for deptype in ('depends', 'makedepends',
                         'checkdepends', 'optdepends'):
-            cur = conn.execute("SELECT ID FROM DependencyTypes WHERE Name = ?",
-                               [deptype])
-            deptypeid = cur.fetchone()[0]
+            deptypeid = deptypeids[deptype]
             for dep_info in extract_arch_fields(pkginfo, deptype):
                 depname, depdesc, depcond = parse_dep(dep_info['value'])
                 deparch = dep_info['arch']
-                conn.execute("INSERT INTO PackageDepends (PackageID, " +
-                             "DepTypeID, DepName, DepDesc, DepCondition, " +
-                             "DepArch) VALUES (?, ?, ?, ?, ?, ?)",
-                             [pkgid, deptypeid, depname, depdesc, depcond,
-                              deparch])
+                depends.append((pkgid, deptypeid, depname, depdesc, depcond,
+                                deparch))
 
         # Add package relations (conflicts, provides, replaces).
         for reltype in ('conflicts', 'provides', 'replaces'):
-            cur = conn.execute("SELECT ID FROM RelationTypes WHERE Name = ?",
-                               [reltype])
-            reltypeid = cur.fetchone()[0]
+            reltypeid = reltypeids[reltype]
             for rel_info in extract_arch_fields(pkginfo, reltype):
                 relname, _, relcond = parse_dep(rel_info['value'])
                 relarch = rel_info['arch']
-                conn.execute("INSERT INTO PackageRelations (PackageID, " +
-                             "RelTypeID, RelName, RelCondition, RelArch) " +
-                             "VALUES (?, ?, ?, ?, ?)",
-                             [pkgid, reltypeid, relname, relcond, relarch])
-
-        # Add package licenses.
-        if 'license' in pkginfo:
-            for license in pkginfo['license']:
-                cur = conn.execute("SELECT ID FROM Licenses WHERE Name = ?",
-                                   [license])
-                row = cur.fetchone()
-                if row:
-                    licenseid = row[0]
-                else:
-                    cur = conn.execute("INSERT INTO Licenses (Name) " +
-                                       "VALUES (?)", [license])
-                    conn.commit()
-                    licenseid = cur.lastrowid
-                conn.execute("INSERT INTO PackageLicenses (PackageID, " +
-                             "LicenseID) VALUES (?, ?)",
-                             [pkgid, licenseid])
-
-        # Add package groups.
-        if 'groups' in pkginfo:
-            for group in pkginfo['groups']:
-                cur = conn.execute("SELECT ID FROM `Groups` WHERE Name = ?",
-                                   [group])
-                row = cur.fetchone()
-                if row:
-                    groupid = row[0]
-                else:
-                    cur = conn.execute("INSERT INTO `Groups` (Name) VALUES (?)",
-                                       [group])
-                    conn.commit()
-                    groupid = cur.lastrowid
-                conn.execute("INSERT INTO PackageGroups (PackageID, "
-                             "GroupID) VALUES (?, ?)", [pkgid, groupid])
+                relations.append((pkgid, reltypeid, relname, relcond,
+                                  relarch))
+
+        # Add package licenses and groups.
+        for licenseid in dict.fromkeys(licenseids[license] for license
+                                       in pkginfo.get('license', [])):
+            licenses.append((pkgid, licenseid))
+        for groupid in dict.fromkeys(groupids[group] for group
+                                     in pkginfo.get('groups', [])):
+            groups.append((pkgid, groupid))
+
+    conn.insert_many("PackageSources", ("PackageID", "Source", "SourceArch"),
+                     sources)
+    conn.insert_many("PackageDepends",
+                     ("PackageID", "DepTypeID", "DepName", "DepDesc",
+                      "DepCondition", "DepArch"), depends)
+    conn.insert_many("PackageRelations",
+                     ("PackageID", "RelTypeID", "RelName", "RelCondition",
+                      "RelArch"), relations)
+    conn.insert_many("PackageLicenses", ("PackageID", "LicenseID"), licenses)
+    conn.insert_many("PackageGroups", ("PackageID", "GroupID"), groups)
 
     # Add user to notification list on adoption.
     if was_orphan:
-        cur = conn.execute("SELECT COUNT(*) FROM PackageNotifications WHERE " +
-                           "PackageBaseID = ? AND UserID = ?",
-                           [pkgbase_id, user_id])
-        if cur.fetchone()[0] == 0:
-            conn.execute("INSERT INTO PackageNotifications " +
-                         "(PackageBaseID, UserID) VALUES (?, ?)",
-                         [pkgbase_id, user_id])
-
-    conn.commit()
+        conn.insert_many("PackageNotifications", ("PackageBaseID", "UserID"),
+                         [(pkgbase_id, user_id)], ignore=True)
 
 
 def update_notify(conn, user, pkgbase_id):
@@ -212,9 +239,31 @@ def update_notify(conn, user, pkgbase_id):
     user_id = int(cur.fetchone()[0])
 
     # Execute the notification script.
+    notify_cmd = aurweb.config.get('notifications', 'notify-cmd')
     subprocess.Popen((notify_cmd, 'update', str(user_id), str(pkgbase_id)))
 
 
+def get_blacklist(conn):
+    """Return the set of blacklisted package names."""
+    def lookup():
+        cur = conn.execute("SELECT Name FROM PackageBlacklist")
+        return [row[0] for row in cur.fetchall()]
+
+    return set(aurweb.cache.lookup('pkgbase-blacklist', lookup))
+
+
+def get_providers(conn):
+    """
+    Return a dict mapping the names provided by official packages to their
+    repositories. aurblup invalidates it when it updates the providers.
+    """
+    def lookup():
+        cur = conn.execute("SELECT Name, Repo FROM OfficialProviders")
+        return dict(cur.fetchall())
+
+    return aurweb.cache.lookup('official-providers', lookup)
+
+
 def die(msg):
     sys.stderr.write("error: {:s}\n".format(msg))
     exit(1)
@@ -232,8 +281,22 @@ def die_commit(msg, commit):
     exit(1)
 
 
+def open_repo():
+    """
+    Open the repository. The handle is kept for the lifetime of the process,
+    so that resident workers open it only once.
+    """
+    path = os.path.abspath(aurweb.config.get('serve', 'repo-path'))
+    if path not in _repos:
+        _repos[path] = pygit2.Repository(path)
+    return _repos[path]
+
+
 def main():
-    repo = pygit2.Repository(repo_path)
+    repo_regex = aurweb.config.get('serve', 'repo-regex')
+    max_blob_size = aurweb.config.getint('update', 'max-blob-size')
+
+    repo = open_repo()
 
     user = os.environ.get("AUR_USER")
     pkgbase = os.environ.get("AUR_PKGBASE")
@@ -256,7 +319,7 @@ def main():
     if refname != "refs/heads/master":
         die("pushing to a branch other than master is restricted")
 
-    conn = aurweb.db.Connection()
+    conn = aurweb.db.get_connection()
 
     # Detect and deny non-fast-forwards.
     if sha1_old != "0" * 40 and not allow_overwrite:
@@ -373,11 +436,8 @@ def main():
     row = cur.fetchone()
     pkgbase_id = row[0] if row else 0
 
-    cur = conn.execute("SELECT Name FROM PackageBlacklist")
-    blacklist = [row[0] for row in cur.fetchall()]
-
-    cur = conn.execute("SELECT Name, Repo FROM OfficialProviders")
-    providers = dict(cur.fetchall())
+    blacklist = get_blacklist(conn)
+    providers = get_providers(conn)
 
     for pkgname in srcinfo.utils.get_package_names(metadata):
         pkginfo = srcinfo.utils.get_merged_package(pkgname, metadata)
@@ -394,12 +454,17 @@ def main():
         if cur.fetchone()[0] > 0:
             die('cannot overwrite package: {:s}'.format(pkgname))
 
-    # Create a new package base if it does not exist yet.
-    if pkgbase_id == 0:
-        pkgbase_id = create_pkgbase(conn, pkgbase, user)
+    for attempt in aurweb.db.transaction(conn):
+        with attempt:
+            # Create a new package base if it does not exist yet.
+            if pkgbase_id == 0:
+                saved_pkgbase_id = create_pkgbase(conn, pkgbase, user)
+            else:
+                saved_pkgbase_id = pkgbase_id
 
-    # Store package base details in the database.
-    save_metadata(metadata, conn, user)
+            # Store package base details in the database.
+            save_metadata(metadata, conn, user)
+    pkgbase_id = saved_pkgbase_id
 
     # Create (or update) a branch with the name of the package base for better
     # accessibility.
@@ -417,10 +482,6 @@ def main():
     # Send package update notifications.
     update_notify(conn, user, pkgbase_id)
 
-    # Close the database.
-    cur.close()
-    conn.close()
-
 
 if __name__ == '__main__':
     main()
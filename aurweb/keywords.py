@@ -0,0 +1,50 @@
+"""
+Queries on the keywords of package bases.
+
+Keywords are looked up through the KeywordsKeywordPackageBaseID index, which
+covers the keyword to package base mapping, so finding the package bases with
+a keyword never scans PackageKeywords.
+"""
+
+
+def get_keywords(conn, pkgbase_id):
+    cur = conn.execute("SELECT Keyword FROM PackageKeywords " +
+                       "WHERE PackageBaseID = ?", [pkgbase_id])
+    return [row[0] for row in cur.fetchall()]
+
+
+def set_keywords(conn, pkgbase_id, keywords):
+    """
+    Replace the keywords of a package base, only touching the rows which
+    change. Return the number of keywords added and removed.
+    """
+    keywords_old = set(get_keywords(conn, pkgbase_id))
+    keywords_new = set(keywords)
+
+    removed = sorted(keywords_old - keywords_new)
+    if removed:
+        conn.execute("DELETE FROM PackageKeywords WHERE PackageBaseID = ? " +
+                     "AND Keyword IN (" + ", ".join(["?"] * len(removed)) +
+                     ")", [pkgbase_id] + removed)
+
+    # Keywords are set from a single command, which holds far fewer of them
+    # than the placeholder limit, so one plain statement inserts them all
+    # without the statement size lookup of insert_many().
+    added = sorted(keywords_new - keywords_old)
+    if added:
+        conn.execute("INSERT INTO PackageKeywords (PackageBaseID, Keyword) " +
+                     "VALUES " + ", ".join(["(?, ?)"] * len(added)),
+                     [value for keyword in added
+                      for value in (pkgbase_id, keyword)])
+
+    return len(added), len(removed)
+
+
+def pkgbases_with_keyword(conn, keyword):
+    """Return the IDs and names of the package bases having a keyword."""
+    cur = conn.execute("SELECT PackageBases.ID, PackageBases.Name " +
+                       "FROM PackageKeywords INNER JOIN PackageBases " +
+                       "ON PackageBases.ID = PackageKeywords.PackageBaseID " +
+                       "WHERE PackageKeywords.Keyword = ? " +
+                       "ORDER BY PackageBases.Name", [keyword])
+    return cur.fetchall()
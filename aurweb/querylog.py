@@ -0,0 +1,193 @@
+"""
+Instrumentation of the SQL statements executed through aurweb.db.
+
+Statement logging is enabled by the sql_debug option. Every statement is then
+timed and aggregated by its fingerprint, i.e. the statement text with literals
+replaced by placeholders. Statements slower than sql_slow_query_threshold
+seconds are reported as they happen, and a summary of the sql_summary_size
+most expensive statements and of transaction retries is written when the
+process exits. If sql_log_file is set, one JSON object per statement is
+appended to that file, and slow query reports and the summary go there instead
+of standard error.
+
+Additional consumers can subscribe to statement records with add_listener().
+"""
+
+import atexit
+import json
+import os
+import re
+import sys
+import time
+
+import aurweb.config
+
+_enabled = None
+_listeners = []
+_stats = {}
+_retries = {}
+_sink = None
+
+_re_string = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_re_number = re.compile(r'\b\d+(?:\.\d+)?\b')
+_re_list = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_re_space = re.compile(r'\s+')
+
+
+class StatementStats:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.callsites = set()
+
+    def add(self, elapsed, rowcount, callsite):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if rowcount and rowcount > 0:
+            self.rows += rowcount
+        self.callsites.add(callsite)
+
+
+def fingerprint(query):
+    """Normalize a statement so that all its invocations compare equal."""
+    query = _re_string.sub('?', query)
+    query = _re_number.sub('?', query)
+    query = _re_space.sub(' ', query).strip()
+    return _re_list.sub('(...)', query)
+
+
+def callsite():
+    """Return the location of the innermost caller outside of aurweb.db."""
+    skip = (__file__, os.path.join(os.path.dirname(__file__), 'db.py'))
+    frame = sys._getframe(1)
+    while frame and frame.f_code.co_filename in skip:
+        frame = frame.f_back
+    if not frame:
+        return None
+    return '{}:{:d} ({})'.format(frame.f_code.co_filename, frame.f_lineno,
+                                 frame.f_code.co_name)
+
+
+def enabled():
+    global _enabled
+
+    if _enabled is None:
+        _enabled = aurweb.config.getboolean_with_fallback('options',
+                                                          'sql_debug', False)
+        if _enabled:
+            atexit.register(dump_summary)
+    return _enabled or bool(_listeners)
+
+
+def add_listener(listener):
+    """
+    Register a callable which receives a dictionary for every statement
+    executed, with the keys statement, fingerprint, elapsed, rows and
+    callsite.
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    _listeners.remove(listener)
+
+
+def _write(record):
+    global _sink
+
+    path = aurweb.config.get_with_fallback('options', 'sql_log_file', '')
+    if not path:
+        return False
+    if _sink is None:
+        _sink = open(path, 'a')
+    _sink.write(json.dumps(record) + '\n')
+    _sink.flush()
+    return True
+
+
+def record(query, elapsed, rowcount):
+    site = callsite()
+    fp = fingerprint(query)
+    rows = rowcount if rowcount is not None and rowcount >= 0 else None
+    entry = {
+        'statement': query,
+        'fingerprint': fp,
+        'elapsed': elapsed,
+        'rows': rows,
+        'callsite': site,
+    }
+
+    for listener in _listeners:
+        listener(entry)
+
+    if not _enabled:
+        return
+
+    if fp not in _stats:
+        _stats[fp] = StatementStats(fp)
+    _stats[fp].add(elapsed, rows, site)
+
+    entry['time'] = time.time()
+    entry['pid'] = os.getpid()
+    written = _write(entry)
+
+    threshold = float(aurweb.config.get_with_fallback(
+        'options', 'sql_slow_query_threshold', '0.5'))
+    if elapsed >= threshold and not written:
+        sys.stderr.write('slow query ({:.3f}s) at {}: {}\n'.format(
+                         elapsed, site, fp))
+
+
+def record_retry(error):
+    """Count a transaction retried because of the given error."""
+    reason = getattr(error, 'errno', None) or str(error)
+    _retries[reason] = _retries.get(reason, 0) + 1
+
+    if _enabled:
+        _write({'retry': str(error), 'callsite': callsite(),
+                'time': time.time(), 'pid': os.getpid()})
+
+
+def retries():
+    """Return the number of transaction retries, grouped by error."""
+    return dict(_retries)
+
+
+def summary(limit=None):
+    """Return the statement statistics, most expensive statements first."""
+    stats = sorted(_stats.values(), key=lambda s: s.total, reverse=True)
+    return stats[:limit] if limit else stats
+
+
+def dump_summary():
+    if not _stats and not _retries:
+        return
+
+    limit = aurweb.config.getint_with_fallback('options', 'sql_summary_size',
+                                               10)
+    stats = summary(limit)
+    records = [{
+        'fingerprint': s.fingerprint,
+        'calls': s.calls,
+        'total': s.total,
+        'max': s.max,
+        'rows': s.rows,
+        'callsites': sorted(s.callsites),
+    } for s in stats]
+    if _write({'summary': records, 'retries': retries(),
+               'pid': os.getpid()}):
+        return
+
+    sys.stderr.write('SQL summary ({:d} statements, {:.3f}s):\n'.format(
+                     sum(s.calls for s in _stats.values()),
+                     sum(s.total for s in _stats.values())))
+    for s in stats:
+        sys.stderr.write('  {:6d} {:9.3f}s {:9.3f}s  {}\n'.format(
+                         s.calls, s.total, s.max, s.fingerprint))
+    for reason, count in _retries.items():
+        sys.stderr.write('  {:6d} transaction retries: {}\n'.format(
+                         count, reason))
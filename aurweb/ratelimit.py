@@ -0,0 +1,85 @@
+"""
+Token buckets kept in files, for rate limiting without database writes.
+
+Each bucket is a small file in a state directory, preferably on a tmpfs,
+holding the number of tokens left and the time they were counted. A bucket
+refills at a constant rate up to its capacity; a missing bucket is full.
+Buckets are updated under an exclusive lock, so that all processes of a host
+share them.
+
+File names are hashes of the bucket keys, which may contain user names and IP
+addresses.
+"""
+
+import fcntl
+import hashlib
+import os
+import time
+
+
+def _path(state_dir, key):
+    return os.path.join(state_dir, hashlib.sha1(key.encode()).hexdigest())
+
+
+def _read(fd, now, capacity, rate):
+    try:
+        tokens, stamp = os.pread(fd, 64, 0).split()
+        tokens = float(tokens) + max(now - float(stamp), 0) * rate
+    except ValueError:
+        tokens = capacity
+    return min(tokens, capacity)
+
+
+def _write(fd, tokens, now):
+    data = '{:.3f} {:.3f}\n'.format(tokens, now).encode()
+    os.ftruncate(fd, 0)
+    os.pwrite(fd, data, 0)
+
+
+def take(state_dir, keys, cost, capacity, rate):
+    """
+    Take cost tokens from each of the buckets named by keys, if all of them
+    hold enough. Return 0 if the tokens were taken, or else the number of
+    seconds until they can be, which is infinite if cost exceeds capacity.
+    """
+    now = time.time()
+    fds = []
+    try:
+        # Lock in a fixed order, so that processes taking tokens from the same
+        # buckets cannot deadlock.
+        for path in sorted(set(_path(state_dir, key) for key in keys)):
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            fds.append(fd)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+        levels = [_read(fd, now, capacity, rate) for fd in fds]
+        wait = 0
+        for tokens in levels:
+            if tokens >= cost:
+                continue
+            if cost > capacity or rate <= 0:
+                return float('inf')
+            wait = max(wait, (cost - tokens) / rate)
+        if wait:
+            return wait
+
+        for fd, tokens in zip(fds, levels):
+            _write(fd, tokens - cost, now)
+        return 0
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def cleanup(state_dir, capacity, rate):
+    """Remove the buckets which have been full again for a while."""
+    if rate <= 0:
+        return
+    limit = time.time() - capacity / rate
+    with os.scandir(state_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < limit:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
@@ -108,7 +108,8 @@ PackageBases = Table(
     Column('SubmitterUID', ForeignKey('Users.ID', ondelete='SET NULL')),   # who submitted it?
     Column('MaintainerUID', ForeignKey('Users.ID', ondelete='SET NULL')),  # User
     Column('PackagerUID', ForeignKey('Users.ID', ondelete='SET NULL')),    # Last packager
-    Index('BasesMaintainerUID', 'MaintainerUID'),
+    Index('BasesMaintainerUIDModifiedTS', 'MaintainerUID', 'ModifiedTS'),
+    Index('BasesMaintainerUIDName', 'MaintainerUID', 'Name'),
     Index('BasesNumVotes', 'NumVotes'),
     Index('BasesPackagerUID', 'PackagerUID'),
     Index('BasesSubmitterUID', 'SubmitterUID'),
@@ -121,6 +122,7 @@ PackageKeywords = Table(
     'PackageKeywords', metadata,
     Column('PackageBaseID', ForeignKey('PackageBases.ID', ondelete='CASCADE'), primary_key=True, nullable=False),
     Column('Keyword', String(255), primary_key=True, nullable=False, server_default=text("''")),
+    Index('KeywordsKeywordPackageBaseID', 'Keyword', 'PackageBaseID'),
     mysql_engine='InnoDB',
 )
 
@@ -365,11 +367,14 @@ TU_Votes = Table(
 )
 
 
-# Malicious user banning
+# Malicious user banning. A network ban and a ban of its first address
+# cannot coexist, since IPAddress is the primary key.
 Bans = Table(
     'Bans', metadata,
     Column('IPAddress', String(45), primary_key=True),
+    Column('PrefixLength', TINYINT(unsigned=True)),
     Column('BanTS', TIMESTAMP, nullable=False),
+    Index('BansPrefixLength', 'PrefixLength'),
     mysql_engine='InnoDB',
 )
 
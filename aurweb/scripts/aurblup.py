@@ -3,15 +3,16 @@
 import pyalpm
 import re
 
+import aurweb.cache
 import aurweb.config
 import aurweb.db
 
-db_path = aurweb.config.get('aurblup', 'db-path')
-sync_dbs = aurweb.config.get('aurblup', 'sync-dbs').split(' ')
-server = aurweb.config.get('aurblup', 'server')
-
 
 def main():
+    db_path = aurweb.config.get('aurblup', 'db-path')
+    sync_dbs = aurweb.config.get('aurblup', 'sync-dbs').split(' ')
+    server = aurweb.config.get('aurblup', 'server')
+
     blacklist = set()
     providers = set()
     repomap = dict()
@@ -34,20 +35,20 @@ def main():
                 providers.add((pkg.name, provisionname))
                 repomap[(pkg.name, provisionname)] = repo.name
 
-    conn = aurweb.db.Connection()
-
-    cur = conn.execute("SELECT Name, Provides FROM OfficialProviders")
-    oldproviders = set(cur.fetchall())
-
-    for pkg, provides in oldproviders.difference(providers):
-        conn.execute("DELETE FROM OfficialProviders "
-                     "WHERE Name = ? AND Provides = ?", [pkg, provides])
-    for pkg, provides in providers.difference(oldproviders):
-        repo = repomap[(pkg, provides)]
-        conn.execute("INSERT INTO OfficialProviders (Name, Repo, Provides) "
-                     "VALUES (?, ?, ?)", [pkg, repo, provides])
-
-    conn.commit()
+    for attempt in aurweb.db.transaction(aurweb.db.Connection()):
+        with attempt as conn:
+            cur = conn.execute("SELECT Name, Provides FROM OfficialProviders")
+            oldproviders = set(cur.fetchall())
+
+            conn.executemany("DELETE FROM OfficialProviders "
+                             "WHERE Name = ? AND Provides = ?",
+                             oldproviders.difference(providers))
+            conn.insert_many("OfficialProviders",
+                             ("Name", "Repo", "Provides"),
+                             [(pkg, repomap[(pkg, provides)], provides) for
+                              pkg, provides in
+                              providers.difference(oldproviders)])
+            conn.on_commit(lambda: aurweb.cache.delete('official-providers'))
     conn.close()
 
 
@@ -6,13 +6,13 @@ import gzip
 import aurweb.config
 import aurweb.db
 
-packagesfile = aurweb.config.get('mkpkglists', 'packagesfile')
-pkgbasefile = aurweb.config.get('mkpkglists', 'pkgbasefile')
-userfile = aurweb.config.get('mkpkglists', 'userfile')
-
 
 def main():
-    conn = aurweb.db.Connection()
+    packagesfile = aurweb.config.get('mkpkglists', 'packagesfile')
+    pkgbasefile = aurweb.config.get('mkpkglists', 'pkgbasefile')
+    userfile = aurweb.config.get('mkpkglists', 'userfile')
+
+    conn = aurweb.db.get_connection(readonly=True)
 
     datestr = datetime.datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
     pkglist_header = "# AUR package list, generated on " + datestr
@@ -21,24 +21,22 @@ def main():
 
     with gzip.open(packagesfile, "w") as f:
         f.write(bytes(pkglist_header + "\n", "UTF-8"))
-        cur = conn.execute("SELECT Packages.Name FROM Packages " +
+        rows = conn.stream("SELECT Packages.Name FROM Packages " +
                            "INNER JOIN PackageBases " +
                            "ON PackageBases.ID = Packages.PackageBaseID " +
                            "WHERE PackageBases.PackagerUID IS NOT NULL")
-        f.writelines([bytes(x[0] + "\n", "UTF-8") for x in cur.fetchall()])
+        f.writelines(bytes(x[0] + "\n", "UTF-8") for x in rows)
 
     with gzip.open(pkgbasefile, "w") as f:
         f.write(bytes(pkgbaselist_header + "\n", "UTF-8"))
-        cur = conn.execute("SELECT Name FROM PackageBases " +
+        rows = conn.stream("SELECT Name FROM PackageBases " +
                            "WHERE PackagerUID IS NOT NULL")
-        f.writelines([bytes(x[0] + "\n", "UTF-8") for x in cur.fetchall()])
+        f.writelines(bytes(x[0] + "\n", "UTF-8") for x in rows)
 
     with gzip.open(userfile, "w") as f:
         f.write(bytes(userlist_header + "\n", "UTF-8"))
-        cur = conn.execute("SELECT UserName FROM Users")
-        f.writelines([bytes(x[0] + "\n", "UTF-8") for x in cur.fetchall()])
-
-    conn.close()
+        rows = conn.stream("SELECT UserName FROM Users")
+        f.writelines(bytes(x[0] + "\n", "UTF-8") for x in rows)
 
 
 if __name__ == '__main__':
@@ -2,7 +2,6 @@
 
 import email.mime.text
 import email.utils
-import smtplib
 import subprocess
 import sys
 import textwrap
@@ -11,7 +10,9 @@ import aurweb.config
 import aurweb.db
 import aurweb.l10n
 
-aur_location = aurweb.config.get('options', 'aur_location')
+
+def aur_location():
+    return aurweb.config.get('options', 'aur_location')
 
 
 def headers_msgid(thread_id):
@@ -96,6 +97,8 @@ class Notification:
                 p.communicate(msg.as_bytes())
             else:
                 # send email using smtplib; no local MTA required
+                import smtplib
+
                 server_addr = aurweb.config.get('notifications', 'smtp-server')
                 server_port = aurweb.config.getint('notifications', 'smtp-port')
                 use_ssl = aurweb.config.getboolean('notifications', 'smtp-use-ssl')
@@ -148,7 +151,7 @@ class ResetKeyNotification(Notification):
                 lang).format(user=self._username)
 
     def get_refs(self):
-        return (aur_location + '/passreset/?resetkey=' + self._resetkey,)
+        return (aur_location() + '/passreset/?resetkey=' + self._resetkey,)
 
 
 class WelcomeNotification(ResetKeyNotification):
@@ -201,8 +204,8 @@ class CommentNotification(Notification):
         return body
 
     def get_refs(self):
-        return (aur_location + '/account/' + self._user + '/',
-                aur_location + '/pkgbase/' + self._pkgbase + '/')
+        return (aur_location() + '/account/' + self._user + '/',
+                aur_location() + '/pkgbase/' + self._pkgbase + '/')
 
     def get_headers(self):
         thread_id = '<pkg-notifications-' + self._pkgbase + \
@@ -246,8 +249,8 @@ class UpdateNotification(Notification):
         return body
 
     def get_refs(self):
-        return (aur_location + '/account/' + self._user + '/',
-                aur_location + '/pkgbase/' + self._pkgbase + '/')
+        return (aur_location() + '/account/' + self._user + '/',
+                aur_location() + '/pkgbase/' + self._pkgbase + '/')
 
     def get_headers(self):
         thread_id = '<pkg-notifications-' + self._pkgbase + \
@@ -290,8 +293,8 @@ class FlagNotification(Notification):
         return body
 
     def get_refs(self):
-        return (aur_location + '/pkgbase/' + self._pkgbase + '/',
-                aur_location + '/account/' + self._user + '/')
+        return (aur_location() + '/pkgbase/' + self._pkgbase + '/',
+                aur_location() + '/account/' + self._user + '/')
 
 
 class OwnershipEventNotification(Notification):
@@ -320,8 +323,8 @@ class OwnershipEventNotification(Notification):
                                     lang).format(pkgbase=self._pkgbase)
 
     def get_refs(self):
-        return (aur_location + '/pkgbase/' + self._pkgbase + '/',
-                aur_location + '/account/' + self._user + '/')
+        return (aur_location() + '/pkgbase/' + self._pkgbase + '/',
+                aur_location() + '/account/' + self._user + '/')
 
 
 class AdoptNotification(OwnershipEventNotification):
@@ -340,15 +343,18 @@ class DisownNotification(OwnershipEventNotification):
 
 
 class ComaintainershipEventNotification(Notification):
-    def __init__(self, conn, uid, pkgbase_id):
+    def __init__(self, conn, uids, pkgbase_id):
+        """uids is a user ID or a comma-separated list of them."""
         self._pkgbase = pkgbase_from_id(conn, pkgbase_id)
+        uids = [int(uid) for uid in str(uids).split(',')]
         cur = conn.execute('SELECT Email, LangPreference FROM Users ' +
-                           'WHERE ID = ?', [uid])
-        self._to, self._lang = cur.fetchone()
+                           'WHERE ID IN (' + ', '.join(['?'] * len(uids)) +
+                           ') ORDER BY ID', uids)
+        self._recipients = cur.fetchall()
         super().__init__()
 
     def get_recipients(self):
-        return [(self._to, self._lang)]
+        return self._recipients
 
     def get_subject(self, lang):
         return self._l10n.translate('AUR Co-Maintainer Notification for '
@@ -356,7 +362,7 @@ class ComaintainershipEventNotification(Notification):
                                     lang).format(pkgbase=self._pkgbase)
 
     def get_refs(self):
-        return (aur_location + '/pkgbase/' + self._pkgbase + '/',)
+        return (aur_location() + '/pkgbase/' + self._pkgbase + '/',)
 
 
 class ComaintainerAddNotification(ComaintainershipEventNotification):
@@ -416,10 +422,10 @@ class DeleteNotification(Notification):
                                              pkgbase=self._old_pkgbase)
 
     def get_refs(self):
-        refs = (aur_location + '/account/' + self._user + '/',
-                aur_location + '/pkgbase/' + self._old_pkgbase + '/')
+        refs = (aur_location() + '/account/' + self._user + '/',
+                aur_location() + '/pkgbase/' + self._old_pkgbase + '/')
         if self._new_pkgbase:
-            refs += (aur_location + '/pkgbase/' + self._new_pkgbase + '/',)
+            refs += (aur_location() + '/pkgbase/' + self._new_pkgbase + '/',)
         return refs
 
 
@@ -466,10 +472,10 @@ class RequestOpenNotification(Notification):
         return body
 
     def get_refs(self):
-        refs = (aur_location + '/account/' + self._user + '/',
-                aur_location + '/pkgbase/' + self._pkgbase + '/')
+        refs = (aur_location() + '/account/' + self._user + '/',
+                aur_location() + '/pkgbase/' + self._pkgbase + '/')
         if self._merge_into:
-            refs += (aur_location + '/pkgbase/' + self._merge_into + '/',)
+            refs += (aur_location() + '/pkgbase/' + self._merge_into + '/',)
         return refs
 
     def get_headers(self):
@@ -531,7 +537,7 @@ class RequestCloseNotification(Notification):
 
     def get_refs(self):
         if self._user:
-            return (aur_location + '/account/' + self._user + '/',)
+            return (aur_location() + '/account/' + self._user + '/',)
         else:
             return ()
 
@@ -565,34 +571,46 @@ class TUVoteReminderNotification(Notification):
                 lang).format(id=self._vote_id)
 
     def get_refs(self):
-        return (aur_location + '/tu/?id=' + str(self._vote_id),)
+        return (aur_location() + '/tu/?id=' + str(self._vote_id),)
+
+
+action_map = {
+    'send-resetkey': ResetKeyNotification,
+    'welcome': WelcomeNotification,
+    'comment': CommentNotification,
+    'update': UpdateNotification,
+    'flag': FlagNotification,
+    'adopt': AdoptNotification,
+    'disown': DisownNotification,
+    'comaintainer-add': ComaintainerAddNotification,
+    'comaintainer-remove': ComaintainerRemoveNotification,
+    'delete': DeleteNotification,
+    'request-open': RequestOpenNotification,
+    'request-close': RequestCloseNotification,
+    'tu-vote-reminder': TUVoteReminderNotification,
+}
+
+
+def build(conn, action, *args):
+    """
+    Build the notification for an action from the current state of the
+    database. It can be sent later, after the objects it describes are gone.
+    """
+    return action_map[action](conn, *map(str, args))
 
 
 def main():
     action = sys.argv[1]
-    action_map = {
-        'send-resetkey': ResetKeyNotification,
-        'welcome': WelcomeNotification,
-        'comment': CommentNotification,
-        'update': UpdateNotification,
-        'flag': FlagNotification,
-        'adopt': AdoptNotification,
-        'disown': DisownNotification,
-        'comaintainer-add': ComaintainerAddNotification,
-        'comaintainer-remove': ComaintainerRemoveNotification,
-        'delete': DeleteNotification,
-        'request-open': RequestOpenNotification,
-        'request-close': RequestCloseNotification,
-        'tu-vote-reminder': TUVoteReminderNotification,
-    }
-
-    conn = aurweb.db.Connection()
-
-    notification = action_map[action](conn, *sys.argv[2:])
+
+    # Other notifications are sent right after the change they describe was
+    # committed by another process, which a lagging replica may not have seen
+    # yet. Reminders are about votes created long before.
+    conn = aurweb.db.get_connection(readonly=(action == 'tu-vote-reminder'))
+
+    notification = build(conn, action, *sys.argv[2:])
     notification.send()
 
     conn.commit()
-    conn.close()
 
 
 if __name__ == '__main__':
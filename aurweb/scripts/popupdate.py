@@ -14,7 +14,7 @@ def main():
 
     now = int(time.time())
     conn.execute("UPDATE PackageBases SET Popularity = (" +
-                 "SELECT COALESCE(SUM(POWER(0.98, (? - VoteTS) / 86400)), 0.0) " +
+                 "SELECT COALESCE(SUM(POWER(0.98, (? - VoteTS) / 86400.0)), 0.0) " +
                  "FROM PackageVotes WHERE PackageVotes.PackageBaseID = " +
                  "PackageBases.ID AND NOT VoteTS IS NULL)", [now])
 
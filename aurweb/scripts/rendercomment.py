@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import re
-import pygit2
 import sys
 import bleach
 import markdown
@@ -9,9 +8,6 @@ import markdown
 import aurweb.config
 import aurweb.db
 
-repo_path = aurweb.config.get('serve', 'repo-path')
-commit_uri = aurweb.config.get('options', 'commit_uri')
-
 
 class LinkifyExtension(markdown.extensions.Extension):
     """
@@ -58,28 +54,41 @@ class GitCommitsInlineProcessor(markdown.inlinepatterns.InlineProcessor):
     Only commit references that do exist are linkified. Hashes are shortened to
     shorter non-ambiguous prefixes. Only hashes with at least 7 digits are
     considered.
+
+    The repository is only opened once a comment contains something that looks
+    like a hash, since most comments do not.
     """
 
-    _repo = pygit2.Repository(repo_path)
+    _repo = None
 
     def __init__(self, md, head):
         self._head = head
+        self._commit_uri = aurweb.config.get('options', 'commit_uri')
         super().__init__(r'\b([0-9a-f]{7,40})\b', md)
 
+    @classmethod
+    def _open_repo(cls):
+        if cls._repo is None:
+            import pygit2
+            repo_path = aurweb.config.get('serve', 'repo-path')
+            cls._repo = pygit2.Repository(repo_path)
+        return cls._repo
+
     def handleMatch(self, m, data):
+        repo = self._open_repo()
         oid = m.group(1)
-        if oid not in self._repo:
+        if oid not in repo:
             # Unkwown OID; preserve the orginal text.
             return None, None, None
 
         prefixlen = 12
         while prefixlen < 40:
-            if oid[:prefixlen] in self._repo:
+            if oid[:prefixlen] in repo:
                 break
             prefixlen += 1
 
         el = markdown.util.etree.Element('a')
-        el.set('href', commit_uri % (self._head, oid[:prefixlen]))
+        el.set('href', self._commit_uri % (self._head, oid[:prefixlen]))
         el.text = markdown.util.AtomicString(oid[:prefixlen])
         return el, m.start(0), m.end(0)
 
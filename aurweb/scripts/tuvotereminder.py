@@ -6,11 +6,11 @@ import time
 import aurweb.config
 import aurweb.db
 
-notify_cmd = aurweb.config.get('notifications', 'notify-cmd')
-
 
 def main():
-    conn = aurweb.db.Connection()
+    notify_cmd = aurweb.config.get('notifications', 'notify-cmd')
+
+    conn = aurweb.db.get_connection(readonly=True)
 
     now = int(time.time())
     filter_from = now + 500
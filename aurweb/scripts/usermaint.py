@@ -2,7 +2,9 @@
 
 import time
 
+import aurweb.config
 import aurweb.db
+import aurweb.ratelimit
 
 
 def main():
@@ -17,6 +19,13 @@ def main():
     conn.commit()
     conn.close()
 
+    state_dir = aurweb.config.get_with_fallback('serve-ratelimit',
+                                                'state-dir', '')
+    if state_dir:
+        capacity = aurweb.config.getint('serve-ratelimit', 'capacity')
+        rate = float(aurweb.config.get('serve-ratelimit', 'refill-rate'))
+        aurweb.ratelimit.cleanup(state_dir, capacity, rate)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,32 @@
+"""add Bans.PrefixLength
+
+A row with a PrefixLength bans the network starting at IPAddress. IPAddress
+remains the primary key, which the web interface relies on, so a network ban
+and a ban of its first address cannot coexist. The network ban covers that
+address anyway.
+
+Revision ID: 3a6f1c5e9b2d
+Revises: f47cad5d6d03
+Create Date: 2026-10-17 21:40:12.518220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = '3a6f1c5e9b2d'
+down_revision = 'f47cad5d6d03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Bans', sa.Column('PrefixLength', mysql.TINYINT(unsigned=True), nullable=True))
+    op.create_index('BansPrefixLength', 'Bans', ['PrefixLength'])
+
+
+def downgrade():
+    op.drop_index('BansPrefixLength', table_name='Bans')
+    op.drop_column('Bans', 'PrefixLength')
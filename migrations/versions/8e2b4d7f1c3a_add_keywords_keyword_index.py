@@ -0,0 +1,23 @@
+"""add an index on PackageKeywords.Keyword
+
+Revision ID: 8e2b4d7f1c3a
+Revises: 3a6f1c5e9b2d
+Create Date: 2026-10-17 21:58:40.203114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2b4d7f1c3a'
+down_revision = '3a6f1c5e9b2d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('KeywordsKeywordPackageBaseID', 'PackageKeywords', ['Keyword', 'PackageBaseID'], unique=False)
+
+
+def downgrade():
+    op.drop_index('KeywordsKeywordPackageBaseID', table_name='PackageKeywords')
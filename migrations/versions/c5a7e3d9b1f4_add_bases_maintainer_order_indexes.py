@@ -0,0 +1,27 @@
+"""index PackageBases by maintainer and name or modification time
+
+Revision ID: c5a7e3d9b1f4
+Revises: 8e2b4d7f1c3a
+Create Date: 2026-10-17 22:14:05.931842
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a7e3d9b1f4'
+down_revision = '8e2b4d7f1c3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('BasesMaintainerUIDModifiedTS', 'PackageBases', ['MaintainerUID', 'ModifiedTS'], unique=False)
+    op.create_index('BasesMaintainerUIDName', 'PackageBases', ['MaintainerUID', 'Name'], unique=False)
+    op.drop_index('BasesMaintainerUID', table_name='PackageBases')
+
+
+def downgrade():
+    op.create_index('BasesMaintainerUID', 'PackageBases', ['MaintainerUID'], unique=False)
+    op.drop_index('BasesMaintainerUIDName', table_name='PackageBases')
+    op.drop_index('BasesMaintainerUIDModifiedTS', table_name='PackageBases')
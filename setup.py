@@ -20,8 +20,9 @@ setup(
     entry_points={
         'console_scripts': [
             'aurweb-git-auth = aurweb.git.auth:main',
-            'aurweb-git-serve = aurweb.git.serve:main',
-            'aurweb-git-update = aurweb.git.update:main',
+            'aurweb-git-daemon = aurweb.git.daemon:main',
+            'aurweb-git-serve = aurweb.git.client:serve',
+            'aurweb-git-update = aurweb.git.client:update',
             'aurweb-aurblup = aurweb.scripts.aurblup:main',
             'aurweb-mkpkglists = aurweb.scripts.mkpkglists:main',
             'aurweb-notify = aurweb.scripts.notify:main',
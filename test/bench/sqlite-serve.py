@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Measure git-serve throughput on SQLite under concurrent access.
+
+Each profile below is run against a fresh database. A number of worker
+processes then vote, unvote and list repositories in a loop, all against the
+same package base. The output lists the operations per second and the number
+of operations which failed, usually with "database is locked".
+
+Usage: python test/bench/sqlite-serve.py [-w WORKERS] [-n ITERATIONS]
+"""
+
+import argparse
+import contextlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROFILES = {
+    # The settings of a plain sqlite3.connect(), which waits up to 5 s for
+    # a lock.
+    'baseline': {
+        'sqlite-journal-mode': 'DELETE',
+        'sqlite-busy-timeout': '5000',
+        'sqlite-synchronous': 'FULL',
+        'sqlite-mmap-size': '0',
+        'sqlite-cache-size': '-2000',
+    },
+    # The defaults shipped in conf/config.defaults.
+    'tuned': {},
+}
+
+CONFIG = '''
+[database]
+backend = sqlite
+name = {dir}/aur.db
+{options}
+
+[options]
+enable-maintenance = 0
+maintenance-exceptions =
+
+[notifications]
+notify-cmd = /bin/true
+
+[serve]
+repo-path = {dir}/aur.git/
+repo-regex = [a-z0-9][a-z0-9.+_-]*$
+git-shell-cmd = /bin/true
+git-update-cmd = /bin/true
+ssh-cmdline = ssh aur@localhost
+'''
+
+
+def worker(user, iterations):
+    import aurweb.git.serve
+
+    failures = 0
+    with open(os.devnull, 'w') as devnull:
+        for i in range(iterations):
+            try:
+                ctx = aurweb.git.serve.ServeContext(user)
+                aurweb.git.serve.pkgbase_vote(ctx, 'bench')
+                aurweb.git.serve.pkgbase_unvote(ctx, 'bench')
+                with contextlib.redirect_stdout(devnull):
+                    aurweb.git.serve.list_repos(ctx)
+            except Exception:
+                failures += 1
+    print(failures)
+
+
+def populate(users):
+    import aurweb.db
+
+    conn = aurweb.db.Connection()
+    conn.execute("INSERT INTO Users (ID, UserName, Passwd, Email) " +
+                 "VALUES (1, 'maintainer', '!', 'maintainer@localhost')")
+    conn.insert_many('Users', ('UserName', 'Passwd', 'Email'),
+                     [('user{:d}'.format(i), '!',
+                       'user{:d}@localhost'.format(i)) for i in range(users)])
+    conn.execute("INSERT INTO PackageBases (Name, SubmittedTS, ModifiedTS, " +
+                 "SubmitterUID, MaintainerUID, PackagerUID, " +
+                 "FlaggerComment) VALUES ('bench', 0, 0, 1, 1, 1, '')")
+    conn.commit()
+    conn.close()
+
+
+def setup(directory, options, workers):
+    config = os.path.join(directory, 'config')
+    with open(config, 'w') as f:
+        f.write(CONFIG.format(dir=directory, options='\n'.join(
+            '{} = {}'.format(k, v) for k, v in options.items())))
+
+    env = dict(os.environ, AUR_CONFIG=config)
+    subprocess.run([sys.executable, '-m', 'aurweb.initdb', '--no-alembic'],
+                   env=env, check=True)
+
+    subprocess.run([sys.executable, __file__, '--populate', str(workers)],
+                   env=env, check=True)
+    return env
+
+
+def run(name, options, workers, iterations):
+    with tempfile.TemporaryDirectory() as directory:
+        env = setup(directory, options, workers)
+
+        start = time.monotonic()
+        procs = [subprocess.Popen([sys.executable, __file__, '--worker',
+                                   'user{:d}'.format(i), str(iterations)],
+                                  env=env, stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL)
+                 for i in range(workers)]
+        failures = sum(int(proc.communicate()[0] or 0) for proc in procs)
+        elapsed = time.monotonic() - start
+
+    ops = workers * iterations * 3
+    print('{:10s} {:8.1f} ops/s {:6d} failed'.format(
+          name, (ops - 3 * failures) / elapsed, failures))
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--worker':
+        worker(sys.argv[2], int(sys.argv[3]))
+        return
+    if len(sys.argv) == 3 and sys.argv[1] == '--populate':
+        populate(int(sys.argv[2]))
+        return
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark concurrent git-serve operations on SQLite.')
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help='number of concurrent processes')
+    parser.add_argument('-n', '--iterations', type=int, default=50,
+                        help='iterations per process')
+    args = parser.parse_args()
+
+    for name, options in PROFILES.items():
+        run(name, options, args.workers, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
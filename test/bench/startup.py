@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Measure the startup cost of the console scripts listed in setup.py.
+
+The aurweb-git-serve and aurweb-git-update scripts are the aurweb.git.client
+shim, which only imports the programs when no daemon is running, so the
+programs are measured on their own as well.
+
+For every entry point, a fresh interpreter imports the module and looks up the
+function, which is what the generated console script does before running it.
+The output lists the median wall-clock time of this over several runs, the
+cumulative import time reported by `python -X importtime` and the time above
+the bare interpreter startup, which is what the budgets below apply to.
+
+Modules are imported with AUR_CONFIG pointing to a missing file, so that an
+entry point reading the configuration at import time fails loudly.
+
+The exit status is 1 if a script fails to import or exceeds its budget. Scripts
+whose third-party dependencies are not installed are skipped. Budgets are in
+milliseconds and may be scaled for slower machines with --scale.
+
+Usage: python test/bench/startup.py [-n RUNS] [-s SCALE] [-v] [SCRIPT...]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+TOPLEVEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+# Import cost above the bare interpreter, in milliseconds. Scripts run on
+# every SSH connection and push have the tightest budgets. Some modules need
+# an expensive import for any work at all: git-update needs pygit2 and
+# rendercomment needs bleach and markdown, which take about 170 ms and 200 ms
+# to import.
+BUDGETS = {
+    'aurweb-git-auth': 80,
+    'aurweb-git-serve': 50,
+    'aurweb-git-update': 50,
+    'aurweb.git.serve': 150,
+    'aurweb.git.update': 300,
+    'aurweb-git-daemon': 300,
+    'aurweb-aurblup': 150,
+    'aurweb-mkpkglists': 80,
+    'aurweb-notify': 120,
+    'aurweb-pkgmaint': 80,
+    'aurweb-popupdate': 80,
+    'aurweb-rendercomment': 300,
+    'aurweb-tuvotereminder': 80,
+    'aurweb-usermaint': 80,
+}
+
+# Programs run without a daemon, in addition to the entry points.
+PROGRAMS = [
+    ('aurweb.git.serve', 'aurweb.git.serve', 'main'),
+    ('aurweb.git.update', 'aurweb.git.update', 'main'),
+]
+
+_re_entry_point = re.compile(r"'([\w-]+)\s*=\s*([\w.]+):(\w+)'")
+_re_missing = re.compile(r"^ModuleNotFoundError: No module named '([\w.]+)'",
+                         re.MULTILINE)
+_re_importtime = re.compile(r'import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)')
+
+
+def entry_points():
+    with open(os.path.join(TOPLEVEL, 'setup.py')) as f:
+        return [m.groups() for m in _re_entry_point.finditer(f.read())]
+
+
+def run(code, importtime=False):
+    env = dict(os.environ)
+    env['AUR_CONFIG'] = os.path.join(TOPLEVEL, 'nonexistent', 'config')
+    env['PYTHONPATH'] = TOPLEVEL
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', code]
+
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    return proc.returncode, elapsed, proc.stderr
+
+
+def median_time(code, runs):
+    return statistics.median(run(code)[1] for _ in range(runs))
+
+
+def import_profile(code):
+    """
+    Return the total import time of the top-level imports and the modules
+    sorted by their cumulative import time, both in milliseconds.
+    """
+    _, _, stderr = run(code, importtime=True)
+    total = 0
+    modules = []
+    for m in _re_importtime.finditer(stderr):
+        cumulative = int(m.group(2)) / 1000
+        depth = len(m.group(3))
+        if depth == 1:
+            total += cumulative
+        modules.append((cumulative, depth, m.group(4)))
+    modules.sort(reverse=True)
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    parser.add_argument('-s', '--scale', type=float, default=1.0)
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='list the most expensive imports')
+    parser.add_argument('scripts', nargs='*')
+    args = parser.parse_args()
+
+    baseline = median_time('pass', args.runs)
+    print('interpreter startup: {:.1f} ms'.format(baseline))
+    print('{:<24} {:>9} {:>9} {:>9} {:>9}'.format(
+          'script', 'wall', 'imports', 'cost', 'budget'))
+
+    failed = False
+    for name, module, func in entry_points() + PROGRAMS:
+        if args.scripts and name not in args.scripts:
+            continue
+
+        code = 'import {0}; {0}.{1}'.format(module, func)
+        returncode, _, stderr = run(code)
+        missing = _re_missing.search(stderr)
+        if returncode != 0 and missing and \
+                not missing.group(1).startswith('aurweb'):
+            print('{:<24} skipped, {} is not installed'.format(
+                  name, missing.group(1)))
+            continue
+        if returncode != 0:
+            print('{:<24} failed to import:'.format(name))
+            sys.stdout.write(stderr)
+            failed = True
+            continue
+
+        wall = median_time(code, args.runs)
+        total, modules = import_profile(code)
+        cost = wall - baseline
+        budget = BUDGETS.get(name)
+        status = ''
+        if budget is not None and cost > budget * args.scale:
+            status = '  over budget'
+            failed = True
+        print('{:<24} {:>9.1f} {:>9.1f} {:>9.1f} {:>9}{}'.format(
+              name, wall, total, cost, budget or '-', status))
+
+        if args.verbose:
+            for cumulative, depth, module in modules[:10]:
+                print('    {:>9.1f} {}{}'.format(cumulative, ' ' * depth,
+                                                 module))
+
+    exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
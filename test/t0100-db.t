@@ -0,0 +1,429 @@
+#!/bin/sh
+
+test_description='database layer tests'
+
+. "$(dirname "$0")/setup.sh"
+
+test_expect_success 'Test shared connection reuse.' '
+	cat >expected <<-EOF &&
+	True
+	False
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.db
+	conn = aurweb.db.get_connection()
+	print(conn is aurweb.db.get_connection())
+	aurweb.db.close_connection()
+	print(conn is aurweb.db.get_connection())
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test connection pool checkout.' '
+	cat >expected <<-EOF &&
+	True
+	True
+	False
+	user
+	EOF
+	python >actual <<-EOD &&
+	import threading
+	import aurweb.db
+	pool = aurweb.db.ConnectionPool(size=1, timeout=1)
+	with pool.connection() as conn:
+	    with pool.connection() as nested:
+	        print(conn is nested)
+	with pool.connection() as again:
+	    print(conn is again)
+	    def checkout():
+	        try:
+	            pool.acquire()
+	            print(True)
+	        except TimeoutError:
+	            print(False)
+	    t = threading.Thread(target=checkout)
+	    t.start()
+	    t.join()
+	    cur = again.execute("SELECT Username FROM Users WHERE ID = 1")
+	    print(cur.fetchone()[0])
+	pool.close()
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test reconnect on a closed connection.' '
+	cat >expected <<-EOF &&
+	False
+	user
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.db
+	conn = aurweb.db.Connection()
+	conn.close()
+	print(conn.ping())
+	cur = conn.execute("SELECT Username FROM Users WHERE ID = 1")
+	print(cur.fetchone()[0])
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test statement fingerprints.' '
+	cat >expected <<-EOF &&
+	SELECT ID FROM Users WHERE Username = ? AND ID IN (...)
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.querylog
+	print(aurweb.querylog.fingerprint(
+	    "SELECT  ID FROM Users\n WHERE Username = \x27user\x27 AND ID IN (1, 2, 3)"))
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test statement logging and summary.' '
+	cp config config.orig &&
+	sed "s/^\[options\]$/&\nsql_debug = 1\nsql_log_file = queries.log/" \
+	config.orig >config &&
+	python <<-EOD &&
+	import aurweb.db
+	conn = aurweb.db.get_connection()
+	for uid in (1, 2, 3):
+	    conn.execute("SELECT Username FROM Users WHERE ID = ?", [uid])
+	conn.execute("SELECT COUNT(*) FROM Users")
+	EOD
+	mv config.orig config &&
+	cat >expected <<-EOF &&
+	SELECT Username FROM Users WHERE ID = ? 1
+	SELECT Username FROM Users WHERE ID = ? 1
+	SELECT Username FROM Users WHERE ID = ? 1
+	SELECT COUNT(*) FROM Users 1
+	summary SELECT Username FROM Users WHERE ID = ? 3
+	summary SELECT COUNT(*) FROM Users 1
+	EOF
+	python >actual <<-EOD &&
+	import json
+	for line in open("queries.log"):
+	    record = json.loads(line)
+	    if "summary" in record:
+	        for s in sorted(record["summary"], key=lambda s: -s["calls"]):
+	            print("summary", s["fingerprint"], s["calls"])
+	    else:
+	        print(record["fingerprint"], int(record["callsite"].startswith("<stdin>")))
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test chunked bulk inserts.' '
+	cat >expected <<-EOF &&
+	2000 rows, 7 statements
+	0 rows, 7 statements
+	1 rows, 7 statements
+	0 rows, 0 statements
+	2001 rows, 1 statements
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.db
+	import aurweb.querylog
+	statements = []
+	aurweb.querylog.add_listener(statements.append)
+	def report(count):
+	    print("{:d} rows, {:d} statements".format(count, len(statements)))
+	    statements.clear()
+	conn = aurweb.db.get_connection()
+	columns = ("Name", "Repo", "Provides")
+	rows = [("pkg{:d}".format(i), "extra", "pkg{:d}".format(i))
+	        for i in range(2000)]
+	report(conn.insert_many("OfficialProviders", columns, rows))
+	report(conn.insert_many("OfficialProviders", columns, rows, ignore=True))
+	rows.append(("new", "core", "new"))
+	report(conn.insert_many("OfficialProviders", columns, rows, ignore=True))
+	report(conn.insert_many("OfficialProviders", columns, []))
+	cur = conn.executemany("DELETE FROM OfficialProviders WHERE Name = ?",
+	                       [(row[0],) for row in rows])
+	report(cur.rowcount)
+	conn.commit()
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Only look up the packet size for large MySQL inserts.' '
+	cat >expected <<-EOF &&
+	1 chunks, 0 lookups
+	1 chunks, 0 lookups
+	6 chunks, 1 lookups
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.db
+	conn = aurweb.db.Connection()
+	conn._backend = "mysql"
+	lookups = []
+	def max_statement_size():
+	    lookups.append(1)
+	    return 1 << 20
+	conn._max_statement_size = max_statement_size
+	for rows in ([(1, "pkg")], [(i, "pkg") for i in range(30000)],
+	             [(i, "x" * 100) for i in range(20000)]):
+	    chunks = list(conn._chunks(rows, 50))
+	    assert sum(map(len, chunks)) == len(rows)
+	    print("{:d} chunks, {:d} lookups".format(len(chunks), len(lookups)))
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test streaming query results.' '
+	cat >expected <<-EOF &&
+	9
+	dev tu
+	user
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.db
+	conn = aurweb.db.get_connection()
+	query = "SELECT Username FROM Users ORDER BY Username"
+	print(len(list(conn.stream(query, batch_size=2))))
+	rows = conn.stream(query, batch_size=2)
+	print(next(rows)[0], next(rows)[0])
+	rows.close()
+	cur = conn.execute("SELECT Username FROM Users WHERE ID = 1")
+	print(cur.fetchone()[0])
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test statement cache counters.' '
+	cat >expected <<-EOF &&
+	hits=2 misses=2 size=2
+	hits=2 misses=3 size=2
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.db
+	conn = aurweb.db.Connection()
+	conn._statement_cache_size = 2
+	for uid in (1, 2, 3):
+	    conn.execute("SELECT Username FROM Users WHERE ID = ?", [uid])
+	conn.execute("SELECT COUNT(*) FROM Users")
+	info = conn.cache_info()
+	print("hits={hits:d} misses={misses:d} size={size:d}".format(**info))
+	conn.execute("SELECT 1")
+	info = conn.cache_info()
+	print("hits={hits:d} misses={misses:d} size={size:d}".format(**info))
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test prepared cursors of MySQL connections.' '
+	cat >expected <<-EOF &&
+	MySQLCursorBuffered
+	MySQLCursorPrepared
+	MySQLCursorPrepared
+	MySQLCursorBuffered
+	prepares=1 prepared_executions=2
+	EOF
+	python >actual <<-EOD &&
+	import mysql.connector.connection
+	import aurweb.db
+	conn = aurweb.db.Connection()
+	# A buffered connection like the one _connect() opens, which is never
+	# connected to a server.
+	mysql_conn = mysql.connector.connection.MySQLConnection()
+	mysql_conn._buffered = True
+	mysql_conn.is_connected = lambda: True
+	mysql_conn.handle_unread_result = lambda: None
+	conn._conn = mysql_conn
+	conn._use_prepared = True
+	query = "UPDATE Users SET Suspended = 0 WHERE ID = ?"
+	for i in range(3):
+	    print(type(conn._cursor("execute", query)[0]).__name__)
+	print(type(conn._cursor("execute", "SELECT 1")[0]).__name__)
+	info = conn.cache_info()
+	print("prepares={prepares:d} prepared_executions={prepared_executions:d}".format(**info))
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test transaction retries and commit callbacks.' '
+	cat >expected <<-EOF &&
+	attempt 1
+	attempt 2
+	committed
+	1
+	1
+	rolled back
+	1
+	EOF
+	python >actual <<-EOD &&
+	import sqlite3
+	import aurweb.db
+	import aurweb.querylog
+	attempts = 0
+	for attempt in aurweb.db.transaction(backoff=0):
+	    with attempt as conn:
+	        attempts += 1
+	        print("attempt", attempts)
+	        conn.execute("INSERT INTO Bans (IPAddress, BanTS) VALUES (?, 0)",
+	                     ["1.1.1.1"])
+	        conn.on_commit(lambda: print("committed"))
+	        for nested in aurweb.db.transaction():
+	            with nested:
+	                if attempts == 1:
+	                    raise sqlite3.OperationalError("database is locked")
+	cur = conn.execute("SELECT COUNT(*) FROM Bans WHERE IPAddress = ?",
+	                   ["1.1.1.1"])
+	print(cur.fetchone()[0])
+	print(sum(aurweb.querylog.retries().values()))
+	try:
+	    for attempt in aurweb.db.transaction():
+	        with attempt as conn:
+	            conn.execute("DELETE FROM Bans")
+	            conn.on_commit(lambda: print("committed"))
+	            raise ValueError
+	except ValueError:
+	    print("rolled back")
+	cur = conn.execute("SELECT COUNT(*) FROM Bans WHERE IPAddress = ?",
+	                   ["1.1.1.1"])
+	print(cur.fetchone()[0])
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test that commit callback errors do not retry.' '
+	cat >expected <<-EOF &&
+	attempt 1
+	OperationalError
+	1
+	EOF
+	python >actual <<-EOD &&
+	import sqlite3
+	import aurweb.db
+	def fail():
+	    raise sqlite3.OperationalError("database is locked")
+	attempts = 0
+	try:
+	    for attempt in aurweb.db.transaction(backoff=0):
+	        with attempt as conn:
+	            attempts += 1
+	            print("attempt", attempts)
+	            conn.execute("INSERT INTO Bans (IPAddress, BanTS) " +
+	                         "VALUES (?, 0)", ["3.3.3.3"])
+	            conn.on_commit(fail)
+	except sqlite3.OperationalError as e:
+	    print(type(e).__name__)
+	cur = conn.execute("SELECT COUNT(*) FROM Bans WHERE IPAddress = ?",
+	                   ["3.3.3.3"])
+	print(cur.fetchone()[0])
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test read-only routing to the replica.' '
+	cp config config.orig &&
+	cp aur.db replica.db &&
+	cat >>config <<-EOF &&
+
+	[database-replica]
+	name = replica.db
+	EOF
+	cat >expected <<-EOF &&
+	replica
+	primary
+	replica
+	primary
+	error
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.db
+	def which(conn):
+	    return "replica" if conn._section == "database-replica" else "primary"
+	print(which(aurweb.db.get_connection(readonly=True)))
+	conn = aurweb.db.get_connection()
+	conn.execute("DELETE FROM Bans")
+	conn.commit()
+	print(which(aurweb.db.get_connection(readonly=True, tables=("Bans",))))
+	print(which(aurweb.db.get_connection(readonly=True, tables=("Users",))))
+	print(which(aurweb.db.get_connection(readonly=True)))
+	try:
+	    replica = aurweb.db.get_connection(readonly=True, tables=("Users",))
+	    replica.execute("DELETE FROM Users")
+	except Exception:
+	    print("error")
+	EOD
+	mv config.orig config &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Test SQLite connection settings.' '
+	cat >expected <<-EOF &&
+	wal
+	1
+	5000
+	1.0
+	0.5
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.db
+	conn = aurweb.db.get_connection()
+	for pragma in ("journal_mode", "synchronous", "busy_timeout"):
+	    print(conn.execute("PRAGMA " + pragma).fetchone()[0])
+	print(conn.execute("SELECT POWER(2, 0)").fetchone()[0])
+	print(conn.execute("SELECT POWER(0.25, 0.5)").fetchone()[0])
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test asynchronous connection pool.' '
+	cat >expected <<-EOF &&
+	50
+	2
+	TimeoutError
+	1
+	1
+	EOF
+	python >actual <<-EOD &&
+	import asyncio
+	import sqlite3
+	import aurweb.asyncdb
+
+	async def lookup(pool, uid):
+	    async with pool.connection() as conn:
+	        cur = await conn.execute("SELECT Username FROM Users WHERE ID = ?",
+	                                 [uid])
+	        return cur.fetchone()
+
+	async def main(pool):
+	    rows = await asyncio.gather(*(lookup(pool, i % 3 + 1)
+	                                  for i in range(50)))
+	    print(sum(1 for row in rows if row))
+	    print(len(pool._idle))
+
+	    conns = [await pool.acquire(), await pool.acquire()]
+	    try:
+	        await pool.acquire()
+	    except TimeoutError:
+	        print("TimeoutError")
+	    conn = conns[0]
+
+	    attempts = 0
+	    async for attempt in aurweb.asyncdb.transaction(conn, backoff=0):
+	        async with attempt:
+	            attempts += 1
+	            await conn.execute("DELETE FROM Bans")
+	            await conn.execute("INSERT INTO Bans (IPAddress, BanTS) " +
+	                               "VALUES (?, 0)", ["2.2.2.2"])
+	            if attempts == 1:
+	                raise sqlite3.OperationalError("database is locked")
+	    cur = await conns[1].execute("SELECT COUNT(*) FROM Bans")
+	    print(cur.fetchone()[0])
+	    print(attempts - 1)
+	    for conn in conns:
+	        await pool.release(conn)
+	    await pool.close()
+
+	loop = asyncio.new_event_loop()
+	asyncio.set_event_loop(loop)
+	pool = aurweb.asyncdb.ConnectionPool(size=2, timeout=1)
+	loop.run_until_complete(main(pool))
+	loop.close()
+	EOD
+	test_cmp expected actual
+'
+
+test_done
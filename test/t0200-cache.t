@@ -0,0 +1,102 @@
+#!/bin/sh
+
+test_description='lookup cache tests'
+
+. "$(dirname "$0")/setup.sh"
+
+test_expect_success 'Test local lookup cache.' '
+	cat >expected <<-EOF &&
+	1 1
+	1 1
+	None 1
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.cache
+	calls = []
+	def lookup():
+	    calls.append(1)
+	    return 1
+	print(aurweb.cache.lookup("key", lookup), len(calls))
+	print(aurweb.cache.lookup("key", lookup), len(calls))
+	aurweb.cache.delete("key")
+	print(aurweb.cache.lookup("missing", lambda: None), len(calls))
+	EOD
+	test_cmp expected actual
+'
+
+test_expect_success 'Test memcached lookup cache.' '
+	cat >memcached.py <<-\EOD &&
+	import os
+	import socketserver
+	store = {}
+	class Handler(socketserver.StreamRequestHandler):
+	    def handle(self):
+	        for line in self.rfile:
+	            cmd = line.split()
+	            if cmd[0] == b"get":
+	                if cmd[1] in store:
+	                    value = store[cmd[1]]
+	                    self.wfile.write(b"VALUE %s 0 %d\r\n%s\r\n" %
+	                                     (cmd[1], len(value), value))
+	                self.wfile.write(b"END\r\n")
+	            elif cmd[0] == b"set":
+	                store[cmd[1]] = self.rfile.read(int(cmd[4]) + 2)[:-2]
+	                self.wfile.write(b"STORED\r\n")
+	            elif cmd[0] == b"delete":
+	                found = store.pop(cmd[1], None) is not None
+	                self.wfile.write(b"DELETED\r\n" if found
+	                                 else b"NOT_FOUND\r\n")
+	server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+	with open("memcached.pid", "w") as f:
+	    f.write(str(os.getpid()))
+	with open("memcached.port.tmp", "w") as f:
+	    f.write(str(server.server_address[1]))
+	os.rename("memcached.port.tmp", "memcached.port")
+	server.serve_forever()
+	EOD
+	python memcached.py >/dev/null 2>&1 &
+	while ! test -f memcached.port; do sleep 0.1; done &&
+	test_when_finished "kill $(cat memcached.pid)" &&
+	cp config config.orig &&
+	sed "s/^\[options\]$/&\ncache = memcache\nmemcache_servers = 127.0.0.1:$(cat memcached.port)/" \
+	config.orig >config &&
+	cat >expected <<-EOF &&
+	[1, 2]
+	[1, 2]
+	None
+	EOF
+	python <<-EOD &&
+	import aurweb.cache
+	aurweb.cache.set("shared key", [1, 2])
+	EOD
+	python >actual <<-EOD &&
+	import aurweb.cache
+	print(aurweb.cache.lookup("shared key", lambda: None))
+	aurweb.cache.clear()
+	print(aurweb.cache.get("shared key"))
+	aurweb.cache.delete("shared key")
+	print(aurweb.cache.get("shared key"))
+	EOD
+	mv config.orig config &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Test cached official provider lookups.' '
+	cat >expected <<-EOF &&
+	None
+	{'"'"'official'"'"': '"'"'core'"'"'}
+	{'"'"'official'"'"': '"'"'core'"'"'}
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.cache
+	import aurweb.db
+	import aurweb.git.update
+	conn = aurweb.db.get_connection(readonly=True)
+	print(aurweb.cache.get("official-providers"))
+	print(aurweb.git.update.get_providers(conn))
+	print(aurweb.cache.get("official-providers"))
+	EOD
+	test_cmp expected actual
+'
+
+test_done
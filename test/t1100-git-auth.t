@@ -25,4 +25,18 @@ test_expect_success 'Test authentication with a wrong key.' '
 	test_must_be_empty out
 '
 
+test_expect_success 'Test authentication with a malformed key.' '
+	test_must_fail "$GIT_AUTH" "$AUTH_KEYTYPE_USER" "not base64!" >out &&
+	test_must_be_empty out
+'
+
+test_expect_success 'Test that keys are looked up by their fingerprint.' '
+	echo "UPDATE SSHPubKeys SET Fingerprint = \"$AUTH_FINGERPRINT_MISSING\" WHERE UserID = 1;" | \
+	sqlite3 aur.db &&
+	test_must_fail "$GIT_AUTH" "$AUTH_KEYTYPE_USER" "$AUTH_KEYTEXT_USER" >out &&
+	echo "UPDATE SSHPubKeys SET Fingerprint = \"$AUTH_FINGERPRINT_USER\" WHERE UserID = 1;" | \
+	sqlite3 aur.db &&
+	test_must_be_empty out
+'
+
 test_done
@@ -56,6 +56,59 @@ test_expect_success 'Test IP address bans.' '
 	SSH_CLIENT="$SSH_CLIENT_ORIG"
 '
 
+test_expect_success 'Test IP address range bans.' '
+	cat <<-EOD | sqlite3 aur.db &&
+	INSERT INTO Bans (IPAddress, PrefixLength, BanTS) VALUES ('"'"'10.0.0.0'"'"', 8, 0);
+	INSERT INTO Bans (IPAddress, PrefixLength, BanTS) VALUES ('"'"'2001:db8::'"'"', 32, 0);
+	EOD
+	cat >expected <<-EOF &&
+	The SSH interface is disabled for your IP address.
+	EOF
+	for addr in 10.1.2.3 ::ffff:10.0.0.1 2001:db8:1::1; do
+		test_must_fail \
+		env SSH_CLIENT="$addr 1337 22" SSH_ORIGINAL_COMMAND=help \
+		"$GIT_SERVE" 2>actual &&
+		test_cmp expected actual || return 1
+	done &&
+	for addr in 11.0.0.1 1.3.3.8 2001:db9::1; do
+		env SSH_CLIENT="$addr 1337 22" SSH_ORIGINAL_COMMAND=help \
+		"$GIT_SERVE" 2>/dev/null || return 1
+	done &&
+	echo "DELETE FROM Bans WHERE PrefixLength IS NOT NULL;" | sqlite3 aur.db
+'
+
+test_expect_success 'Look up IP address bans through the indexes.' '
+	test_must_fail \
+	env SSH_CLIENT="::ffff:1.3.3.7 1337 22" SSH_ORIGINAL_COMMAND=help \
+	"$GIT_SERVE" 2>/dev/null &&
+	cat <<-EOD | sqlite3 aur.db >actual &&
+	EXPLAIN QUERY PLAN
+	SELECT 1, IPAddress, PrefixLength FROM Bans WHERE IPAddress IN ("1.3.3.7")
+	UNION ALL SELECT 0, IPAddress, PrefixLength FROM Bans WHERE PrefixLength >= 0;
+	EOD
+	! grep "SCAN" actual &&
+	grep "USING INDEX BansPrefixLength" actual
+'
+
+test_expect_success 'Answer repeated ban checks from the cache.' '
+	cat >expected <<-EOF &&
+	True 1
+	True 0
+	False 1
+	False 0
+	EOF
+	python >actual <<-EOD &&
+	import aurweb.bans
+	import aurweb.querylog
+	statements = []
+	aurweb.querylog.add_listener(statements.append)
+	for addr in ("1.3.3.7", "1.3.3.7", "1.3.3.8", "1.3.3.8"):
+	    print(aurweb.bans.is_banned(addr), len(statements))
+	    statements.clear()
+	EOD
+	test_cmp expected actual
+'
+
 test_expect_success 'Test setup-repo and list-repos.' '
 	SSH_ORIGINAL_COMMAND="setup-repo foobar" AUR_USER=user \
 	"$GIT_SERVE" 2>&1 &&
@@ -521,4 +574,86 @@ test_expect_success "Try to remove the vote again." '
 	test_cmp expected actual
 '
 
+test_expect_success "Run a batch of commands." '
+	cat >batch <<-EOF &&
+	vote foobar
+	vote foobar2
+
+	set-keywords foobar "multi word" other
+	EOF
+	SSH_ORIGINAL_COMMAND="batch" AUR_USER=user AUR_PRIVILEGED=0 \
+	"$GIT_SERVE" <batch >actual &&
+	cat >expected <<-EOF &&
+	ok
+	ok
+	ok
+	EOF
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	1
+	1
+	EOF
+	echo "SELECT NumVotes FROM PackageBases ORDER BY Name;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success "Roll back a batch when one of its commands fails." '
+	cat >batch <<-EOF &&
+	unvote foobar2
+	unvote foobar2
+	EOF
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="batch" AUR_USER=user AUR_PRIVILEGED=0 \
+	"$GIT_SERVE" <batch >actual &&
+	cat >expected <<-EOF &&
+	error: unvote: missing vote for package base: foobar2
+	EOF
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	1
+	1
+	EOF
+	echo "SELECT NumVotes FROM PackageBases ORDER BY Name;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success "Run a batch of commands in separate transactions." '
+	cat >batch <<-EOF &&
+	unvote foobar
+	unvote foobar
+	unvote foobar2
+	EOF
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="batch --per-command" \
+	AUR_USER=user AUR_PRIVILEGED=0 \
+	"$GIT_SERVE" <batch >actual &&
+	cat >expected <<-EOF &&
+	ok
+	error: unvote: missing vote for package base: foobar
+	ok
+	EOF
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	0
+	0
+	EOF
+	echo "SELECT NumVotes FROM PackageBases ORDER BY Name;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success "Reject batches with commands that cannot be batched." '
+	echo "git-upload-pack /foobar.git/" >batch &&
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="batch" AUR_USER=user AUR_PRIVILEGED=0 \
+	"$GIT_SERVE" <batch 2>actual &&
+	cat >expected <<-EOF &&
+	batch: git-upload-pack cannot be batched
+	Try \`ssh aur@aur.archlinux.org help\` for a list of commands.
+	EOF
+	test_cmp expected actual
+'
+
 test_done
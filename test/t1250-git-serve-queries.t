@@ -0,0 +1,168 @@
+#!/bin/sh
+
+test_description='git-serve query count tests'
+
+. "$(dirname "$0")/setup.sh"
+
+# Run a git-serve command as the given user and print the number of SQL
+# statements it issued.
+count_queries() {
+	rm -f queries.log &&
+	env SSH_ORIGINAL_COMMAND="$2" AUR_USER="$1" AUR_PRIVILEGED="${3:-0}" \
+	"$GIT_SERVE" >/dev/null 2>&1 &&
+	grep -c "\"statement\":" queries.log
+}
+
+test_expect_success 'Enable statement logging.' '
+	sed -e "s/^\[options\]$/&\nsql_debug = 1\nsql_log_file = queries.log/" \
+	    -e "s|^notify-cmd = .*|notify-cmd = /bin/true|" config >config.new &&
+	mv config.new config
+'
+
+test_expect_success 'Count queries of package base creation and listing.' '
+	cat >expected <<-EOF &&
+	3
+	5
+	6
+	3
+	EOF
+	{
+		count_queries user help &&
+		count_queries user "setup-repo foobar" &&
+		count_queries tu "setup-repo foobar2" &&
+		count_queries user list-repos
+	} >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Count queries of maintenance commands.' '
+	cat >expected <<-EOF &&
+	6
+	7
+	6
+	EOF
+	{
+		count_queries user "set-comaintainers foobar user2 user3" &&
+		count_queries tu "disown foobar2" 1 &&
+		count_queries user "adopt foobar2"
+	} >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Count queries and notifications of many co-maintainers.' '
+	for i in $(seq 10 29); do
+		echo "INSERT INTO Users (ID, UserName, Passwd, Email) VALUES ($i, \"cm$i\", \"!\", \"cm$i@localhost\");"
+	done | sqlite3 aur.db &&
+	users=$(for i in $(seq 10 29); do echo cm$i; done) &&
+	cat >notify.sh <<-\EOF &&
+	#!/bin/sh
+	echo "$@" >>notify.log
+	EOF
+	chmod +x notify.sh &&
+	sed "s|^notify-cmd = .*|notify-cmd = $(pwd)/notify.sh|" config >config.new &&
+	mv config.new config &&
+	cat >expected <<-EOF &&
+	7
+	EOF
+	count_queries user "set-comaintainers foobar $users" >actual &&
+	test_cmp expected actual &&
+	sleep 1 &&
+	cat >expected <<-EOF &&
+	comaintainer-add 10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29 1
+	comaintainer-remove 4,5 1
+	EOF
+	sort notify.log >actual &&
+	test_cmp expected actual &&
+	sed "s|^notify-cmd = .*|notify-cmd = /bin/true|" config >config.new &&
+	mv config.new config &&
+	SSH_ORIGINAL_COMMAND="set-comaintainers foobar user2 user3" \
+	AUR_USER=user "$GIT_SERVE"
+'
+
+test_expect_success 'Count queries of flags, votes and keywords.' '
+	cat >expected <<-EOF &&
+	5
+	4
+	5
+	5
+	5
+	EOF
+	{
+		count_queries user2 "flag foobar Because." &&
+		count_queries user2 "unflag foobar" &&
+		count_queries user "vote foobar" &&
+		count_queries user "unvote foobar" &&
+		count_queries user "set-keywords foobar one two"
+	} >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Only write the keywords which change.' '
+	cat >expected <<-EOF &&
+	4
+	6
+	EOF
+	{
+		count_queries user "set-keywords foobar two one two" &&
+		count_queries user "set-keywords foobar two three"
+	} >actual &&
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	three
+	two
+	EOF
+	echo "SELECT Keyword FROM PackageKeywords WHERE PackageBaseID = 1 ORDER BY Keyword;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Look up package bases by keyword through the index.' '
+	cat >expected <<-EOF &&
+	1 foobar
+	EOF
+	python -c "
+import aurweb.db, aurweb.keywords
+conn = aurweb.db.get_connection(readonly=True)
+for keyword in (\"one\", \"two\"):
+    for pkgbase_id, pkgbase in aurweb.keywords.pkgbases_with_keyword(conn, keyword):
+        print(pkgbase_id, pkgbase)
+" >actual &&
+	test_cmp expected actual &&
+	echo "EXPLAIN QUERY PLAN SELECT PackageBaseID FROM PackageKeywords WHERE Keyword = \"two\";" | \
+	sqlite3 aur.db >actual &&
+	grep "USING COVERING INDEX KeywordsKeywordPackageBaseID" actual
+'
+
+test_expect_success 'Count queries of Git commands.' '
+	cat >expected <<-EOF &&
+	2
+	3
+	4
+	5
+	EOF
+	{
+		count_queries user2 "git-upload-pack /foobar.git/" &&
+		count_queries user "git-receive-pack /foobar.git/" &&
+		count_queries user2 "git-receive-pack /foobar.git/" &&
+		count_queries user "restore foobar3"
+	} >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Count queries of repeated logins.' '
+	cat >expected <<-EOF &&
+	3
+	4
+	EOF
+	{
+		count_queries user list-repos &&
+		(
+			SSH_CLIENT="1.2.3.5 1337 22" &&
+			export SSH_CLIENT &&
+			count_queries user list-repos
+		)
+	} >actual &&
+	test_cmp expected actual
+'
+
+test_done
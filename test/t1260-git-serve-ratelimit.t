@@ -0,0 +1,73 @@
+#!/bin/sh
+
+test_description='git-serve rate limiting tests'
+
+. "$(dirname "$0")/setup.sh"
+
+test_expect_success 'Enable rate limiting.' '
+	mkdir ratelimit &&
+	cat >>config <<-EOF
+	[serve-ratelimit]
+	state-dir = $(pwd)/ratelimit
+	capacity = 3
+	refill-rate = 0.001
+	default-cost = 1
+	command-costs = flag:3 help:0
+	EOF
+'
+
+test_expect_success 'Test commands within the limit.' '
+	SSH_ORIGINAL_COMMAND="setup-repo foobar" AUR_USER=user \
+	"$GIT_SERVE" 2>&1 &&
+	SSH_ORIGINAL_COMMAND="list-repos" AUR_USER=user \
+	"$GIT_SERVE" 2>&1 &&
+	SSH_ORIGINAL_COMMAND="list-repos" AUR_USER=user \
+	"$GIT_SERVE" 2>&1 &&
+	SSH_ORIGINAL_COMMAND="help" AUR_USER=user \
+	"$GIT_SERVE" 2>&1
+'
+
+test_expect_success 'Test commands exceeding the limit.' '
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="list-repos" AUR_USER=user \
+	"$GIT_SERVE" 2>actual &&
+	grep -q "^list-repos: rate limit exceeded, try again in [0-9]* seconds$" actual
+'
+
+test_expect_success 'Test that addresses are limited across users.' '
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="list-repos" AUR_USER=user2 \
+	"$GIT_SERVE" 2>&1 &&
+	SSH_CLIENT="1.2.3.5 1234 22" SSH_ORIGINAL_COMMAND="list-repos" \
+	AUR_USER=user2 "$GIT_SERVE" 2>&1
+'
+
+test_expect_success 'Test commands which can never run.' '
+	cat >batch <<-EOF &&
+	flag foobar Because.
+	vote foobar
+	EOF
+	test_must_fail \
+	env SSH_CLIENT="1.2.3.6 1234 22" SSH_ORIGINAL_COMMAND="batch" \
+	AUR_USER=user3 "$GIT_SERVE" <batch 2>actual &&
+	cat >expected <<-EOF &&
+	batch: rate limit exceeded
+	EOF
+	test_cmp expected actual
+'
+
+test_expect_success 'Test that privileged users are not limited.' '
+	SSH_ORIGINAL_COMMAND="list-repos" AUR_USER=user AUR_PRIVILEGED=1 \
+	"$GIT_SERVE" 2>&1
+'
+
+test_expect_success 'Test removal of full buckets.' '
+	sed "s/^refill-rate = .*/refill-rate = 1000/" config >config.new &&
+	mv config.new config &&
+	test -n "$(ls ratelimit)" &&
+	sleep 1 &&
+	"$USERMAINT" &&
+	test -z "$(ls ratelimit)"
+'
+
+test_done
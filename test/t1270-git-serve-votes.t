@@ -0,0 +1,75 @@
+#!/bin/sh
+
+test_description='git-serve concurrent voting tests'
+
+. "$(dirname "$0")/setup.sh"
+
+# Print the vote count of a package base and the number of its votes.
+vote_counts() {
+	cat <<-EOD | sqlite3 aur.db
+	SELECT NumVotes FROM PackageBases WHERE Name = "$1";
+	SELECT COUNT(*) FROM PackageVotes INNER JOIN PackageBases
+	ON PackageBases.ID = PackageVotes.PackageBaseID WHERE Name = "$1";
+	EOD
+}
+
+test_expect_success 'Set up voters.' '
+	for i in $(seq 10 29); do
+		echo "INSERT INTO Users (ID, UserName, Passwd, Email) VALUES ($i, \"voter$i\", \"!\", \"voter$i@localhost\");"
+	done | sqlite3 aur.db &&
+	SSH_ORIGINAL_COMMAND="setup-repo foobar" AUR_USER=user \
+	"$GIT_SERVE" 2>&1
+'
+
+test_expect_success 'Vote and unvote concurrently.' '
+	for i in $(seq 10 29); do
+		(
+			for action in vote unvote vote; do
+				SSH_ORIGINAL_COMMAND="$action foobar" \
+				AUR_USER=voter$i "$GIT_SERVE" || exit 1
+			done
+		) >/dev/null 2>&1 &
+	done &&
+	wait &&
+	cat >expected <<-EOF &&
+	20
+	20
+	EOF
+	vote_counts foobar >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Count concurrent duplicate votes once.' '
+	for i in $(seq 1 10); do
+		SSH_ORIGINAL_COMMAND="vote foobar" AUR_USER=user2 \
+		"$GIT_SERVE" >/dev/null 2>>errors &
+	done &&
+	wait &&
+	cat >expected <<-EOF &&
+	21
+	21
+	EOF
+	vote_counts foobar >actual &&
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	9
+	EOF
+	grep -c "^vote: already voted for package base: foobar$" errors >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Count concurrent duplicate unvotes once.' '
+	for i in $(seq 1 10); do
+		SSH_ORIGINAL_COMMAND="unvote foobar" AUR_USER=user2 \
+		"$GIT_SERVE" >/dev/null 2>&1 &
+	done &&
+	wait &&
+	cat >expected <<-EOF &&
+	20
+	20
+	EOF
+	vote_counts foobar >actual &&
+	test_cmp expected actual
+'
+
+test_done
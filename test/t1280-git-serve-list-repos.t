@@ -0,0 +1,110 @@
+#!/bin/sh
+
+test_description='git-serve list-repos tests'
+
+. "$(dirname "$0")/setup.sh"
+
+list_repos() {
+	SSH_ORIGINAL_COMMAND="list-repos $2" AUR_USER="$1" AUR_PRIVILEGED=0 \
+	"$GIT_SERVE"
+}
+
+test_expect_success 'Set up package bases.' '
+	for pkgbase in foobar3 foobar foobar2; do
+		SSH_ORIGINAL_COMMAND="setup-repo $pkgbase" AUR_USER=user \
+		"$GIT_SERVE" 2>&1 || return 1
+	done &&
+	SSH_ORIGINAL_COMMAND="setup-repo comaint" AUR_USER=tu \
+	"$GIT_SERVE" 2>&1 &&
+	SSH_ORIGINAL_COMMAND="set-comaintainers comaint user" AUR_USER=tu \
+	"$GIT_SERVE" 2>&1 &&
+	cat <<-EOF | sqlite3 aur.db
+	UPDATE PackageBases SET ModifiedTS = 300 WHERE Name = "foobar";
+	UPDATE PackageBases SET ModifiedTS = 100 WHERE Name = "foobar2";
+	UPDATE PackageBases SET ModifiedTS = 200 WHERE Name IN ("foobar3", "comaint");
+	UPDATE PackageBases SET PackagerUID = 1 WHERE Name = "foobar2";
+	EOF
+'
+
+test_expect_success 'List package bases by name.' '
+	cat >expected <<-EOF &&
+	*foobar
+	 foobar2
+	*foobar3
+	EOF
+	list_repos user >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'List package bases in pages.' '
+	cat >expected <<-EOF &&
+	*foobar
+	 foobar2
+	*foobar3
+	EOF
+	{
+		list_repos user "--limit=2" &&
+		list_repos user "--limit=2 --after=foobar2"
+	} >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'List package bases as JSON.' '
+	cat >expected <<-EOF &&
+	{"repos": [{"name": "foobar", "packaged": false, "modified": 300}, {"name": "foobar2", "packaged": true, "modified": 100}], "next": "foobar2"}
+	{"repos": [{"name": "foobar3", "packaged": false, "modified": 200}], "next": null}
+	EOF
+	{
+		list_repos user "--format=json --limit=2" &&
+		list_repos user "--format=json --limit=2 --after=foobar2"
+	} >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'List package bases by modification time.' '
+	cat >expected <<-EOF &&
+	{"repos": [{"name": "foobar2", "packaged": true, "modified": 100}, {"name": "comaint", "packaged": false, "modified": 200}], "next": "200:comaint"}
+	{"repos": [{"name": "foobar3", "packaged": false, "modified": 200}, {"name": "foobar", "packaged": false, "modified": 300}], "next": "300:foobar"}
+	{"repos": [], "next": null}
+	EOF
+	{
+		list_repos user "--comaintained --sort=modified --format=json --limit=2" &&
+		list_repos user "--comaintained --sort=modified --format=json --limit=2 --after=200:comaint" &&
+		list_repos user "--comaintained --sort=modified --format=json --limit=2 --after=300:foobar"
+	} >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'List co-maintained package bases.' '
+	cat >expected <<-EOF &&
+	*comaint
+	*foobar
+	 foobar2
+	*foobar3
+	EOF
+	list_repos user --comaintained >actual &&
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	*comaint
+	EOF
+	list_repos tu --comaintained >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Reject invalid options.' '
+	for options in --limit=0 --sort=size --after --json "--sort=modified --after=foobar"; do
+		test_must_fail list_repos user "$options" 2>actual &&
+		grep -q "^list-repos: invalid" actual || return 1
+	done
+'
+
+test_expect_success 'Read pages from the maintainer indexes.' '
+	cat <<-EOF | sqlite3 aur.db >actual &&
+	EXPLAIN QUERY PLAN SELECT Name, PackagerUID, ModifiedTS FROM PackageBases WHERE MaintainerUID = 1 AND Name > "foobar" ORDER BY Name LIMIT 2;
+	EXPLAIN QUERY PLAN SELECT Name, PackagerUID, ModifiedTS FROM PackageBases WHERE MaintainerUID = 1 AND ModifiedTS >= 200 AND (ModifiedTS > 200 OR Name > "foobar") ORDER BY ModifiedTS, Name LIMIT 2;
+	EOF
+	grep -q "USING INDEX BasesMaintainerUIDName" actual &&
+	grep -q "USING INDEX BasesMaintainerUIDModifiedTS" actual
+'
+
+test_done
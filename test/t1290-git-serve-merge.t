@@ -0,0 +1,137 @@
+#!/bin/sh
+
+test_description='git-serve merge tests'
+
+. "$(dirname "$0")/setup.sh"
+
+test_expect_success 'Set up package bases.' '
+	SSH_ORIGINAL_COMMAND="setup-repo foobar" AUR_USER=user \
+	"$GIT_SERVE" 2>&1 &&
+	SSH_ORIGINAL_COMMAND="setup-repo foobar2" AUR_USER=tu \
+	"$GIT_SERVE" 2>&1 &&
+	SSH_ORIGINAL_COMMAND="set-comaintainers foobar user3 tu" AUR_USER=user \
+	"$GIT_SERVE" 2>&1 &&
+	SSH_ORIGINAL_COMMAND="set-comaintainers foobar2 user4" AUR_USER=tu \
+	"$GIT_SERVE" 2>&1 &&
+	for vote in user2:foobar user2:foobar2 user3:foobar user4:foobar2; do
+		SSH_ORIGINAL_COMMAND="vote ${vote#*:}" AUR_USER=${vote%:*} \
+		"$GIT_SERVE" 2>&1 || return 1
+	done &&
+	cat <<-EOD | sqlite3 aur.db
+	INSERT INTO PackageNotifications (UserID, PackageBaseID) VALUES (4, 1);
+	INSERT INTO PackageNotifications (UserID, PackageBaseID) VALUES (2, 1);
+	INSERT INTO PackageComments (PackageBaseID, UsersID, Comments, RenderedComment) VALUES (1, 4, "First.", "");
+	INSERT INTO PackageComments (PackageBaseID, UsersID, Comments, RenderedComment) VALUES (1, 5, "Second.", "");
+	INSERT INTO PackageComments (PackageBaseID, UsersID, Comments, RenderedComment) VALUES (2, 6, "Third.", "");
+	INSERT INTO PackageRequests (ID, ReqTypeID, PackageBaseID, PackageBaseName, UsersID, Comments, ClosureComment) VALUES (1, 1, 1, "foobar", 4, "", "");
+	INSERT INTO PackageRequests (ID, ReqTypeID, PackageBaseID, PackageBaseName, MergeBaseName, UsersID, Comments, ClosureComment) VALUES (2, 3, 1, "foobar", "foobar2", 5, "", "");
+	INSERT INTO PackageRequests (ID, ReqTypeID, PackageBaseID, PackageBaseName, MergeBaseName, UsersID, Comments, ClosureComment) VALUES (3, 3, 1, "foobar", "foobar3", 5, "", "");
+	INSERT INTO PackageRequests (ID, ReqTypeID, PackageBaseID, PackageBaseName, UsersID, Comments, ClosureComment) VALUES (4, 1, 2, "foobar2", 6, "", "");
+	EOD
+'
+
+test_expect_success 'Try to merge a package base as a regular user.' '
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="merge foobar foobar2" AUR_USER=user \
+	AUR_PRIVILEGED=0 "$GIT_SERVE" 2>&1
+'
+
+test_expect_success 'Try to merge a package base into itself.' '
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="merge foobar foobar" AUR_USER=tu \
+	AUR_PRIVILEGED=1 "$GIT_SERVE" 2>actual &&
+	grep -q "^merge: cannot merge a package base into itself$" actual
+'
+
+test_expect_success 'Try to merge into a missing package base.' '
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="merge foobar foobar3" AUR_USER=tu \
+	AUR_PRIVILEGED=1 "$GIT_SERVE" 2>&1
+'
+
+test_expect_success 'Merge a package base.' '
+	>sendmail.out &&
+	SSH_ORIGINAL_COMMAND="merge foobar foobar2" AUR_USER=tu \
+	AUR_PRIVILEGED=1 "$GIT_SERVE" 2>&1 &&
+	cat >expected <<-EOF &&
+	2|foobar2|3
+	EOF
+	echo "SELECT ID, Name, NumVotes FROM PackageBases;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	2|4
+	2|5
+	2|6
+	EOF
+	echo "SELECT PackageBaseID, UsersID FROM PackageVotes ORDER BY UsersID;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	2|1
+	2|2
+	2|4
+	EOF
+	echo "SELECT PackageBaseID, UserID FROM PackageNotifications ORDER BY UserID;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	2|First.
+	2|Second.
+	2|Third.
+	EOF
+	echo "SELECT PackageBaseID, Comments FROM PackageComments ORDER BY ID;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	6|1
+	5|2
+	EOF
+	echo "SELECT UsersID, Priority FROM PackageComaintainers ORDER BY Priority;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Check whether package requests are closed when merging.' '
+	cat >expected <<-EOF &&
+	1||2|2|The user tu merged the package into foobar2.
+	2||2|2|The user tu merged the package into foobar2.
+	3||0||
+	4|2|0||
+	EOF
+	echo "SELECT ID, PackageBaseID, Status, ClosedUID, ClosureComment FROM PackageRequests ORDER BY ID;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	Subject: AUR Co-Maintainer Notification for foobar2
+	Subject: AUR Package deleted: foobar
+	Subject: AUR Package deleted: foobar
+	Subject: [PRQ#1] Deletion Request for foobar Accepted
+	Subject: [PRQ#2] Merge Request for foobar Accepted
+	EOF
+	grep "^Subject:" sendmail.out | sort >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Roll back a merge along with the deletion.' '
+	SSH_ORIGINAL_COMMAND="setup-repo foobar3" AUR_USER=tu \
+	"$GIT_SERVE" 2>&1 &&
+	>sendmail.out &&
+	cat >batch <<-EOF &&
+	merge foobar3 foobar2
+	unvote foobar2
+	EOF
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="batch" AUR_USER=tu AUR_PRIVILEGED=1 \
+	"$GIT_SERVE" <batch >/dev/null &&
+	cat >expected <<-EOF &&
+	foobar2
+	foobar3
+	EOF
+	echo "SELECT Name FROM PackageBases ORDER BY Name;" | \
+	sqlite3 aur.db >actual &&
+	test_cmp expected actual &&
+	test_must_be_empty sendmail.out
+'
+
+test_done
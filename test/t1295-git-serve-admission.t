@@ -0,0 +1,128 @@
+#!/bin/sh
+
+test_description='git-serve admission control tests'
+
+. "$(dirname "$0")/setup.sh"
+
+# Print the path of the first slot of a key.
+slot() {
+	python -c "import hashlib, sys; print(hashlib.sha1(sys.argv[1].encode()).hexdigest())" "$1" |
+	sed "s|^|$(pwd)/admission/|; s|$|.0|"
+}
+
+# Hold a slot from the background for the given number of seconds.
+hold_slot() {
+	flock -o "$1" sleep "$2" >/dev/null 2>&1 &
+	echo $! >hold.pid &&
+	while flock -n "$1" true; do sleep 0.1; done
+}
+
+release_slot() {
+	kill $(cat hold.pid) &&
+	while ! flock -n "$1" true; do sleep 0.1; done
+}
+
+test_expect_success 'Enable admission control.' '
+	mkdir admission &&
+	cat >>config <<-EOF &&
+	[serve-admission]
+	state-dir = $(pwd)/admission
+	receive-pack-slots = 2
+	receive-pack-pkgbase-slots = 1
+	upload-pack-addr-slots = 1
+	queue-size = 1
+	queue-timeout = 1
+	EOF
+	SSH_ORIGINAL_COMMAND="setup-repo foobar" AUR_USER=user \
+	"$GIT_SERVE" 2>&1 &&
+	cat >git-shell.sh <<-EOF &&
+	#!/bin/sh
+	echo \$AUR_PKGBASE
+	flock -n "$(slot receive-pack:foobar)" true || echo held
+	EOF
+	chmod +x git-shell.sh
+'
+
+test_expect_success 'Hold the slot of a push while it runs.' '
+	cat >expected <<-EOF &&
+	foobar
+	held
+	EOF
+	SSH_ORIGINAL_COMMAND="git-receive-pack /foobar.git/" AUR_USER=user \
+	"$GIT_SERVE" >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Turn away a push while the package base is busy.' '
+	slot=$(slot receive-pack:foobar) &&
+	hold_slot "$slot" 10 &&
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="git-receive-pack /foobar.git/" AUR_USER=user \
+	"$GIT_SERVE" >/dev/null 2>actual &&
+	release_slot "$slot" &&
+	cat >expected <<-EOF &&
+	git-receive-pack: server busy, please retry in a few minutes
+	EOF
+	test_cmp expected actual
+'
+
+test_expect_success 'Admit a waiting push once a slot is free.' '
+	cat >expected <<-EOF &&
+	foobar
+	held
+	EOF
+	slot=$(slot receive-pack:foobar) &&
+	hold_slot "$slot" 0.5 &&
+	SSH_ORIGINAL_COMMAND="git-receive-pack /foobar.git/" AUR_USER=user \
+	"$GIT_SERVE" >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Turn away commands at once when the queue is full.' '
+	slot=$(slot queue) &&
+	hold_slot "$slot" 10 &&
+	hold=$(cat hold.pid) &&
+	hold_slot "$(slot receive-pack:foobar)" 10 &&
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="git-receive-pack /foobar.git/" AUR_USER=user \
+	"$GIT_SERVE" >/dev/null 2>actual &&
+	release_slot "$(slot receive-pack:foobar)" &&
+	echo $hold >hold.pid &&
+	release_slot "$slot" &&
+	grep -q "server busy" actual
+'
+
+test_expect_success 'Limit concurrent clones per address.' '
+	slot=$(slot upload-pack:1.2.3.4) &&
+	hold_slot "$slot" 10 &&
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="git-upload-pack /foobar.git/" AUR_USER=user \
+	"$GIT_SERVE" >/dev/null 2>actual &&
+	grep -q "^git-upload-pack: server busy" actual &&
+	SSH_CLIENT="1.2.3.5 1337 22" SSH_ORIGINAL_COMMAND="git-upload-pack /foobar.git/" \
+	AUR_USER=user "$GIT_SERVE" >/dev/null &&
+	release_slot "$slot"
+'
+
+test_expect_success 'Hand the slots of a push to the daemon client.' '
+	cat >>config <<-EOF &&
+
+	[daemon]
+	socket = $(pwd)/daemon.sock
+	workers = 1
+	EOF
+	python -c "import os; open(\"daemon.pid\", \"w\").write(str(os.getpid())); \
+	import aurweb.git.daemon; aurweb.git.daemon.main()" >daemon.log 2>&1 &
+	while ! test -S daemon.sock; do sleep 0.1; done &&
+	cat >expected <<-EOF &&
+	foobar
+	held
+	EOF
+	SSH_ORIGINAL_COMMAND="git-receive-pack /foobar.git/" AUR_USER=user \
+	"$GIT_CLIENT" serve >actual &&
+	kill $(cat daemon.pid) &&
+	test_cmp expected actual &&
+	flock -n "$(slot receive-pack:foobar)" true
+'
+
+test_done
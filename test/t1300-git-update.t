@@ -495,4 +495,71 @@ test_expect_success 'Trying to hijack a package.' '
 	test_cmp expected actual
 '
 
+test_expect_success 'Test update hook on a split package.' '
+	old=0000000000000000000000000000000000000000 &&
+	test_when_finished "git -C aur.git checkout -q refs/namespaces/foobar/refs/heads/master" &&
+	(
+		cd aur.git &&
+		git checkout -q --orphan refs/namespaces/foosplit/refs/heads/master &&
+		git rm -q --cached PKGBUILD .SRCINFO &&
+		echo "pkgname=(foosplit-a foosplit-b)" >PKGBUILD &&
+		cat >.SRCINFO <<-EOD &&
+		pkgbase = foosplit
+			pkgver = 1
+			pkgrel = 1
+			arch = any
+			license = MIT
+			license = Apache
+			groups = foogroup
+			depends = python
+			makedepends = make
+
+		pkgname = foosplit-a
+			groups = foogroup
+			groups = foogroup2
+			provides = foo=1
+			conflicts = foo
+
+		pkgname = foosplit-b
+			license = Apache
+			depends = foosplit-a>=1
+			optdepends = bar: for baz
+		EOD
+		git add PKGBUILD .SRCINFO &&
+		git commit -q -m "Initial import"
+	) &&
+	new=$(git -C aur.git rev-parse HEAD) &&
+	sed "s/^\[options\]$/&\nsql_debug = 1\nsql_log_file = queries.log/" \
+	config >config.debug &&
+	AUR_CONFIG=config.debug AUR_USER=user AUR_PKGBASE=foosplit \
+	AUR_PRIVILEGED=0 "$GIT_UPDATE" refs/heads/master "$old" "$new" 2>&1 &&
+	cat >expected <<-EOF &&
+	foosplit-a|Apache
+	foosplit-a|MIT
+	foosplit-b|Apache
+	foosplit-a|foogroup
+	foosplit-a|foogroup2
+	foosplit-b|foogroup
+	foosplit-a|1|python||
+	foosplit-a|2|make||
+	foosplit-b|1|foosplit-a||>=1
+	foosplit-b|2|make||
+	foosplit-b|4|bar|for baz|
+	foosplit-a|1|foo|
+	foosplit-a|2|foo|=1
+	EOF
+	cat <<-EOD | sqlite3 aur.db >actual &&
+	SELECT Packages.Name, Licenses.Name FROM PackageLicenses INNER JOIN Packages ON Packages.ID = PackageID INNER JOIN Licenses ON Licenses.ID = LicenseID WHERE Packages.Name LIKE "foosplit%" ORDER BY 1, 2;
+	SELECT Packages.Name, Groups.Name FROM PackageGroups INNER JOIN Packages ON Packages.ID = PackageID INNER JOIN Groups ON Groups.ID = GroupID WHERE Packages.Name LIKE "foosplit%" ORDER BY 1, 2;
+	SELECT Packages.Name, DepTypeID, DepName, DepDesc, DepCondition FROM PackageDepends INNER JOIN Packages ON Packages.ID = PackageID WHERE Packages.Name LIKE "foosplit%" ORDER BY 1, 2, 3;
+	SELECT Packages.Name, RelTypeID, RelName, RelCondition FROM PackageRelations INNER JOIN Packages ON Packages.ID = PackageID WHERE Packages.Name LIKE "foosplit%" ORDER BY 1, 2, 3;
+	EOD
+	test_cmp expected actual &&
+	cat >expected <<-EOF &&
+	9
+	EOF
+	grep -c "\"statement\": \"INSERT" queries.log >actual &&
+	test_cmp expected actual
+'
+
 test_done
@@ -0,0 +1,71 @@
+#!/bin/sh
+
+test_description='git daemon tests'
+
+. "$(dirname "$0")/setup.sh"
+
+test_expect_success 'Start the daemon.' '
+	cat >>config <<-EOF &&
+
+	[daemon]
+	socket = $(pwd)/daemon.sock
+	workers = 2
+	EOF
+	python -c "import os; open(\"daemon.pid\", \"w\").write(str(os.getpid())); \
+	import aurweb.git.daemon; aurweb.git.daemon.main()" >daemon.log 2>&1 &
+	while ! test -S daemon.sock; do sleep 0.1; done
+'
+
+test_expect_success 'Test commands served by the daemon.' '
+	SSH_ORIGINAL_COMMAND="setup-repo foobar" AUR_USER=user \
+	"$GIT_CLIENT" serve 2>&1 &&
+	cat >expected <<-EOF &&
+	*foobar
+	EOF
+	SSH_ORIGINAL_COMMAND="list-repos" AUR_USER=user \
+	"$GIT_CLIENT" serve >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Test that the daemon uses its own configuration.' '
+	sed "s/^\(enable-maintenance = \)0$/\\11/" config >config.maint &&
+	SSH_ORIGINAL_COMMAND="list-repos" AUR_USER=user AUR_CONFIG=config.maint \
+	"$GIT_CLIENT" serve >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Test exit status and error messages.' '
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="setup-repo foobar" AUR_USER=user \
+	"$GIT_CLIENT" serve 2>actual &&
+	cat >expected <<-EOF &&
+	warning: setup-repo is deprecated. Use \`git push\` to create new repositories.
+	setup-repo: package base already exists: foobar
+	EOF
+	test_cmp expected actual
+'
+
+test_expect_success 'Test commands handed back to the client.' '
+	cat >expected <<-EOF &&
+	user
+	foobar
+	foobar
+	EOF
+	SSH_ORIGINAL_COMMAND="git-upload-pack /foobar.git/" AUR_USER=user \
+	"$GIT_CLIENT" serve >actual &&
+	test_cmp expected actual
+'
+
+test_expect_success 'Test that the client runs commands without the daemon.' '
+	kill $(cat daemon.pid) &&
+	while test -S daemon.sock; do sleep 0.1; done &&
+	test_must_fail \
+	env SSH_ORIGINAL_COMMAND="list-repos" AUR_USER=user \
+	AUR_CONFIG=config.maint "$GIT_CLIENT" serve 2>actual &&
+	cat >expected <<-EOF &&
+	The AUR is down due to maintenance. We will be back soon.
+	EOF
+	test_cmp expected actual
+'
+
+test_done
@@ -214,6 +214,17 @@ test_expect_success 'Test subject and body of co-maintainer addition notificatio
 	test_cmp actual expected
 '
 
+test_expect_success 'Test co-maintainer notifications to several users.' '
+	>sendmail.out &&
+	"$NOTIFY" comaintainer-add 2,1 1001 &&
+	grep ^To: sendmail.out >actual &&
+	cat <<-EOD >expected &&
+	To: user@localhost
+	To: tu@localhost
+	EOD
+	test_cmp actual expected
+'
+
 test_expect_success 'Test subject and body of co-maintainer removal notifications.' '
 	>sendmail.out &&
 	"$NOTIFY" comaintainer-remove 1 1001 &&
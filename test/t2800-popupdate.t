@@ -0,0 +1,25 @@
+#!/bin/sh
+
+test_description='popupdate tests'
+
+. "$(dirname "$0")/setup.sh"
+
+test_expect_success 'Test popularity update script.' '
+	now=$(date -d now +%s) &&
+	weekago=$(date -d "7 days ago" +%s) &&
+	cat <<-EOD | sqlite3 aur.db &&
+	INSERT INTO PackageBases (ID, Name, PackagerUID, SubmittedTS, ModifiedTS, FlaggerComment) VALUES (1, "foobar", 1, 0, 0, "");
+	INSERT INTO PackageBases (ID, Name, PackagerUID, SubmittedTS, ModifiedTS, FlaggerComment) VALUES (2, "foobar2", 2, 0, 0, "");
+	INSERT INTO PackageVotes (UsersID, PackageBaseID, VoteTS) VALUES (1, 1, $now);
+	INSERT INTO PackageVotes (UsersID, PackageBaseID, VoteTS) VALUES (2, 1, $weekago);
+	EOD
+	"$POPUPDATE" &&
+	cat <<-EOD >expected &&
+	foobar|2|1.868
+	foobar2|0|0.0
+	EOD
+	echo "SELECT Name, NumVotes, ROUND(Popularity, 3) FROM PackageBases ORDER BY Name;" | sqlite3 aur.db >actual &&
+	test_cmp expected actual
+'
+
+test_done